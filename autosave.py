@@ -0,0 +1,71 @@
+"""
+Unsaved-change detection and autosave.
+
+About once a second the map's digest (see map_hash) is compared with the digest of
+the file it was last saved to or loaded from. This only rehashes chunks edited since
+the last check, so it is cheap however large the map is. The window title shows
+a '*' while the map has unsaved changes.
+
+Autosave is off unless CRAWLTOGRAPHER_AUTOSAVE_SECONDS is set. With it set, a map that
+changed since it was last saved or autosaved is written every AUTOSAVE_SECONDS to
+<map>.autosave.jsonl next to the map file (./autosave.jsonl for a map never saved).
+The lines of floors that did not change since the last autosave are copied from the
+previous autosave file, so the cost depends on what was edited, not on the size of
+the map.
+"""
+import os
+import time
+
+import pygame
+
+from map_hash import map_digest, save_map_indexed
+
+AUTOSAVE_SECONDS = float(os.environ.get("CRAWLTOGRAPHER_AUTOSAVE_SECONDS") or 0)
+CHANGE_CHECK_SECONDS = 1.0
+WINDOW_TITLE = "Dungeon Crawltographer"
+
+def autosave_path(map_path: str = None) -> str:
+    if map_path:
+        return os.path.splitext(map_path)[0] + ".autosave.jsonl"
+    return os.path.join(os.getcwd(), "autosave.jsonl")
+
+class Autosaver:
+    def __init__(self, app, interval: float = AUTOSAVE_SECONDS):
+        self.app = app
+        self.interval = interval
+        now = time.monotonic()
+        self.next_check = now + CHANGE_CHECK_SECONDS
+        self.next_save = now + interval
+        self.digest = None  # Map digest at the last autosave
+        self.index = None  # map_hash.MapIndex of the last autosave file
+        self.unsaved = False
+
+    def tick(self):
+        """Called from the main loop; does nothing until a check or an autosave is due."""
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + CHANGE_CHECK_SECONDS
+        app = self.app
+        digest = map_digest(app.floors)
+        self.set_unsaved(digest != app.saved_digest)
+
+        if self.interval <= 0 or now < self.next_save:
+            return
+        self.next_save = now + self.interval
+        if not self.unsaved or digest == self.digest:
+            return
+        path = autosave_path(app.current_filepath)
+        header = {"current_floor": app.current_floor, "current_pos": app.current_pos, "rotation": app.rotation}
+        try:
+            self.index = save_map_indexed(path, app.floors, header, self.index)
+        except OSError as e:
+            print(f"Error autosaving to {path}: {e}")
+            return
+        self.digest = digest
+        print(f"Autosaved to {path}")
+
+    def set_unsaved(self, unsaved: bool):
+        if unsaved != self.unsaved:
+            self.unsaved = unsaved
+            pygame.display.set_caption(WINDOW_TITLE + (" *" if unsaved else ""))
@@ -0,0 +1,267 @@
+"""
+Micro-benchmarks for the mapper's hot paths, run on a deterministic synthetic map
+(see synthetic_map.py) under SDL's dummy video driver.
+
+    python benchmark.py -o baseline.json                        # record a baseline
+    python benchmark.py --compare baseline.json                 # fails on regressions
+    python benchmark.py --cells 100000 --only draw_grid,save_map
+
+Each benchmark runs --repeat times and reports the median and minimum in ms. With
+--compare, a benchmark whose median is more than --threshold (default 25%) slower
+than the baseline (and by more than NOISE_FLOOR_MS) is reported as a regression and
+the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import config
+import synthetic_map
+from data_models import IconType
+from floor_store import FloorStore
+
+BENCHMARKS = {}
+NOISE_FLOOR_MS = 0.1  # Differences smaller than this are never reported as regressions
+
+def benchmark(name: str):
+    """Registers a benchmark. The function gets the mapper and returns a callable to time."""
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+def _box(mapper, width: int, height: int):
+    """A width x height block of positions centered on the mapper's current position."""
+    cx, cy = mapper.current_pos
+    return {(x, y) for x in range(cx - width // 2, cx - width // 2 + width)
+            for y in range(cy - height // 2, cy - height // 2 + height)}
+
+@benchmark("draw_grid")
+def bench_draw_grid(mapper):
+    return mapper.renderer.draw_grid
+
+@benchmark("draw_edges_walled")
+def bench_draw_edges(mapper):
+    """Every cell of the floor walled on all four sides, drawn from the edge chunk cache."""
+    floor = mapper.get_floor()
+    floor.edges.set_masks((pos, 0b01010101) for pos in floor)
+    return mapper.renderer.draw_edges
+
+@benchmark("draw_labels_dense")
+def bench_draw_labels(mapper):
+    """On-map labels with every cell labeled, zoomed out so thousands are on screen."""
+    floor = mapper.get_floor()
+    floor.set_states((pos, (cell.explored, cell.icon, f"room {i % 997}", cell.locked))
+                     for i, (pos, cell) in enumerate(list(floor.items())))
+    mapper.zoom = config.LABEL_MIN_ZOOM
+    mapper.renderer.labels.enabled = True
+    return mapper.renderer.draw_labels
+
+@benchmark("screen_to_grid_10k")
+def bench_screen_to_grid(mapper):
+    points = [(x, y) for x in range(0, 1000, 10) for y in range(100, 800, 7)][:10000]
+    def run():
+        for point in points:
+            mapper.screen_to_grid(*point)
+    return run
+
+@benchmark("grid_to_screen_10k")
+def bench_grid_to_screen(mapper):
+    cells = list(_box(mapper, 100, 100))
+    def run():
+        for cell in cells:
+            mapper.grid_to_screen(*cell)
+    return run
+
+@benchmark("save_map")
+def bench_save_map(mapper):
+    path = os.path.join(tempfile.mkdtemp(), "bench.json")
+    def run():
+        mapper.save_map(path)
+    return run
+
+@benchmark("load_map")
+def bench_load_map(mapper):
+    path = os.path.join(tempfile.mkdtemp(), "bench.json")
+    mapper.save_map(path)
+    def run():
+        mapper.load_map(path)
+    return run
+
+@benchmark("undo_redo_40k")
+def bench_undo_redo(mapper):
+    mapper.region_editor.fill(_box(mapper, 200, 200), IconType.CHEST)
+    def run():
+        mapper.undo()
+        mapper.redo()
+    return run
+
+@benchmark("box_select")
+def bench_box_select(mapper):
+    """A shift-drag across the whole view, through the event handler."""
+    mapper.zoom = 0.3
+    top = 200 # Below the menu bar and icon panel
+    bottom = mapper.window_height - 10
+    right = mapper.window_width - 10
+    def run():
+        pygame.key.set_mods(pygame.KMOD_SHIFT)
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(10, top)))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=(right, bottom)))
+        mapper.event_handler.handle_events()
+        pygame.key.set_mods(0)
+    return run
+
+@benchmark("move_selection_10k")
+def bench_move_selection(mapper):
+    mapper.selected_cells = _box(mapper, 100, 100)
+    step = [1]
+    def run():
+        # Alternate directions so the selection stays over the same area
+        start = next(iter(mapper.selected_cells))
+        mapper.move_start_grid_pos = start
+        mapper.move_selection((start[0] + step[0], start[1]))
+        step[0] = -step[0]
+    return run
+
+@benchmark("sync_merge_10k")
+def bench_sync_merge(mapper):
+    """A peer's 10,000-cell edit arriving over map sync, each op newer than the last."""
+    from map_sync import MapSync, encode_state
+    sync = MapSync(mapper)
+    cells = sorted(_box(mapper, 100, 100))
+    lamport = [0]
+    def run():
+        lamport[0] += 1
+        state = encode_state((True, IconType.CHEST if lamport[0] % 2 else IconType.NONE, "", False))
+        sync.merge(mapper.current_floor, [[x, y, lamport[0], 1, state] for x, y in cells])
+    return run
+
+@benchmark("sync_floor_hashes")
+def bench_sync_floor_hashes(mapper):
+    """Anti-entropy digests of the whole map with a cold chunk hash cache (a peer connecting)."""
+    from map_sync import MapSync
+    sync = MapSync(mapper)
+    def run():
+        sync.hashes.clear()
+        sync.floor_hashes()
+    return run
+
+@benchmark("map_hash_edit")
+def bench_map_hash_edit(mapper):
+    """Unsaved-change check after a 100-cell edit spread over many chunks."""
+    from map_hash import map_digest
+    floor = mapper.floors[mapper.current_floor]
+    cells = sorted(floor)[::max(1, len(floor) // 100)][:100]
+    map_digest(mapper.floors)
+    flip = [False]
+    def run():
+        flip[0] = not flip[0]
+        floor.set_states((pos, (True, IconType.CHEST if flip[0] else IconType.NONE, "", False)) for pos in cells)
+        map_digest(mapper.floors)
+    return run
+
+@benchmark("map_diff_saved")
+def bench_map_diff_saved(mapper):
+    """F7 on a .jsonl map with one edited cell: index check, floor digests, one floor read."""
+    from map_hash import FileSource, OpenMapSource, diff_maps
+    path = os.path.join(tempfile.mkdtemp(prefix="crawltographer-bench-"), "diff.jsonl")
+    mapper.save_map(path)
+    floor = mapper.floors[mapper.current_floor]
+    pos = next(iter(floor))
+    floor.set_state(pos, (True, IconType.BOSS, "edited", False))
+    def run():
+        diff_maps(FileSource(path, mapper.map_index), OpenMapSource(mapper.floors))
+    return run
+
+def make_mapper(floors):
+    import dungeon_mapper
+    mapper = dungeon_mapper.DungeonMapper(network=False)
+    mapper.floors = FloorStore(floors)
+    mapper.current_pos = next(iter(floors[0])) if len(floors[0]) else (0, 0)
+    return mapper
+
+def run_benchmarks(args) -> dict:
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"Unknown benchmark(s): {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+
+    results = {}
+    for name in names:
+        # A fresh map and mapper per benchmark, so earlier ones cannot skew later ones
+        mapper = make_mapper(synthetic_map.map_from_arguments(args))
+        run = BENCHMARKS[name](mapper)
+        run() # Warm-up
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {'median_ms': round(statistics.median(timings), 3),
+                         'min_ms': round(min(timings), 3), 'runs': args.repeat}
+        print(f"{name:<22} median {results[name]['median_ms']:10.3f} ms   min {results[name]['min_ms']:10.3f} ms")
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'map': {'floors': args.floors, 'cells': args.cells, 'icon_density': args.icon_density,
+                    'label_ratio': args.label_ratio, 'lock_ratio': args.lock_ratio, 'seed': args.seed},
+        },
+        'results': results,
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Prints current vs. baseline medians and returns the names that regressed."""
+    if current['meta']['map'] != baseline['meta'].get('map'):
+        print("Warning: the baseline was recorded with different map parameters")
+    regressions = []
+    print(f"\n{'benchmark':<22} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if not before:
+            print(f"{name:<22} {'-':>12} {result['median_ms']:>12.3f}      new")
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] if before['median_ms'] else 0.0
+        slower_ms = result['median_ms'] - before['median_ms']
+        flag = "  REGRESSION" if change > threshold and slower_ms > NOISE_FLOOR_MS else ""
+        print(f"{name:<22} {before['median_ms']:>12.3f} {result['median_ms']:>12.3f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time the mapper's hot paths on a synthetic map.")
+    synthetic_map.add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="Comma-separated benchmark names")
+    parser.add_argument("-o", "--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
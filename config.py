@@ -1,8 +1,3 @@
-import pygame
-
-# Initialize Pygame for font loading
-pygame.init()
-
 # Constants
 WINDOW_WIDTH = 1200
 WINDOW_HEIGHT = 800
@@ -25,7 +20,38 @@ BUTTON_HOVER_COLOR = (90, 90, 100)
 LABEL_BG_COLOR = (50, 50, 60, 200)
 SELECTION_COLOR = (100, 150, 255, 100) # Semi-transparent blue
 SELECTION_BOX_COLOR = (150, 200, 255)
+WALL_COLOR = (235, 235, 240)
+DOOR_COLOR = (200, 140, 60)
+ONE_WAY_COLOR = (255, 160, 200)
+HEAT_COLOR = (255, 90, 40)
+
+# Fonts (FONT, SMALL_FONT) are loaded on first use by __getattr__ below, so that
+# importing config does not import or initialize pygame.
+FONT_SIZES = {"FONT": 24, "SMALL_FONT": 18}
+# Flood fill (F key) refuses regions larger than this many cells
+FLOOD_FILL_MAX_CELLS = 500_000
+# Memory for cached wall/door chunk surfaces; the least recently drawn are dropped first
+EDGE_CACHE_BYTES = 64 * 1024 * 1024
+# On-map labels (T key): font size at zoom 1, smallest size used, and the zoom below
+# which labels are not drawn. Rendered labels are cached, LABEL_CACHE_ENTRIES at most;
+# LABEL_GRID_BUCKET is the cell size in pixels of the grid used to cull overlaps.
+LABEL_FONT_SIZE = 18
+LABEL_MIN_FONT_SIZE = 12
+LABEL_MIN_ZOOM = 0.6
+LABEL_CACHE_ENTRIES = 4096
+LABEL_GRID_BUCKET = 64
+# Ghost floors (O key): opacity of the floor below and the floor above
+GHOST_BELOW_ALPHA = 60
+GHOST_ABOVE_ALPHA = 90
+# Player trail heat map (G key): number of shades from rarely to most visited
+HEAT_LEVELS = 8
 
-# Fonts
-FONT = pygame.font.Font(None, 24)
-SMALL_FONT = pygame.font.Font(None, 18)
\ No newline at end of file
+def __getattr__(name):
+    if name in FONT_SIZES:
+        import pygame
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.Font(None, FONT_SIZES[name])
+        globals()[name] = font # Cached: later lookups no longer reach __getattr__
+        return font
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,12 @@
+import itertools
+from collections.abc import MutableMapping
 from enum import Enum
+from typing import Dict, Iterator, Optional, Tuple
+
+# Cells are stored in square chunks of CHUNK_SIZE x CHUNK_SIZE (a power of two, so
+# the chunk of a cell is just a shift of its coordinates).
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
 
 class IconType(Enum):
     NONE = "none"
@@ -13,10 +21,274 @@ class IconType(Enum):
     TRAP = "trap"
     SAVE_POINT = "save"
 
+# A cell's full state as a plain tuple: (explored, icon, label, locked).
+# History entries and bulk edits store these instead of Cell objects or dicts.
+CellState = Tuple[bool, IconType, str, bool]
+
 class Cell:
     """Represents a single cell on the grid."""
+    __slots__ = ('explored', 'icon', 'label', 'locked')
+
     def __init__(self, explored=False, icon=None, label="", locked=False):
         self.explored = explored
         self.icon = icon if icon is not None else IconType.NONE
         self.label = label
-        self.locked = locked
\ No newline at end of file
+        self.locked = locked
+
+    def state(self) -> CellState:
+        return (self.explored, self.icon, self.label, self.locked)
+
+    def set_state(self, state: CellState):
+        self.explored, self.icon, self.label, self.locked = state
+
+    @classmethod
+    def from_state(cls, state: CellState) -> "Cell":
+        return cls(*state)
+
+def chunk_key(x: int, y: int) -> Tuple[int, int]:
+    """Returns the (cx, cy) chunk that contains cell (x, y)."""
+    return (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+
+# Edges: each side of a cell can hold one of these kinds. A wall or door is stored on
+# both cells it separates; a one-way passage only on the side it can be left through
+# (the cell on the other side has no edge there, so the passage reads as an entrance).
+EDGE_NONE, EDGE_WALL, EDGE_DOOR, EDGE_ONE_WAY = 0, 1, 2, 3
+SIDE_N, SIDE_E, SIDE_S, SIDE_W = 0, 1, 2, 3
+SIDE_OFFSETS = ((0, -1), (1, 0), (0, 1), (-1, 0))  # Neighbor across each side
+
+def edge_kind(mask: int, side: int) -> int:
+    """The kind of edge on one side of a cell's edge mask."""
+    return (mask >> (side * 2)) & 3
+
+def with_edge(mask: int, side: int, kind: int) -> int:
+    """`mask` with one side replaced by `kind`."""
+    return (mask & ~(3 << (side * 2))) | (kind << (side * 2))
+
+class EdgeLayer:
+    """
+    The walls, doors and one-way passages of one floor.
+
+    A cell's four sides are packed into one byte (two bits per side, N, E, S, W from
+    the low bits, see edge_kind) and stored in one bytearray per chunk, indexed by the
+    cell's position within the chunk. Like Floor, it keeps a version per chunk for
+    caches such as the renderer's edge surfaces. Versions are unique across all
+    layers, so a cache keyed by floor number cannot mistake a replaced floor's chunk
+    for the old one.
+    """
+    _versions = itertools.count(1)
+
+    def __init__(self):
+        self.chunks: Dict[Tuple[int, int], bytearray] = {}
+        self.chunk_versions: Dict[Tuple[int, int], int] = {}
+        self.version = 0
+        self._count = 0  # Cells with at least one edge
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, pos: Tuple[int, int]) -> int:
+        chunk = self.chunks.get((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+        if chunk is None:
+            return 0
+        return chunk[((pos[1] & (CHUNK_SIZE - 1)) << CHUNK_SHIFT) | (pos[0] & (CHUNK_SIZE - 1))]
+
+    def set_masks(self, items):
+        """Writes (pos, mask) pairs, bumping each affected chunk's version once."""
+        touched = set()
+        for pos, mask in items:
+            key = (pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT)
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                if not mask:
+                    continue
+                chunk = self.chunks[key] = bytearray(CHUNK_SIZE * CHUNK_SIZE)
+            index = ((pos[1] & (CHUNK_SIZE - 1)) << CHUNK_SHIFT) | (pos[0] & (CHUNK_SIZE - 1))
+            previous = chunk[index]
+            if previous == mask:
+                continue
+            chunk[index] = mask
+            self._count += (mask != 0) - (previous != 0)
+            touched.add(key)
+        for key in touched:
+            if not any(self.chunks[key]):
+                del self.chunks[key]
+            self.version = next(self._versions)
+            self.chunk_versions[key] = self.version
+
+    def set(self, pos: Tuple[int, int], mask: int):
+        self.set_masks(((pos, mask),))
+
+    def chunk(self, key: Tuple[int, int]) -> Optional[bytearray]:
+        """The edge masks of one chunk (None if it has no edges). Do not modify the result."""
+        return self.chunks.get(key)
+
+    def set_chunk(self, key: Tuple[int, int], masks: bytes):
+        """Replaces a whole chunk, e.g. when loading."""
+        self.set_masks(((((key[0] << CHUNK_SHIFT) | (i & (CHUNK_SIZE - 1)), (key[1] << CHUNK_SHIFT) | (i >> CHUNK_SHIFT)), mask)
+                        for i, mask in enumerate(masks)))
+
+    def items(self):
+        """Yields (pos, mask) for every cell with at least one edge."""
+        for (cx, cy), chunk in self.chunks.items():
+            for i, mask in enumerate(chunk):
+                if mask:
+                    yield ((cx << CHUNK_SHIFT) | (i & (CHUNK_SIZE - 1)), (cy << CHUNK_SHIFT) | (i >> CHUNK_SHIFT)), mask
+
+class Floor(MutableMapping):
+    """
+    The cells of one floor, bucketed into chunks.
+
+    Behaves like a dict of (x, y) -> Cell, but also gives cheap access to the cells of
+    a chunk or a rectangle, and keeps a version number per chunk so caches built from
+    the floor (rendered surfaces, hashes) can tell what changed. Like EdgeLayer's,
+    versions are unique across all floors. Code that mutates a Cell in place must call
+    touch() for its position. The floor's walls and doors are kept separately in `edges`.
+    """
+    _versions = itertools.count(1)
+
+    def __init__(self, cells=None):
+        self.edges = EdgeLayer()
+        self.chunks: Dict[Tuple[int, int], Dict[Tuple[int, int], Cell]] = {}
+        self.chunk_versions: Dict[Tuple[int, int], int] = {}
+        self.version = 0
+        self.hashes = None  # map_hash.FloorHashes, created when the floor is first hashed
+        self._count = 0
+        if cells:
+            for pos, cell in cells.items():
+                self[pos] = cell
+
+    def __getitem__(self, pos: Tuple[int, int]) -> Cell:
+        chunk = self.chunks.get((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+        if chunk is None:
+            raise KeyError(pos)
+        return chunk[pos]
+
+    def get(self, pos: Tuple[int, int], default=None) -> Optional[Cell]:
+        chunk = self.chunks.get((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+        if chunk is None:
+            return default
+        return chunk.get(pos, default)
+
+    def __contains__(self, pos) -> bool:
+        chunk = self.chunks.get((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+        return chunk is not None and pos in chunk
+
+    def __setitem__(self, pos: Tuple[int, int], cell: Cell):
+        key = (pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = {}
+        if pos not in chunk:
+            self._count += 1
+        chunk[pos] = cell
+        self._bump(key)
+
+    def __delitem__(self, pos: Tuple[int, int]):
+        key = (pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            raise KeyError(pos)
+        del chunk[pos]
+        self._count -= 1
+        if not chunk:
+            del self.chunks[key]
+        self._bump(key)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for chunk in self.chunks.values():
+            yield from chunk
+
+    def items(self):
+        for chunk in self.chunks.values():
+            yield from chunk.items()
+
+    def values(self):
+        for chunk in self.chunks.values():
+            yield from chunk.values()
+
+    def touch(self, pos: Tuple[int, int]):
+        """Marks the chunk containing `pos` as changed after an in-place Cell edit."""
+        self._bump((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+
+    def _bump(self, key: Tuple[int, int]):
+        self.version = next(self._versions)
+        self.chunk_versions[key] = self.version
+
+    def get_state(self, pos: Tuple[int, int]) -> Optional[CellState]:
+        cell = self.get(pos)
+        return cell.state() if cell is not None else None
+
+    def set_state(self, pos: Tuple[int, int], state: Optional[CellState]):
+        """Writes a cell's state, or removes the cell when `state` is None."""
+        if state is None:
+            if pos in self:
+                del self[pos]
+            return
+        cell = self.get(pos)
+        if cell is None:
+            self[pos] = Cell.from_state(state)
+        else:
+            cell.set_state(state)
+            self.touch(pos)
+
+    def set_states(self, items):
+        """
+        Like set_state() for many (pos, state) pairs at once, bumping each affected
+        chunk's version once instead of once per cell.
+        """
+        chunks = self.chunks
+        touched = set()
+        for pos, state in items:
+            key = (pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT)
+            chunk = chunks.get(key)
+            if state is None:
+                if chunk is None or pos not in chunk:
+                    continue
+                del chunk[pos]
+                self._count -= 1
+                if not chunk:
+                    del chunks[key]
+            else:
+                if chunk is None:
+                    chunk = chunks[key] = {}
+                cell = chunk.get(pos)
+                if cell is None:
+                    chunk[pos] = Cell(*state)
+                    self._count += 1
+                else:
+                    cell.set_state(state)
+            touched.add(key)
+        for key in touched:
+            self._bump(key)
+
+    def chunk_cells(self, key: Tuple[int, int]) -> Dict[Tuple[int, int], Cell]:
+        """The cells of one chunk (empty if the chunk has none). Do not modify the result."""
+        return self.chunks.get(key, {})
+
+    def cells_in_rect(self, x0: int, y0: int, x1: int, y1: int):
+        """
+        Yields (pos, cell) for every cell with x0 <= x <= x1 and y0 <= y <= y1.
+        Only chunks overlapping the rectangle are visited. Like dict iteration, the
+        floor must not be modified while the generator is running.
+        """
+        for cy in range(y0 >> CHUNK_SHIFT, (y1 >> CHUNK_SHIFT) + 1):
+            for cx in range(x0 >> CHUNK_SHIFT, (x1 >> CHUNK_SHIFT) + 1):
+                chunk = self.chunks.get((cx, cy))
+                if not chunk:
+                    continue
+                inside = (x0 <= (cx << CHUNK_SHIFT) and ((cx + 1) << CHUNK_SHIFT) - 1 <= x1 and
+                          y0 <= (cy << CHUNK_SHIFT) and ((cy + 1) << CHUNK_SHIFT) - 1 <= y1)
+                for pos, cell in chunk.items():
+                    if inside or (x0 <= pos[0] <= x1 and y0 <= pos[1] <= y1):
+                        yield pos, cell
+
+    def bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """(min_x, min_y, max_x, max_y) of all cells, or None for an empty floor."""
+        if not self._count:
+            return None
+        xs = [x for chunk in self.chunks.values() for x, _ in chunk]
+        ys = [y for chunk in self.chunks.values() for _, y in chunk]
+        return (min(xs), min(ys), max(xs), max(ys))
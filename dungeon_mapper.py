@@ -1,29 +1,64 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import os
+import threading
 import pygame
-import math
 from typing import Dict, Tuple, Optional, Set
 
 import config
-from data_models import Cell, IconType
+from data_models import SIDE_OFFSETS, Cell, Floor, IconType
+from history import CellChanges
+from map_view import MapView
 from renderer import Renderer
 from ui import UIManager
-from event_handler import EventHandler, HAS_TKINTER
-from file_manager import save_map_data, load_map_data
+from event_handler import EventHandler
+from file_manager import load_map_data, encode_cells
+from grid_formats import export_grid, grid_format, import_grid
+from region_edit import RegionEditor
+from edge_edit import EdgeEditor, can_cross
+from floor_store import FloorStore
+from net_stats import NetStats, StatsWriter
+from perf_hud import PerfHUD
+from profiling import ProfileCapture, traced
+from startup_timing import StartupTimer
+from trail import PlayerTrail, trail_path
+from map_sync import SYNC_ENABLED, SYNC_PEERS, SYNC_PORT, MapSync
+from map_hash import FileSource, MapIndex, OpenMapSource, describe_diff, diff_maps, map_digest, save_map_indexed
+from autosave import WINDOW_TITLE, Autosaver
 
 try:
-    from udp_listener import UDPInputListener
+    from udp_listener import UDPInputListener, CaptureWriter
 except ImportError:
     print("Warning: Could not import UDPInputListener. Remote mapping disabled.")
     UDPInputListener = None
 
-# Initialize Pygame
-pygame.init()
+try:
+    from spectator import SPECTATOR_ENABLED, MapBroadcaster
+except ImportError:
+    print("Warning: Could not import MapBroadcaster. Spectator broadcast disabled.")
+    MapBroadcaster = None
+
+SIDE_FOR_STEP = {offset: side for side, offset in enumerate(SIDE_OFFSETS)}
+
+def _untimed(phase: str, step):
+    return step()
+
+class DungeonMapper(MapView):
+    def __init__(self, network: bool = True):
+        self.startup = StartupTimer(_IMPORT_STARTED)
+        self.startup.mark("imports")
+
+        # Only the modules the mapper uses; pygame.init() would also start audio and joysticks
+        pygame.display.init()
+        pygame.font.init()
+        self.startup.mark("pygame init")
 
-class DungeonMapper:
-    def __init__(self):
         self.screen = pygame.display.set_mode((config.WINDOW_WIDTH, config.WINDOW_HEIGHT), pygame.RESIZABLE)
-        pygame.display.set_caption("Dungeon Crawltographer")
+        pygame.display.set_caption(WINDOW_TITLE)
         
         self.clock = pygame.time.Clock()
+        self.startup.mark("window")
         
         # Window state
         self.window_width = config.WINDOW_WIDTH
@@ -31,7 +66,7 @@ class DungeonMapper:
         self.is_fullscreen = False
         
         # Grid state
-        self.floors: Dict[int, Dict[Tuple[int, int], Cell]] = {0: {}}
+        self.floors = FloorStore({0: Floor()}) # Keeps recently used floors in memory, spills the rest
         self.current_floor = 0
         self.current_pos = (config.GRID_SIZE // 2, config.GRID_SIZE // 2)
         self.rotation = 0  # 0, 90, 180, 270
@@ -65,6 +100,7 @@ class DungeonMapper:
         self.left_mouse_down = False
         self.right_mouse_down = False
         self.last_marked_cell = None
+        self.mouse_pos = (0, 0) # Last pointer position seen in an event (kept by EventHandler)
         
         # Cell move state
         self.is_moving_selection = False
@@ -74,9 +110,22 @@ class DungeonMapper:
         self.history = []
         self.history_index = -1
         self.max_history = 100
-        self.current_action = []  # Track cells modified in current drag action
+        self.current_action = CellChanges(self.current_floor)  # Cells modified in the current click/drag action
+
+        # Callables notified as listener(floor, positions) after cells change.
+        # A floor of None means the whole map was replaced (new map or load).
+        self.change_listeners = []
 
         self.player_mode_enabled = False
+        self.current_filepath = None
+        # Content hashes of the map as last saved or loaded (see map_hash); None if it never was
+        self.map_index = None  # map_hash.MapIndex of current_filepath
+        self.saved_digest = 0  # An empty map counts as saved
+
+        # Every player step, saved next to the map file; G shows it as a heat map
+        self.trail = PlayerTrail()
+        self.show_heat_map = False
+        self.show_ghost_floors = False  # O: the floors above and below under the current one
         
         self.running = True
         
@@ -84,124 +133,118 @@ class DungeonMapper:
         self.renderer = Renderer(self)
         self.ui_manager = UIManager(self)
         self.event_handler = EventHandler(self)
-
-        # New: Start the UDP listener
+        self.region_editor = RegionEditor(self)
+        self.edge_editor = EdgeEditor(self)
+        self.autosaver = Autosaver(self)
+
+        # Record input for session_replay.py
+        session_path = os.environ.get("CRAWLTOGRAPHER_SESSION_RECORD")
+        if session_path:
+            from session_replay import SessionRecorder
+            self.event_handler.recorder = SessionRecorder(self, session_path)
+
+        # Controller link instrumentation (F2 shows it, the env var logs it to a .json/.csv file)
+        self.net_stats = NetStats()
+        self.show_net_stats = False
+        stats_path = os.environ.get("CRAWLTOGRAPHER_NET_STATS")
+        if stats_path:
+            StatsWriter(self.net_stats, stats_path).start()
+
+        # Frame-time breakdown (F3); costs nothing while hidden
+        self.perf_hud = PerfHUD(self)
+        # cProfile captures of the main loop (F4, or CRAWLTOGRAPHER_PROFILE=<seconds> at startup)
+        self.profile_capture = ProfileCapture()
+
+        self.startup.mark("components")
+
+        # Networking binds sockets and opens capture files, so it starts in the
+        # background; both attributes stay None until it is up.
         self.udp_listener = None
+        self.broadcaster = None  # spectator.MapBroadcaster when CRAWLTOGRAPHER_SPECTATOR_PORT is set
+        self.second_view = None  # second_view.SecondViewPublisher while the F6 view is open
+        self.sync = None  # map_sync.MapSync when CRAWLTOGRAPHER_SYNC_PORT/_PEERS are set
+        if network:
+            threading.Thread(target=self._start_network, daemon=True).start()
+
+    def _start_network(self):
+        started = time.perf_counter()
+        # New: Start the UDP listener
         if UDPInputListener:
-            self.udp_listener = UDPInputListener()
-            self.udp_listener.start()
-
-    def get_cell(self, x: int, y: int, floor: int = None) -> Cell:
-        """Get or create a cell at the given position"""
+            capture_path = os.environ.get("CRAWLTOGRAPHER_UDP_CAPTURE")
+            capture = CaptureWriter(capture_path) if capture_path else None
+            udp_listener = UDPInputListener(stats=self.net_stats, capture=capture)
+            udp_listener.start()
+            self.udp_listener = udp_listener
+
+        # Publish live map changes to read-only spectators (CRAWLTOGRAPHER_SPECTATOR_PORT)
+        if MapBroadcaster and SPECTATOR_ENABLED:
+            broadcaster = MapBroadcaster(self)
+            broadcaster.start()
+            self.broadcaster = broadcaster
+
+        # Edit the same map together with other mappers
+        if SYNC_ENABLED:
+            sync = MapSync(self, SYNC_PORT, SYNC_PEERS.split(','))
+            sync.start()
+            self.sync = sync
+        self.startup.record_background("networking", time.perf_counter() - started)
+
+    def get_floor(self, floor: int = None) -> Floor:
+        """Get or create the given floor (the current one by default)"""
         if floor is None:
             floor = self.current_floor
         if floor not in self.floors:
-            self.floors[floor] = {}
-        if (x, y) not in self.floors[floor]:
-            self.floors[floor][(x, y)] = Cell()
-        return self.floors[floor][(x, y)]
-    
-    def screen_to_grid(self, screen_x: int, screen_y: int) -> Optional[Tuple[int, int]]:
-        """Convert screen coordinates to grid coordinates"""
-        # Adjust for camera and menu bar
-        panel_h = config.ICON_PANEL_HEIGHT if self.show_icon_panel else 0
-        top_bar_height = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-        grid_center_x = self.window_width // 2
-        grid_center_y = (self.window_height - top_bar_height - panel_h) // 2 + top_bar_height + panel_h
-        
-        # Offset from center
-        offset_x = (screen_x - grid_center_x) / (config.CELL_SIZE * self.zoom)
-        offset_y = (screen_y - grid_center_y) / (config.CELL_SIZE * self.zoom)
-        
-        # Apply rotation
-        angle = math.radians(self.rotation)
-        rotated_x = offset_x * math.cos(angle) + offset_y * math.sin(angle)
-        rotated_y = -offset_x * math.sin(angle) + offset_y * math.cos(angle)
-        
-        # Add current position and camera
-        grid_x = round(self.current_pos[0] + rotated_x - self.camera_x)
-        grid_y = round(self.current_pos[1] + rotated_y - self.camera_y)
-        
-        return (grid_x, grid_y)
-    
-    def grid_to_screen(self, grid_x: int, grid_y: int) -> Tuple[float, float]:
-        """Convert grid coordinates to screen coordinates"""
-        return self._grid_to_screen_rotated(grid_x, grid_y)
+            self.floors[floor] = Floor()
+        return self.floors[floor]
 
-    def grid_to_screen_unrotated(self, grid_x: int, grid_y: int) -> Tuple[float, float]:
-        """
-        Convert grid coordinates to screen coordinates, ignoring rotation.
-        Useful for drawing UI elements like the selection box that should not rotate with the map.
-        """
-        return self._grid_to_screen_rotated(grid_x, grid_y, apply_rotation=False)
-
-    def _grid_to_screen_rotated(self, grid_x: int, grid_y: int, apply_rotation: bool = True) -> Tuple[float, float]:
-        """Internal helper for grid to screen conversion with optional rotation."""
-        panel_h = config.ICON_PANEL_HEIGHT if self.show_icon_panel else 0
-        top_bar_height = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-        grid_center_x = self.window_width // 2
-        grid_center_y = (self.window_height - top_bar_height - panel_h) // 2 + top_bar_height + panel_h
-        
-        # Offset from current position
-        offset_x = grid_x - self.current_pos[0] + self.camera_x
-        offset_y = grid_y - self.current_pos[1] + self.camera_y
-        
-        # Apply rotation
-        if apply_rotation:
-            angle = math.radians(-self.rotation)
-            rotated_x = offset_x * math.cos(angle) + offset_y * math.sin(angle)
-            rotated_y = -offset_x * math.sin(angle) + offset_y * math.cos(angle)
-        else:
-            rotated_x, rotated_y = offset_x, offset_y
+    def get_cell(self, x: int, y: int, floor: int = None) -> Cell:
+        """Get or create a cell at the given position"""
+        cells = self.get_floor(floor)
+        cell = cells.get((x, y))
+        if cell is None:
+            cell = cells[(x, y)] = Cell()
+        return cell
+
+    def begin_action(self) -> CellChanges:
+        """Returns the action that click/drag edits are recorded into, committing it first if the floor changed."""
+        if self.current_action.floor != self.current_floor:
+            self.save_state()
+            self.current_action = CellChanges(self.current_floor)
+        return self.current_action
 
-        # Convert to screen space
-        screen_x = grid_center_x + rotated_x * config.CELL_SIZE * self.zoom
-        screen_y = grid_center_y + rotated_y * config.CELL_SIZE * self.zoom
-        
-        return (screen_x, screen_y)
-    
     def save_state(self):
         """Save current state to history for undo/redo"""
         if not self.current_action:
             return
-        
+        self.push_history(self.current_action)
+        self.current_action = CellChanges(self.current_floor)
+
+    def push_history(self, entry):
+        """Adds a finished history entry (see history.py) and notifies change listeners."""
         # Remove any history after current index (if we undid and then made new changes)
         self.history = self.history[:self.history_index + 1]
         
         # Add new state
-        self.history.append(self.current_action.copy())
+        self.history.append(entry)
+        self._notify_cells_changed(entry.floor, entry.touched())
         
         # Limit history size
         if len(self.history) > self.max_history:
             self.history.pop(0)
         else:
             self.history_index += 1
-        
-        self.current_action = []
     
     def undo(self):
         """Undo the last action"""
+        self.save_state() # Commit any edit still in progress so it is undone first
+        self.edge_editor.end_stroke()
         if self.history_index < 0:
             return
         
-        action = self.history[self.history_index]
-        for cell_info in action:
-            grid_pos = cell_info['pos']
-            prev_state = cell_info['prev']
-            
-            if prev_state is None:
-                # Cell was added, so remove it
-                if grid_pos in self.floors[self.current_floor]:
-                    del self.floors[self.current_floor][grid_pos]
-            else:
-                # Cell was modified or removed, restore previous state
-                cell = self.get_cell(*grid_pos)
-                cell.explored = prev_state['explored']
-                cell.icon = prev_state['icon']
-                cell.label = prev_state['label']
-                cell.locked = prev_state['locked']
-        
+        entry = self.history[self.history_index]
+        positions = entry.apply(self.get_floor(entry.floor), reverse=True)
         self.history_index -= 1
+        self._notify_cells_changed(entry.floor, positions)
     
     def redo(self):
         """Redo the last undone action"""
@@ -209,27 +252,17 @@ class DungeonMapper:
             return
         
         self.history_index += 1
-        action = self.history[self.history_index]
-        
-        for cell_info in action:
-            grid_pos = cell_info['pos']
-            new_state = cell_info['new']
-            
-            if new_state is None:
-                # Cell should be removed
-                if grid_pos in self.floors[self.current_floor]:
-                    del self.floors[self.current_floor][grid_pos]
-            else:
-                # Cell should be restored/modified
-                cell = self.get_cell(*grid_pos)
-                cell.explored = new_state['explored']
-                cell.icon = new_state['icon']
-                cell.label = new_state['label']
-                cell.locked = new_state['locked']
+        entry = self.history[self.history_index]
+        positions = entry.apply(self.get_floor(entry.floor))
+        self._notify_cells_changed(entry.floor, positions)
+
+    def _notify_cells_changed(self, floor: Optional[int], positions):
+        for listener in self.change_listeners:
+            listener(floor, positions)
     
     def new_map(self):
         """Create a new map, clearing all data"""
-        self.floors = {0: {}}
+        self.floors = FloorStore({0: Floor()})
         self.current_floor = 0
         self.current_pos = (config.GRID_SIZE // 2, config.GRID_SIZE // 2)
         self.rotation = 0
@@ -238,10 +271,14 @@ class DungeonMapper:
         self.zoom = 1.0
         self.history = []
         self.history_index = -1
-        self.current_action = []
+        self.current_action = CellChanges(self.current_floor)
         self.selected_cells.clear()
+        self.trail = PlayerTrail()
         print("New map created")
         self.current_filepath = None
+        self.map_index = None
+        self.saved_digest = 0
+        self._notify_cells_changed(None, None)
 
     def handle_click(self, pos: Tuple[int, int], button: int = 1, is_drag: bool = False):
         """Handle mouse click"""
@@ -258,57 +295,13 @@ class DungeonMapper:
         # If there's a selection, apply to all selected cells.
         # Otherwise, apply to the clicked cell.
         target_cells = self.selected_cells if self.selected_cells else {grid_pos} if grid_pos else set()
+        self.region_editor.paint(target_cells, button)
 
-        for pos in target_cells:
-            cell = self.get_cell(*pos)
-            if cell.locked:
-                continue # Skip locked cells
-
-            self._record_cell_change(pos, button)
-
-    def _record_cell_change(self, grid_pos: Tuple[int, int], button: int, new_cell_data: Optional[Cell] = None):
+    def _record_cell_change(self, grid_pos: Tuple[int, int], button: int):
         """Helper to record a single cell change for history and apply it."""
-        prev_state = None
-        if grid_pos in self.floors[self.current_floor]:
-            cell = self.floors[self.current_floor][grid_pos]
-            prev_state = {
-                'explored': cell.explored,
-                'icon': cell.icon,
-                'label': cell.label,
-                'locked': cell.locked
-            }
-
-        cell = self.get_cell(*grid_pos)
-
-        # If the cell is locked, prevent most modifications.
-        if cell.locked:
-            # Allow right-click to "clear" a locked cell, but not delete it.
-            if button == 3 and cell.explored:
-                cell.explored = False
-                cell.icon = IconType.NONE
-                cell.label = ""
-                new_state = {'explored': False, 'icon': IconType.NONE, 'label': "", 'locked': True}
-                self.current_action.append({'pos': grid_pos, 'prev': prev_state, 'new': new_state})
-            # Otherwise, do nothing to locked cells.
-            return
-
-        if button == 1:  # Left click - add/mark cell
-            if new_cell_data: # Pasting an existing cell
-                cell.explored = new_cell_data.explored
-                cell.icon = new_cell_data.icon
-                cell.label = new_cell_data.label
-                cell.locked = new_cell_data.locked
-            else: # Applying the selected icon from the panel
-                cell.explored = True
-                cell.icon = self.selected_icon
-            new_state = {'explored': cell.explored, 'icon': cell.icon, 'label': cell.label, 'locked': cell.locked}
-            self.current_action.append({'pos': grid_pos, 'prev': prev_state, 'new': new_state})
-
-        elif button == 3:  # Right click - remove cell
-            if grid_pos in self.floors[self.current_floor]:
-                del self.floors[self.current_floor][grid_pos]
-                self.current_action.append({'pos': grid_pos, 'prev': prev_state, 'new': None})
+        self.region_editor.paint((grid_pos,), button)
 
+    @traced("handle_remote_command")
     def handle_remote_command(self, command: str):
         """Processes commands received from the remote UDP client."""
         if command == 'forward': self.move_player(forward=True, from_controller=True)
@@ -323,26 +316,63 @@ class DungeonMapper:
             self.toggle_player_mode()
 
 
+    @traced("save_map")
     def save_map(self, filename: str):
-        """Save the current map to a file"""
-        save_map_data(filename, self.floors, self.current_floor, self.current_pos, self.rotation)
+        """Save the current map to a file, or export it if the name ends in .txt, .csv or .tmx"""
+        if grid_format(filename):
+            export_grid(filename, self.floors, self.current_floor) # An export: keeps the current file
+            return
+        header = {"current_floor": self.current_floor, "current_pos": self.current_pos, "rotation": self.rotation}
+        try:
+            # Unchanged floors are copied from the file being overwritten (see map_hash)
+            self.map_index = save_map_indexed(filename, self.floors, header, self.map_index)
+        except OSError as e:
+            print(f"Error saving map to {filename}: {e}")
+            return
+        print(f"Map saved to {self.map_index.path}")
+        self.saved_digest = self.map_index.digest()
+        if len(self.trail):
+            self.trail.save(trail_path(filename))
         self.current_filepath = filename # Remember the last saved path
 
+    @traced("load_map")
     def load_map(self, filename: str):
-        """Load a map from a file"""
-        data = load_map_data(filename)
+        """Load a map from a file, or import one if the name ends in .txt, .csv or .tmx"""
+        if grid_format(filename):
+            data = import_grid(filename, FloorStore())
+            if data:
+                self.current_filepath = None # Saving asks where, rather than overwriting the layout
+                self.set_map_data(data)
+                self.map_index = None
+                self.saved_digest = None # Not saved as a map yet
+                self.trail = PlayerTrail()
+            return
+        data = load_map_data(filename, FloorStore())
         if data:
             self.current_filepath = filename # Remember the loaded path
-            # Reconstruct cells to ensure they are Cell objects with all attributes
-            self.floors = {
-                floor: {pos: cell for pos, cell in cells.items()} for floor, cells in data["floors"].items()
-            }
-
-            self.current_floor = data["current_floor"]
-            self.current_pos = data["current_pos"]
-            self.rotation = data["rotation"]
-            self.history = []
-            self.history_index = -1
+            self.set_map_data(data)
+            self.map_index = MapIndex.load(filename)
+            if self.map_index:
+                for number, hashes in self.map_index.floors.items():
+                    self.floors.attach_hashes(number, hashes.copy())
+                self.saved_digest = self.map_index.digest()
+            else:
+                self.saved_digest = map_digest(self.floors) # Written to the index on the next save
+            self.trail = PlayerTrail.load(trail_path(filename)) or PlayerTrail()
+
+    def set_map_data(self, data: Dict):
+        """Replaces the whole map with `data` as returned by load_map_data, clearing history."""
+        floors = data["floors"]
+        self.floors = floors if isinstance(floors, FloorStore) else FloorStore(floors)
+        self.current_floor = data["current_floor"]
+        self.current_pos = data["current_pos"]
+        self.rotation = data["rotation"]
+        if self.current_floor in self.floors:
+            self.floors.touch(self.current_floor) # Loading later floors may have spilled it
+        self.history = []
+        self.history_index = -1
+        self.current_action = CellChanges(self.current_floor)
+        self._notify_cells_changed(None, None)
 
     def trigger_save(self):
         """Saves to the current file, or opens 'Save As' dialog if no file is set."""
@@ -352,6 +382,40 @@ class DungeonMapper:
         else:
             self.event_handler.trigger_save_as_with_dialog()
 
+    def print_unsaved_changes(self):
+        """Prints which floors, chunks and cells differ from the saved file (F7)."""
+        if not self.current_filepath:
+            print("The map has not been saved to a file yet")
+            return
+        try:
+            source = FileSource(self.current_filepath, self.map_index)
+            diffs = diff_maps(source, OpenMapSource(self.floors))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error comparing with {self.current_filepath}: {e}")
+            return
+        self.map_index = source.index
+        if not diffs:
+            print(f"No changes since {self.current_filepath} was saved")
+        for line in describe_diff(diffs):
+            print(line)
+
+    def export_png(self):
+        """Renders every floor to PNG in the background, next to the map file (or in ./png_export)."""
+        self.active_menu = None
+        if self.current_filepath:
+            base = os.path.splitext(self.current_filepath)[0]
+            out_dir, prefix = base + "_png", os.path.basename(base)
+        else:
+            out_dir, prefix = os.path.join(os.getcwd(), "png_export"), "map"
+        # Snapshot the cells now, since editing continues while the export runs
+        floors = [(floor, encode_cells(cells)) for floor, cells in sorted(self.floors.items()) if len(cells)]
+
+        def run():
+            from floor_export import export_floors
+            results = export_floors(floors, out_dir, prefix)
+            print(f"Exported {len(results)} floor(s) to {out_dir}")
+        threading.Thread(target=run, daemon=True).start()
+
     def trigger_load(self):
         self.active_menu = None
         self.event_handler.trigger_load_with_dialog()
@@ -369,16 +433,20 @@ class DungeonMapper:
         # Calculate the potential new position
         next_pos = (self.current_pos[0] + dx, self.current_pos[1] + dy)
 
-        # If movement is from the controller, check if the destination is locked
-        if from_controller and self.get_cell(*next_pos).locked:
+        # If movement is from the controller, check if the destination is locked or walled off
+        next_cell = self.get_floor().get(next_pos)
+        if from_controller and next_cell is not None and next_cell.locked:
             return # Do not move into a locked cell
+        if from_controller and not can_cross(self.get_floor(), self.current_pos, SIDE_FOR_STEP[(dx, dy)]):
+            return # A wall, or a one-way passage the wrong way
 
         self.current_pos = next_pos
+        self.trail.record(self.current_floor, next_pos, self.rotation)
 
         # If player mode is on, automatically mark the new cell as explored.
         if self.player_mode_enabled:
-            cell = self.get_cell(*self.current_pos)
-            if not cell.explored:
+            cell = self.get_floor().get(self.current_pos)
+            if cell is None or not cell.explored:
                 self._record_cell_change(self.current_pos, button=1)
                 self.save_state()
 
@@ -390,11 +458,10 @@ class DungeonMapper:
 
     def change_floor(self, delta: int):
         self.current_floor += delta
-        if self.current_floor not in self.floors:
-            self.floors[self.current_floor] = {}
+        self.get_floor()
 
     def start_labelling(self):
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = self.mouse_pos
         if mouse_pos[1] > config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT + (config.ICON_PANEL_HEIGHT if self.show_icon_panel else 0):
             grid_pos = self.screen_to_grid(*mouse_pos)
             if grid_pos:
@@ -406,6 +473,7 @@ class DungeonMapper:
                         self.input_mode = True
                         self.input_text = cell.label
 
+    @traced("move_selection")
     def move_selection(self, end_grid_pos: Tuple[int, int]):
         """Moves the entire selection of cells to a new location."""
         if not self.selected_cells or not self.move_start_grid_pos:
@@ -417,24 +485,7 @@ class DungeonMapper:
         if dx == 0 and dy == 0:
             return # No movement
 
-        new_selection = set()
-        cells_to_move = []
-
-        # Prepare to move by gathering data first
-        for pos in self.selected_cells:
-            if pos in self.floors[self.current_floor]:
-                cells_to_move.append((pos, self.floors[self.current_floor][pos]))
-
-        # Apply the move
-        for original_pos, cell_to_move in cells_to_move:
-            new_pos = (original_pos[0] + dx, original_pos[1] + dy)
-            
-            # Record the creation of the new cell and deletion of the old one
-            self._record_cell_change(new_pos, button=1, new_cell_data=cell_to_move)
-            self._record_cell_change(original_pos, button=3) # Button 3 signifies deletion
-            new_selection.add(new_pos)
-
-        self.selected_cells = new_selection
+        self.selected_cells = self.region_editor.move(self.selected_cells, dx, dy)
 
     def warp_to_entrance(self):
         """Finds the entrance on the current floor and moves the player there."""
@@ -452,11 +503,9 @@ class DungeonMapper:
             return
 
         # Determine the new state from the first cell
-        first_cell = self.get_cell(*list(self.selected_cells)[0])
-        new_locked_state = not first_cell.locked
-
-        for grid_pos in self.selected_cells:
-            self.get_cell(*grid_pos).locked = new_locked_state
+        first_cell = self.get_floor().get(next(iter(self.selected_cells)))
+        new_locked_state = first_cell is None or not first_cell.locked
+        self.region_editor.set_locked(self.selected_cells, new_locked_state)
         
     def toggle_fullscreen(self):
         self.is_fullscreen = not self.is_fullscreen
@@ -472,6 +521,16 @@ class DungeonMapper:
         """Toggle player mode on or off."""
         self.player_mode_enabled = not self.player_mode_enabled
 
+    def toggle_second_view(self):
+        """Opens or closes the full-screen map view on a second monitor (second_view.py)."""
+        if self.second_view:
+            self.second_view.close()
+            self.second_view = None
+            return
+        from second_view import SecondViewPublisher
+        self.second_view = SecondViewPublisher(self)
+        self.second_view.launch()
+
     def is_dialog_open(self):
         return self.show_hotkeys_dialog or self.show_about_dialog or self.show_save_dialog or self.show_load_dialog
 
@@ -482,25 +541,69 @@ class DungeonMapper:
         self.show_load_dialog = False
         self.file_dialog_text = ""
 
-    def draw(self):
+    def publish_frame(self):
+        """Hands this frame's changes to the other mappers, spectators and views, and autosaves."""
+        if self.sync:
+            self.sync.publish_frame()
+        if self.broadcaster:
+            self.broadcaster.publish_frame()
+        if self.second_view:
+            self.second_view.publish_frame()
+        self.autosaver.tick()
+
+    def draw(self, timed=None, overlay=None):
+        """
+        Draws the frame. `overlay(visible_cells)` draws on top just before the flip
+        (the performance HUD). See frame() for `timed`.
+        """
+        timed = timed or _untimed
         self.screen.fill(config.BG_COLOR)
-        self.renderer.draw_grid()
-        self.ui_manager.draw_ui()
-        self.ui_manager.draw_dialogs()
-        self.ui_manager.draw_input_prompt()
-        pygame.display.flip()
+        timed("grid lines", self.renderer.draw_grid_lines)
+        timed("ghosts", self.renderer.draw_ghost_floors)
+        visible_cells = timed("cells", self.renderer.draw_cells)
+        timed("heat map", self.renderer.draw_heat_map)
+        timed("edges", self.renderer.draw_edges)
+        timed("labels", self.renderer.draw_labels)
+        timed("overlays", self.renderer.draw_overlays)
+        timed("ui", self.ui_manager.draw_ui)
+        timed("dialogs", lambda: (self.ui_manager.draw_dialogs(), self.ui_manager.draw_input_prompt()))
+        if overlay:
+            overlay(visible_cells)
+        timed("flip", pygame.display.flip)
+
+    def frame(self, timed=None, events=None, overlay=None):
+        """
+        One frame of the main loop. Each step runs as timed(phase, step), with the
+        phases listed in perf_hud.PHASES, so the performance HUD times the same steps
+        the loop runs. `events` replaces the pygame queue (see EventHandler.handle_events).
+        """
+        timed = timed or _untimed
+        timed("events", lambda: self.event_handler.handle_events(events))
+        timed("broadcast", self.publish_frame)
+        self.draw(timed, overlay)
 
     def run(self):
         """Main game loop"""
+        profile_seconds = os.environ.get("CRAWLTOGRAPHER_PROFILE")
+        if profile_seconds:
+            self.profile_capture.start(float(profile_seconds))
+
         while self.running:
             self.clock.tick(60)
+            if self.profile_capture.running:
+                self.profile_capture.check()
 
-            # Handle events
-            self.event_handler.handle_events()
-            
-            # Draw
-            self.draw()
+            if self.perf_hud.enabled:
+                self.perf_hud.run_frame() # frame(), timed phase by phase
+            else:
+                self.frame()
+            self.startup.finish()
         
+        self.profile_capture.stop()
+        if self.second_view:
+            self.second_view.close()
+        if self.sync:
+            self.sync.close()
         pygame.quit()
 
 if __name__ == "__main__":
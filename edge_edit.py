@@ -0,0 +1,88 @@
+"""
+Wall, door and one-way passage painting (the edge tool, B key).
+
+With the tool on, left click/drag paints the selected kind of edge on the cell side
+nearest the pointer and right click/drag erases edges. A drag is one undo step
+(history.EdgeChanges), committed on mouse up.
+"""
+from typing import Optional, Tuple
+
+from data_models import (EDGE_DOOR, EDGE_NONE, EDGE_ONE_WAY, EDGE_WALL, SIDE_E, SIDE_N, SIDE_OFFSETS,
+                         SIDE_S, SIDE_W, Floor, edge_kind, with_edge)
+from history import EdgeChanges
+
+Position = Tuple[int, int]
+
+# The B key cycles through these; None is the normal cell tools
+EDGE_TOOLS = (None, EDGE_WALL, EDGE_DOOR, EDGE_ONE_WAY)
+EDGE_TOOL_NAMES = {None: "Off", EDGE_WALL: "Wall", EDGE_DOOR: "Door", EDGE_ONE_WAY: "One-way"}
+
+def nearest_edge(grid_x: float, grid_y: float) -> Tuple[Position, int]:
+    """The cell containing a fractional grid position and its side closest to it."""
+    cell = (round(grid_x), round(grid_y))
+    fx, fy = grid_x - cell[0], grid_y - cell[1]
+    if abs(fx) > abs(fy):
+        return cell, SIDE_E if fx > 0 else SIDE_W
+    return cell, SIDE_S if fy > 0 else SIDE_N
+
+def set_edge(floor: Floor, pos: Position, side: int, kind: int, action: Optional[EdgeChanges] = None):
+    """
+    Puts `kind` on one side of a cell and keeps the neighbor across it consistent:
+    walls and doors are mirrored, while a one-way passage (leaving `pos`) and erasing
+    clear the neighbor's side.
+    """
+    dx, dy = SIDE_OFFSETS[side]
+    neighbor = (pos[0] + dx, pos[1] + dy)
+    opposite = (side + 2) % 4
+    other_kind = kind if kind in (EDGE_WALL, EDGE_DOOR) else EDGE_NONE
+    changes = []
+    for where, where_side, where_kind in ((pos, side, kind), (neighbor, opposite, other_kind)):
+        prev = floor.edges.get(where)
+        new = with_edge(prev, where_side, where_kind)
+        if new != prev:
+            changes.append((where, new))
+            if action is not None:
+                action.record(where, prev, new)
+    floor.edges.set_masks(changes)
+
+def can_cross(floor: Floor, pos: Position, side: int) -> bool:
+    """Whether the player may step from `pos` across `side`: no wall, and not against a one-way passage."""
+    if edge_kind(floor.edges.get(pos), side) == EDGE_WALL:
+        return False
+    dx, dy = SIDE_OFFSETS[side]
+    return edge_kind(floor.edges.get((pos[0] + dx, pos[1] + dy)), (side + 2) % 4) != EDGE_ONE_WAY
+
+class EdgeEditor:
+    def __init__(self, app):
+        self.app = app
+        self.tool = None  # One of EDGE_TOOLS
+        self.stroke: Optional[EdgeChanges] = None  # The drag in progress
+        self.last_edge = None
+
+    def cycle_tool(self):
+        self.tool = EDGE_TOOLS[(EDGE_TOOLS.index(self.tool) + 1) % len(EDGE_TOOLS)]
+
+    def _edge_at(self, screen_pos) -> Tuple[Position, int]:
+        return nearest_edge(*self.app.screen_to_grid_float(*screen_pos))
+
+    def stroke_to(self, screen_pos, erase: bool = False):
+        """Paints (or erases) the edge under the pointer as part of the current drag."""
+        edge = self._edge_at(screen_pos)
+        if edge == self.last_edge:
+            return
+        self.last_edge = edge
+        if self.stroke is None:
+            self.stroke = EdgeChanges(self.app.current_floor)
+        pos, side = edge
+        floor = self.app.get_floor(self.stroke.floor)
+        cell = floor.get(pos)
+        if cell is not None and cell.locked:
+            return
+        set_edge(floor, pos, side, EDGE_NONE if erase else self.tool, self.stroke)
+
+    def end_stroke(self):
+        """Commits the drag as one undo step."""
+        stroke, self.stroke = self.stroke, None
+        self.last_edge = None
+        if stroke:
+            self.app.push_history(stroke)
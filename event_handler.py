@@ -1,29 +1,54 @@
 import pygame
 import math
+import time
 
 import config
-from data_models import IconType
-
-# Import tkinter for file dialogs
-try:
-    import tkinter as tk
-    from tkinter import filedialog
-    HAS_TKINTER = True
-except ImportError:
-    HAS_TKINTER = False
+from region_edit import grid_line
+from ui_layout import PANEL_ICONS
 
 try:
     from udp_listener import REMOTE_MOVE_EVENT
 except ImportError:
-    HAS_TKINTER = False
     REMOTE_MOVE_EVENT = -1
 
+_tkinter = None # (tk, filedialog) once imported, False if tkinter is not installed
+
+# File dialog choices; the first entry's extension is the default
+MAP_FILETYPES = [("JSON files", "*.json"), ("JSON lines", "*.jsonl"), ("All files", "*.*")]
+GRID_FILETYPES = [("Tiled maps", "*.tmx"), ("ASCII art", "*.txt"), ("CSV grids", "*.csv"), ("All files", "*.*")]
+
+def load_tkinter():
+    """Imports tkinter for the native file dialogs on first use; it is slow to import."""
+    global _tkinter
+    if _tkinter is None:
+        try:
+            import tkinter as tk
+            from tkinter import filedialog
+            _tkinter = (tk, filedialog)
+        except ImportError:
+            _tkinter = False
+    return _tkinter
+
 class EventHandler:
     def __init__(self, app):
         self.app = app
+        # Latest (screen_pos, button) of a paint/erase drag, applied once per frame by flush_stroke()
+        self.pending_stroke = None
+        # A session_replay.SessionRecorder that sees every frame's events, if recording
+        self.recorder = None
 
-    def handle_events(self):
-        for event in pygame.event.get():
+    def handle_events(self, events=None):
+        """Handles one frame of events: the pygame queue, or `events` when replaying a session."""
+        if events is None:
+            events = pygame.event.get()
+        if self.recorder:
+            self.recorder.record_frame(events)
+        for event in events:
+            if hasattr(event, 'pos'):
+                self.app.mouse_pos = event.pos
+            # Motion is coalesced; anything else must see the stroke so far applied first.
+            if self.pending_stroke and event.type != pygame.MOUSEMOTION:
+                self.flush_stroke()
             if event.type == pygame.QUIT:
                 self.app.running = False
             elif event.type == pygame.VIDEORESIZE:
@@ -34,6 +59,9 @@ class EventHandler:
             # Handle the custom UDP event
             elif event.type == REMOTE_MOVE_EVENT:
                 self.app.handle_remote_command(event.command)
+                self.app.net_stats.record_command()
+                if hasattr(event, 'received_at'):
+                    self.app.net_stats.record_latency('receive_to_apply', time.perf_counter() - event.received_at)
                 continue
             
             # Prioritize dialogs and text input over other events
@@ -58,12 +86,42 @@ class EventHandler:
                 self.handle_mouse_motion(event)
             elif event.type == pygame.KEYDOWN:
                 self.handle_key_down(event)
+        self.flush_stroke()
+
+    def flush_stroke(self):
+        """
+        Paints or erases the line from the last marked cell to the latest drag position.
+        All motion events of a frame end up in one segment, which is rasterized so fast
+        drags leave no gaps, and is applied as one batch.
+        """
+        if not self.pending_stroke:
+            return
+        screen_pos, button = self.pending_stroke
+        self.pending_stroke = None
+        end = self.app.screen_to_grid(*screen_pos)
+        if not end or end == self.app.last_marked_cell:
+            return
+        start = self.app.last_marked_cell or end
+        self.app.region_editor.paint(grid_line(start, end), button)
+        self.app.last_marked_cell = end
+
+    def _in_map_area(self, pos) -> bool:
+        layout = self.app.ui_manager.layout
+        layout.update()
+        return pos[1] > layout.map_top
 
     def handle_mouse_down(self, event):
         mods = pygame.key.get_mods()
+        edge_tool = self.app.edge_editor.tool is not None and self._in_map_area(event.pos)
         if event.button == 1: # Left click
             if self.handle_ui_click(event.pos):
                 return
+
+            # Paint walls/doors with the edge tool (B)
+            if edge_tool and not mods & (pygame.KMOD_SHIFT | pygame.KMOD_ALT | pygame.KMOD_CTRL):
+                self.app.left_mouse_down = True
+                self.app.edge_editor.stroke_to(event.pos)
+                return
             
             # Check for starting a move operation
             if mods & pygame.KMOD_ALT:
@@ -81,6 +139,8 @@ class EventHandler:
             elif mods & pygame.KMOD_CTRL:
                 self.app.left_mouse_down = True
                 self.app.handle_click(event.pos, button=1, is_drag=False)
+                if self._in_map_area(event.pos):
+                    self.app.last_marked_cell = self.app.screen_to_grid(*event.pos)
             # Simple Left Click to select
             else:
                 grid_pos = self.app.screen_to_grid(*event.pos)
@@ -88,11 +148,16 @@ class EventHandler:
                     self.app.selected_cells.clear()
                     self.app.selected_cells.add(grid_pos)
 
+        elif event.button == 3 and edge_tool: # Erase walls/doors
+            self.app.right_mouse_down = True
+            self.app.edge_editor.stroke_to(event.pos, erase=True)
         elif event.button == 3: # Right click
             if not (mods & pygame.KMOD_SHIFT): # Don't erase if starting a selection
                 self.app.selected_cells.clear()
             self.app.right_mouse_down = True
             self.app.handle_click(event.pos, button=3, is_drag=False)
+            if self._in_map_area(event.pos):
+                self.app.last_marked_cell = self.app.screen_to_grid(*event.pos)
         elif event.button == 2: # Middle click
             self.app.dragging = True
             self.app.drag_start_pos = event.pos
@@ -129,10 +194,12 @@ class EventHandler:
             self.app.left_mouse_down = False
             self.app.last_marked_cell = None
             self.app.save_state()
+            self.app.edge_editor.end_stroke()
         elif event.button == 3:
             self.app.right_mouse_down = False
             self.app.last_marked_cell = None
             self.app.save_state()
+            self.app.edge_editor.end_stroke()
         elif event.button == 2:
             self.app.dragging = False
 
@@ -142,18 +209,14 @@ class EventHandler:
 
     def handle_mouse_motion(self, event):
         mods = pygame.key.get_mods()
+        if self.app.edge_editor.stroke is not None and self._in_map_area(event.pos):
+            self.app.edge_editor.stroke_to(event.pos, erase=self.app.right_mouse_down)
         # Only drag-draw if CTRL is held
-        if self.app.left_mouse_down and (mods & pygame.KMOD_CTRL) and not self.app.multi_select_mode and event.pos[1] > config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT + (config.ICON_PANEL_HEIGHT if self.app.show_icon_panel else 0):
-            grid_pos = self.app.screen_to_grid(*event.pos)
-            if grid_pos and grid_pos != self.app.last_marked_cell:
-                # Directly call handle_click for drag-drawing to process one cell at a time
-                self.app.handle_click(event.pos, button=1, is_drag=True)
-                self.app.last_marked_cell = grid_pos
-        elif self.app.right_mouse_down and not self.app.multi_select_mode and event.pos[1] > config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT + (config.ICON_PANEL_HEIGHT if self.app.show_icon_panel else 0):
-            grid_pos = self.app.screen_to_grid(*event.pos)
-            if grid_pos and grid_pos != self.app.last_marked_cell:
-                self.app.handle_click(event.pos, button=3, is_drag=True)
-                self.app.last_marked_cell = grid_pos
+        elif self.app.left_mouse_down and (mods & pygame.KMOD_CTRL) and not self.app.multi_select_mode and self._in_map_area(event.pos):
+            # Drawn by flush_stroke() once the frame's events are processed
+            self.pending_stroke = (event.pos, 1)
+        elif self.app.right_mouse_down and not self.app.multi_select_mode and self._in_map_area(event.pos):
+            self.pending_stroke = (event.pos, 3)
         elif self.app.dragging:
             dx = (event.pos[0] - self.app.drag_start_pos[0]) / (config.CELL_SIZE * self.app.zoom)
             dy = (event.pos[1] - self.app.drag_start_pos[1]) / (config.CELL_SIZE * self.app.zoom)
@@ -171,6 +234,13 @@ class EventHandler:
             elif event.key == pygame.K_y: self.app.redo()
             elif event.key == pygame.K_s: self.app.trigger_save()
             elif event.key == pygame.K_l: self.app.trigger_load()
+            elif event.key == pygame.K_c: self.app.region_editor.copy(self.app.selected_cells)
+            elif event.key == pygame.K_x:
+                self.app.region_editor.cut(self.app.selected_cells)
+            elif event.key == pygame.K_v:
+                grid_pos = self.app.screen_to_grid(*self.app.mouse_pos)
+                if grid_pos:
+                    self.app.selected_cells = self.app.region_editor.paste(grid_pos)
             return
 
         # Movement and Camera
@@ -201,18 +271,42 @@ class EventHandler:
 
         # Icon selection
         elif pygame.K_0 <= event.key <= pygame.K_9:
-            icon_map = [IconType.NONE, IconType.ENTRANCE, IconType.CHEST, IconType.LOCKED_DOOR,
-                        IconType.STAIRS_UP, IconType.STAIRS_DOWN, IconType.BOSS, IconType.NPC,
-                        IconType.SWITCH, IconType.TRAP]
-            self.app.selected_icon = icon_map[event.key - pygame.K_0]
+            self.app.selected_icon = PANEL_ICONS[event.key - pygame.K_0][0]
 
         # Other actions
         elif event.key == pygame.K_l: self.app.start_labelling()
         elif event.key == pygame.K_F11: self.app.toggle_fullscreen()
+        elif event.key == pygame.K_F2: self.app.show_net_stats = not self.app.show_net_stats
+        elif event.key == pygame.K_F3:
+            if mods & pygame.KMOD_SHIFT:
+                print(f"Frame samples written to {self.app.perf_hud.dump_csv()}")
+            else:
+                self.app.perf_hud.toggle()
+        elif event.key == pygame.K_F4: self.app.profile_capture.toggle()
+        elif event.key == pygame.K_F6: self.app.toggle_second_view()
+        elif event.key == pygame.K_F7: self.app.print_unsaved_changes()
         elif event.key == pygame.K_k: self.app.toggle_lock_on_selection()
         elif event.key == pygame.K_p: self.app.toggle_player_mode()
-        elif event.key == pygame.K_e: self.app.apply_icon_to_selection(button=1)
+        elif event.key == pygame.K_e:
+            self.app.apply_icon_to_selection(button=1)
+            self.app.save_state()
+        elif event.key == pygame.K_f:
+            grid_pos = self.app.screen_to_grid(*self.app.mouse_pos)
+            if grid_pos:
+                self.app.region_editor.flood_fill(grid_pos, self.app.selected_icon)
+        elif event.key == pygame.K_DELETE: self.app.region_editor.clear(self.app.selected_cells)
+        elif event.key == pygame.K_r:
+            self.app.selected_cells = self.app.region_editor.rotate(self.app.selected_cells, clockwise=not (mods & pygame.KMOD_SHIFT))
+        elif event.key == pygame.K_m:
+            self.app.selected_cells = self.app.region_editor.mirror(self.app.selected_cells, horizontal=not (mods & pygame.KMOD_SHIFT))
         elif event.key == pygame.K_h: self.app.warp_to_entrance()
+        elif event.key == pygame.K_b: self.app.edge_editor.cycle_tool()
+        elif event.key == pygame.K_t: self.app.renderer.labels.toggle()
+        elif event.key == pygame.K_g: self.app.show_heat_map = not self.app.show_heat_map
+        elif event.key == pygame.K_o:
+            self.app.show_ghost_floors = not self.app.show_ghost_floors
+            if not self.app.show_ghost_floors:
+                self.app.renderer.ghosts.clear()
 
     def handle_dialog_input(self, event):
         if event.key == pygame.K_ESCAPE:
@@ -230,8 +324,8 @@ class EventHandler:
     def handle_label_input(self, event):
         if event.key == pygame.K_RETURN:
             if len(self.app.selected_cells) == 1:
-                cell = self.app.get_cell(*list(self.app.selected_cells)[0])
-                cell.label = self.app.input_text
+                grid_pos = list(self.app.selected_cells)[0]
+                self.app.region_editor.set_label(grid_pos, self.app.input_text)
             self.app.input_mode = False
             self.app.input_text = ""
         elif event.key == pygame.K_ESCAPE:
@@ -243,19 +337,27 @@ class EventHandler:
             self.app.input_text += event.unicode
 
     def handle_ui_click(self, pos):
-        # Menu bar
-        if config.TITLE_BAR_HEIGHT <= pos[1] < config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT:
-            self.handle_menu_bar_click(pos)
+        """Handles a left click on the menu bar, an open dropdown or the icon panel. Returns True if it was one."""
+        layout = self.app.ui_manager.layout
+        layout.update()
+        band = layout.band(pos)
+        widget = layout.hit(pos)
+        if band == 'menu':
+            if widget:
+                self.app.active_menu = widget.value if self.app.active_menu != widget.value else None
+            else:
+                self.app.active_menu = None
             return True
-        # Dropdown menus
-        if self.app.active_menu:
-            if self.handle_dropdown_click(pos):
-                return True
-        # Icon panel
-        if self.app.show_icon_panel and config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT <= pos[1] <= config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT + config.ICON_PANEL_HEIGHT:
-            self.handle_icon_panel_click(pos)
+        if band == 'dropdown':
+            self.app.active_menu = None
+            if widget:
+                self.run_menu_action(widget.value)
             return True
-        
+        if band == 'icons':
+            if widget:
+                self.app.selected_icon = widget.value
+            return True
+
         # If a click happened but not on a UI element, close any open menus
         if self.app.active_menu:
             self.app.active_menu = None
@@ -263,94 +365,53 @@ class EventHandler:
         if not (pygame.key.get_mods() & pygame.KMOD_SHIFT): self.app.selected_cells.clear()
         return False
 
-    def handle_menu_bar_click(self, pos):
-        pos = (pos[0], pos[1] - config.TITLE_BAR_HEIGHT) # Adjust y-coordinate for this bar
-        file_text_width = config.SMALL_FONT.render("File", True, config.TEXT_COLOR).get_width()
-        help_text_width = config.SMALL_FONT.render("Help", True, config.TEXT_COLOR).get_width()
-        
-        file_menu_end = 10 + file_text_width + 10
-        help_menu_start = file_menu_end + 10
-        help_menu_end = help_menu_start + help_text_width + 10
-
-        if 10 <= pos[0] <= file_menu_end:
-            self.app.active_menu = 'file' if self.app.active_menu != 'file' else None
-        elif help_menu_start <= pos[0] <= help_menu_end:
-            self.app.active_menu = 'help' if self.app.active_menu != 'help' else None
-        else:
-            self.app.active_menu = None
-
-    def handle_dropdown_click(self, pos):
-        if self.app.active_menu == 'file':
-            dropdown_y = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-            items = ["New Map", "Save (Ctrl+S)", "Save As...", "Load (Ctrl+L)", "Quit"]
-            if 10 <= pos[0] <= 160 and dropdown_y <= pos[1] <= dropdown_y + len(items) * 25 + 10:
-                item_index = (pos[1] - dropdown_y - 5) // 25
-                if item_index == 0: self.app.new_map()
-                elif item_index == 1: self.app.trigger_save()
-                elif item_index == 2: self.trigger_save_as_with_dialog()
-                elif item_index == 3: self.app.trigger_load()
-                elif item_index == 4: self.app.running = False
-                self.app.active_menu = None
-                return True
-        elif self.app.active_menu == 'help':
-            file_text_width = config.SMALL_FONT.render("File", True, config.TEXT_COLOR).get_width()
-            dropdown_y = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-            dropdown_x = 10 + file_text_width + 20
-            items = ["Hotkeys", "About"]
-            if dropdown_x <= pos[0] <= dropdown_x + 150 and dropdown_y <= pos[1] <= dropdown_y + len(items) * 25 + 10:
-                item_index = (pos[1] - dropdown_y - 5) // 25
-                if item_index == 0: self.app.show_hotkeys_dialog = True
-                elif item_index == 1: self.app.show_about_dialog = True
-                self.app.active_menu = None
-                return True
-        return False
+    def run_menu_action(self, action: str):
+        """Performs a dropdown item's action (see ui_layout.MENUS)."""
+        if action == 'new_map': self.app.new_map()
+        elif action == 'save': self.app.trigger_save()
+        elif action == 'save_as': self.trigger_save_as_with_dialog()
+        elif action == 'load': self.app.trigger_load()
+        elif action == 'import_grid': self.trigger_load_with_dialog(GRID_FILETYPES)
+        elif action == 'export_grid': self.trigger_save_as_with_dialog(GRID_FILETYPES)
+        elif action == 'export_png': self.app.export_png()
+        elif action == 'quit': self.app.running = False
+        elif action == 'hotkeys': self.app.show_hotkeys_dialog = True
+        elif action == 'about': self.app.show_about_dialog = True
 
-    def handle_icon_panel_click(self, pos):
-        """Handles clicks on the icon panel to select an icon."""
-        icon_list = [
-            IconType.NONE, IconType.ENTRANCE, IconType.CHEST, IconType.LOCKED_DOOR,
-            IconType.STAIRS_UP, IconType.STAIRS_DOWN, IconType.BOSS, IconType.NPC,
-            IconType.SWITCH, IconType.TRAP
-        ]
-        icon_x = 10
-        icon_size = 40
-        icon_spacing = 5
-        panel_y = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-
-        if panel_y + 5 <= pos[1] <= panel_y + 5 + icon_size:
-            for icon_type in icon_list:
-                if icon_x <= pos[0] <= icon_x + icon_size:
-                    self.app.selected_icon = icon_type
-                    return # Found the clicked icon
-                icon_x += icon_size + icon_spacing
-
-    def trigger_save_as_with_dialog(self):
-        if HAS_TKINTER:
+    def trigger_save_as_with_dialog(self, filetypes=MAP_FILETYPES):
+        """Asks for a file to save to; with GRID_FILETYPES, save_map exports by extension."""
+        initialfile = "dungeon_map" + filetypes[0][1][1:]
+        tkinter = load_tkinter()
+        if tkinter:
+            tk, filedialog = tkinter
             root = tk.Tk()
             root.withdraw()
             filepath = filedialog.asksaveasfilename(
-                defaultextension=".json",
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
-                initialfile="dungeon_map.json"
+                defaultextension=filetypes[0][1][1:],
+                filetypes=filetypes,
+                initialfile=initialfile
             )
             root.destroy()
             if filepath:
                 self.app.save_map(filepath)
         else:
             self.app.show_save_dialog = True
-            self.app.file_dialog_text = "dungeon_map.json"
+            self.app.file_dialog_text = initialfile
 
-    def trigger_load_with_dialog(self):
-        if HAS_TKINTER:
+    def trigger_load_with_dialog(self, filetypes=MAP_FILETYPES):
+        """Asks for a file to load; with GRID_FILETYPES, load_map imports by extension."""
+        tkinter = load_tkinter()
+        if tkinter:
+            tk, filedialog = tkinter
             root = tk.Tk()
             root.withdraw()
             filepath = filedialog.askopenfilename(
-                defaultextension=".json",
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+                defaultextension=filetypes[0][1][1:],
+                filetypes=filetypes
             )
             root.destroy()
             if filepath:
                 self.app.load_map(filepath)
         else:
             self.app.show_load_dialog = True
-            self.app.file_dialog_text = "dungeon_map.json"
+            self.app.file_dialog_text = "dungeon_map" + filetypes[0][1][1:]
@@ -1,72 +1,230 @@
+import base64
+import hashlib
 import json
 import os
-from typing import Dict, Tuple
+from typing import Dict, Iterable, Iterator, MutableMapping, Tuple
 
-from data_models import Cell, IconType
+from data_models import CHUNK_SIZE, Cell, EdgeLayer, Floor, IconType
 import config
 
-def save_map_data(filename: str, floors: Dict[int, Dict[Tuple[int, int], Cell]], current_floor: int, current_pos: Tuple[int, int], rotation: int):
-    """Save the current map to a file."""
+# Maps are saved as one JSON document (.json, the default) or as JSON lines
+# (.jsonl): a header line followed by one line per floor, which can be read and
+# written one floor at a time.
+JSONL_FORMAT = "crawltographer-map"
+JSONL_VERSION = 1
+
+def _absolute(filename: str) -> str:
     if not os.path.isabs(filename):
         filename = os.path.join(os.getcwd(), filename)
+    return filename
+
+def _is_jsonl(filename: str) -> bool:
+    return filename.lower().endswith(".jsonl")
+
+class SavedCells(dict):
+    """
+    One floor in its saved form: "x,y" -> cell, as written by encode_cells and yielded
+    by read_map_stream. The floor's walls and doors (see encode_edges) ride along in
+    `edges`, so code that only looks at cells can treat it as a plain dict.
+    """
+    def __init__(self, cells=(), edges: Dict[str, str] = None):
+        super().__init__(cells)
+        self.edges = edges or {}
+
+class SavedLine(bytes):
+    """
+    One floor already in its .jsonl form (the whole line, newline included). save_map_stream
+    writes it out as is, so an unchanged floor can be copied from the previous file
+    instead of being encoded again.
+    """
+
+def encode_edges(edges: EdgeLayer) -> Dict[str, str]:
+    """The saved form of a floor's edges: "cx,cy" -> base64 of the chunk's edge masks."""
+    return {f"{cx},{cy}": base64.b64encode(bytes(masks)).decode('ascii')
+            for (cx, cy), masks in sorted(edges.chunks.items())}
+
+def decode_edges(saved: Dict[str, str], edges: EdgeLayer = None) -> EdgeLayer:
+    """Fills `edges` (a new EdgeLayer by default) from encode_edges output."""
+    edges = EdgeLayer() if edges is None else edges
+    for key, data in saved.items():
+        cx, cy = map(int, key.split(','))
+        masks = base64.b64decode(data, validate=True)
+        if len(masks) != CHUNK_SIZE * CHUNK_SIZE:
+            raise ValueError(f"edge chunk {key} has {len(masks)} cells, not {CHUNK_SIZE * CHUNK_SIZE}")
+        edges.set_chunk((cx, cy), masks)
+    return edges
 
+def encode_cells(cells: Dict[Tuple[int, int], Cell]) -> SavedCells:
+    """The saved form of one floor's cells (and edges, for a Floor)."""
+    encoded = SavedCells()
+    edges = getattr(cells, "edges", None)
+    if edges:
+        encoded.edges = encode_edges(edges)
+    for (x, y), cell in cells.items():
+        # Save the cell if it's explored OR if it's locked
+        if cell.explored or cell.locked:
+            encoded[f"{x},{y}"] = {
+                "explored": cell.explored, # Explicitly save explored state
+                "icon": cell.icon.value,
+                "label": cell.label,
+                "locked": cell.locked
+            }
+    return encoded
+
+def decode_cells(cells: Dict[str, dict]) -> Floor:
+    """Builds a Floor from the saved form of its cells (and edges, for SavedCells)."""
+    floor = Floor()
+    decode_edges(getattr(cells, "edges", {}), floor.edges)
+    for pos_str, cell_data in cells.items():
+        x, y = map(int, pos_str.split(','))
+        # Pass data as kwargs to the Cell constructor
+        loaded_cell_data = {
+            "explored": cell_data.get("explored", True),
+            "icon": IconType(cell_data["icon"]),
+            "label": cell_data.get("label", ""),
+            "locked": cell_data.get("locked", False) # Default to False if not in file
+        }
+        floor[(x, y)] = Cell(**loaded_cell_data)
+    return floor
+
+def save_map_stream(filename: str, header: Dict, floors: Iterable[Tuple[int, Dict[Tuple[int, int], Cell]]]) -> Dict[int, Tuple[int, int]]:
+    """
+    Writes a map from `header` (current_floor, current_pos, rotation) and an iterable of
+    (floor number, cells). A .jsonl file is written one floor at a time, so `floors` can be
+    a generator and only one floor needs to be in memory. For .jsonl, `cells` may also be
+    a SavedLine, and the result is each floor's line as (byte offset, length).
+
+    The map is written to a temporary file that then replaces `filename`, so the old
+    file stays readable (and intact, if writing fails) until the new one is complete.
+    """
+    filename = _absolute(filename)
     os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temporary = filename + ".tmp"
+
+    if _is_jsonl(filename):
+        lines = {}
+        with open(temporary, 'wb') as f:
+            f.write(json.dumps({"format": JSONL_FORMAT, "version": JSONL_VERSION,
+                                "current_floor": header["current_floor"],
+                                "current_pos": list(header["current_pos"]),
+                                "rotation": header["rotation"]}).encode('utf-8') + b"\n")
+            for floor, cells in floors:
+                if isinstance(cells, SavedLine):
+                    line = cells
+                else:
+                    encoded = encode_cells(cells)
+                    entry = {"floor": floor, "cells": encoded}
+                    if encoded.edges:
+                        entry["edges"] = encoded.edges
+                    line = json.dumps(entry).encode('utf-8') + b"\n"
+                lines[floor] = (f.tell(), len(line))
+                f.write(line)
+        os.replace(temporary, filename)
+        return lines
 
     data = {
         "floors": {},
-        "current_floor": current_floor,
-        "current_pos": current_pos,
-        "rotation": rotation
+        "current_floor": header["current_floor"],
+        "current_pos": header["current_pos"],
+        "rotation": header["rotation"]
     }
-
-    for floor, cells in floors.items():
-        data["floors"][str(floor)] = {}
-        for (x, y), cell in cells.items():
-            # Save the cell if it's explored OR if it's locked
-            if cell.explored or cell.locked:
-                data["floors"][str(floor)][f"{x},{y}"] = {
-                    "explored": cell.explored, # Explicitly save explored state
-                    "icon": cell.icon.value,
-                    "label": cell.label,
-                    "locked": cell.locked
-                }
-
-    with open(filename, 'w') as f:
+    for floor, cells in floors:
+        encoded = encode_cells(cells)
+        data["floors"][str(floor)] = encoded
+        if encoded.edges:
+            data.setdefault("edges", {})[str(floor)] = encoded.edges
+    with open(temporary, 'w') as f:
         json.dump(data, f, indent=2)
-    print(f"Map saved to {filename}")
+    os.replace(temporary, filename)
+    return {}
 
-def load_map_data(filename: str) -> Dict:
-    """Load a map from a file and return its data."""
-    if not os.path.isabs(filename):
-        filename = os.path.join(os.getcwd(), filename)
+def read_map_stream(filename: str) -> Tuple[Dict, Iterator[Tuple[int, Dict[str, dict]]]]:
+    """
+    Opens a saved map and returns its header (current_floor, current_pos, rotation) and
+    an iterator of (floor number, saved cells) in file order. A .jsonl file is read one
+    floor at a time; a .json file has to be parsed whole first.
 
-    try:
-        with open(filename, 'r') as f:
-            data = json.load(f)
-
-        loaded_data = {
-            "floors": {},
-            "current_floor": data.get("current_floor", 0),
-            "current_pos": tuple(data.get("current_pos", (config.GRID_SIZE // 2, config.GRID_SIZE // 2))),
-            "rotation": data.get("rotation", 0),
+    Raises OSError or ValueError (including json.JSONDecodeError) for unreadable files.
+    """
+    filename = _absolute(filename)
+    default_pos = (config.GRID_SIZE // 2, config.GRID_SIZE // 2)
+
+    if _is_jsonl(filename):
+        f = open(filename, 'r')
+        try:
+            first = json.loads(f.readline() or "null")
+        except ValueError:
+            f.close()
+            raise
+        if not isinstance(first, dict) or first.get("format") != JSONL_FORMAT:
+            f.close()
+            raise ValueError(f"{filename} is not a {JSONL_FORMAT} file")
+        header = {
+            "current_floor": first.get("current_floor", 0),
+            "current_pos": tuple(first.get("current_pos", default_pos)),
+            "rotation": first.get("rotation", 0),
         }
 
-        for floor_str, cells in data["floors"].items():
-            floor = int(floor_str)
-            loaded_data["floors"][floor] = {}
-            for pos_str, cell_data in cells.items():
-                x, y = map(int, pos_str.split(','))
-                # Pass data as kwargs to the Cell constructor
-                loaded_cell_data = {
-                    "explored": True,
-                    "icon": IconType(cell_data["icon"]),
-                    "label": cell_data.get("label", ""),
-                    "locked": cell_data.get("locked", False) # Default to False if not in file
-                }
-                loaded_data["floors"][floor][(x, y)] = Cell(**loaded_cell_data)
+        def floors():
+            with f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        yield int(entry["floor"]), SavedCells(entry["cells"], entry.get("edges"))
+        return header, floors()
+
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or "floors" not in data:
+        raise ValueError(f"{filename} has no floors")
+    header = {
+        "current_floor": data.get("current_floor", 0),
+        "current_pos": tuple(data.get("current_pos", default_pos)),
+        "rotation": data.get("rotation", 0),
+    }
+    edges = data.get("edges", {})
+    return header, ((int(floor), SavedCells(cells, edges.get(floor))) for floor, cells in data["floors"].items())
 
+def save_map_data(filename: str, floors: Dict[int, Dict[Tuple[int, int], Cell]], current_floor: int, current_pos: Tuple[int, int], rotation: int):
+    """Save the current map to a file (.jsonl for JSON lines, otherwise JSON)."""
+    header = {"current_floor": current_floor, "current_pos": current_pos, "rotation": rotation}
+    save_map_stream(filename, header, floors.items())
+    print(f"Map saved to {_absolute(filename)}")
+
+def load_map_data(filename: str, floors: MutableMapping = None) -> Dict:
+    """
+    Load a map from a file and return its data, with each floor as a data_models.Floor.
+    Floors are added one at a time to `floors` (a new dict by default), so a
+    floor_store.FloorStore can spill them as they arrive.
+    """
+    filename = _absolute(filename)
+    floors = {} if floors is None else floors
+    try:
+        header, stream = read_map_stream(filename)
+        for floor, cells in stream:
+            floors[floor] = decode_cells(cells)
+        loaded_data = dict(header, floors=floors)
         print(f"Map loaded from {filename}")
         return loaded_data
-    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+    except (OSError, ValueError, KeyError, TypeError) as e:
         print(f"Error loading map from {filename}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def map_state_hash(floors: Dict[int, Dict[Tuple[int, int], Cell]], current_floor: int, current_pos: Tuple[int, int], rotation: int) -> str:
+    """
+    Returns a SHA-256 hex digest of everything save_map_data would write.
+
+    Two maps with the same hash save to the same file, so it can be used to check that
+    a replayed session or a stress test ended in the expected state.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{current_floor};{current_pos[0]},{current_pos[1]};{rotation}\n".encode('utf-8'))
+    for floor in sorted(floors):
+        digest.update(f"floor {floor}\n".encode('utf-8'))
+        for (x, y), cell in sorted(floors[floor].items()):
+            if cell.explored or cell.locked:
+                digest.update(f"{x},{y};{int(cell.explored)};{cell.icon.value};{int(cell.locked)};{cell.label}\n".encode('utf-8'))
+        edges = getattr(floors[floor], "edges", None)
+        for (cx, cy), masks in sorted(edges.chunks.items()) if edges else ():
+            digest.update(f"edges {cx},{cy};".encode('utf-8') + bytes(masks) + b"\n")
+    return digest.hexdigest()
@@ -0,0 +1,151 @@
+"""
+Export floors to PNG images.
+
+Each floor becomes one image at a chosen cell size, drawn with the same
+Renderer.draw_icon/draw_lock_icon/draw_cell_edges code as the map view. Images are rendered in tiles
+of TILE_CELLS x BAND_CELLS cells on one reused surface and streamed to the PNG encoder
+one band (a row of tiles) at a time, so memory depends on the floor's width, not its
+area. Floors are spread over a process pool.
+
+    python -m map_tool png dungeon.json --out-dir png/ --cell-size 32 --jobs 8
+
+In the mapper, File > Export PNG writes the open map next to its file.
+"""
+import multiprocessing
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from data_models import IconType
+from file_manager import decode_cells, read_map_stream
+
+DEFAULT_CELL_SIZE = 32
+TILE_CELLS = 64      # Tile width, in cells
+BAND_CELLS = 16      # Tile height, in cells
+MARGIN_CELLS = 1     # Empty border around the floor's bounds
+PNG_COMPRESSION = 3  # zlib level: most of the size reduction of the default (6) at about half the time
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+class PNGStreamWriter:
+    """Writes an RGB PNG row by row, compressing as it goes."""
+    def __init__(self, path: str, width: int, height: int):
+        self.file = open(path, 'wb')
+        self.width = width
+        self.compressor = zlib.compressobj(PNG_COMPRESSION)
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self.file.write(_png_chunk(b'IHDR', struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+
+    def write_rows(self, rgb: bytes):
+        """Appends whole rows of packed RGB pixels."""
+        stride = self.width * 3
+        raw = bytearray()
+        for start in range(0, len(rgb), stride):
+            raw.append(0) # Filter type: none
+            raw += rgb[start:start + stride]
+        data = self.compressor.compress(bytes(raw))
+        if data:
+            self.file.write(_png_chunk(b'IDAT', data))
+
+    def close(self):
+        self.file.write(_png_chunk(b'IDAT', self.compressor.flush()))
+        self.file.write(_png_chunk(b'IEND', b''))
+        self.file.close()
+
+def render_floor_png(cells, path: str, cell_size: int = DEFAULT_CELL_SIZE) -> dict:
+    """
+    Renders one floor (saved cells as written by file_manager.encode_cells) to a PNG.
+    Returns the image size and the number of tiles drawn.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from renderer import Renderer
+
+    floor = decode_cells(cells)
+    bounds = floor.bounds() or (0, 0, 0, 0)
+    x0, y0 = bounds[0] - MARGIN_CELLS, bounds[1] - MARGIN_CELLS
+    cols = bounds[2] - bounds[0] + 1 + 2 * MARGIN_CELLS
+    rows = bounds[3] - bounds[1] + 1 + 2 * MARGIN_CELLS
+    width, height = cols * cell_size, rows * cell_size
+
+    tile = pygame.Surface((TILE_CELLS * cell_size, BAND_CELLS * cell_size))
+    renderer = Renderer(type("TileTarget", (), {"screen": tile})())
+    writer = PNGStreamWriter(path, width, height)
+    tiles = 0
+    try:
+        for band_row in range(0, rows, BAND_CELLS):
+            band_rows = min(BAND_CELLS, rows - band_row)
+            band_height = band_rows * cell_size
+            band = [bytearray() for _ in range(band_height)]
+            for band_col in range(0, cols, TILE_CELLS):
+                band_cols = min(TILE_CELLS, cols - band_col)
+                _draw_tile(renderer, tile, floor, x0 + band_col, y0 + band_row, band_cols, band_rows, cell_size)
+                tiles += 1
+                pixels = pygame.image.tostring(tile, "RGB")
+                stride = tile.get_width() * 3
+                used = band_cols * cell_size * 3
+                for row in range(band_height):
+                    band[row] += pixels[row * stride:row * stride + used]
+            writer.write_rows(b''.join(band))
+    finally:
+        writer.close()
+    return {'path': path, 'width': width, 'height': height, 'tiles': tiles}
+
+def _draw_tile(renderer, tile, floor, gx: int, gy: int, cols: int, rows: int, cell_size: int):
+    """Draws the cells gx..gx+cols-1, gy..gy+rows-1 onto the top-left of the tile surface."""
+    import pygame
+    tile.fill(config.BG_COLOR)
+    for i in range(cols + 1):
+        pygame.draw.line(tile, config.GRID_COLOR, (i * cell_size, 0), (i * cell_size, rows * cell_size))
+    for j in range(rows + 1):
+        pygame.draw.line(tile, config.GRID_COLOR, (0, j * cell_size), (cols * cell_size, j * cell_size))
+
+    for (x, y), cell in floor.cells_in_rect(gx, gy, gx + cols - 1, gy + rows - 1):
+        center_x = (x - gx) * cell_size + cell_size / 2
+        center_y = (y - gy) * cell_size + cell_size / 2
+        # Same layering as Renderer.draw_grid
+        if cell.explored:
+            bg_color = config.LABELED_CELL_COLOR if cell.label else config.EXPLORED_COLOR
+            rect = pygame.Rect((x - gx) * cell_size, (y - gy) * cell_size, cell_size, cell_size)
+            pygame.draw.rect(tile, bg_color, rect)
+            pygame.draw.rect(tile, config.GRID_COLOR, rect, 1)
+            if cell.icon != IconType.NONE:
+                renderer.draw_icon(cell.icon, center_x, center_y, cell_size)
+        if cell.locked:
+            renderer.draw_lock_icon(center_x, center_y, cell_size)
+
+    if len(floor.edges):
+        for y in range(gy, gy + rows):
+            for x in range(gx, gx + cols):
+                mask = floor.edges.get((x, y))
+                if mask:
+                    renderer.draw_cell_edges(tile, (x - gx) * cell_size, (y - gy) * cell_size, cell_size, mask)
+
+def _render_job(job):
+    floor, cells, path, cell_size = job
+    result = render_floor_png(cells, path, cell_size)
+    result['floor'] = floor
+    return result
+
+def export_floors(floors, out_dir: str, prefix: str, cell_size: int = DEFAULT_CELL_SIZE, jobs: int = None):
+    """
+    Renders (floor number, saved cells) pairs to <out_dir>/<prefix>_floor<N>.png, using a
+    process pool when jobs != 1. Returns one result dict per floor, in input order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    work = ((floor, cells, os.path.join(out_dir, f"{prefix}_floor{floor}.png"), cell_size) for floor, cells in floors)
+    if jobs == 1:
+        return [_render_job(job) for job in work]
+    # Workers are spawned rather than forked: the mapper calls this with a window open
+    # and several threads running, which a forked child should not inherit.
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(_render_job, work))
+
+def export_map_file(path: str, out_dir: str, cell_size: int = DEFAULT_CELL_SIZE, jobs: int = None):
+    """Exports every floor of a saved map file."""
+    _, floors = read_map_stream(path)
+    prefix = os.path.splitext(os.path.basename(path))[0]
+    return export_floors(floors, out_dir, prefix, cell_size, jobs)
@@ -0,0 +1,200 @@
+"""
+Floor residency: which floors of a map are kept in memory.
+
+DungeonMapper.floors is a FloorStore. It keeps the RESIDENT_FLOORS most recently used
+floors as data_models.Floor objects. Older floors are spilled to a private cache
+directory and loaded back the next time they are looked up. Memory therefore stays
+roughly flat however many floors a dungeon has, and callers use the store like a dict.
+
+A floor is only written out when it changed since it was last loaded, so moving back
+and forth between floors costs one read per visit. Empty floors are not written at all.
+The content hashes of spilled floors (see map_hash) stay in memory, so hashing or
+diffing the map does not load them.
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, Optional
+
+from data_models import Floor, IconType
+from map_hash import FloorHashes, floor_hashes
+
+# The current floor plus this many recently visited ones stay in memory
+RESIDENT_FLOORS = int(os.environ.get("CRAWLTOGRAPHER_RESIDENT_FLOORS", 4))
+SPILL_COMPRESSION = 1  # zlib level; spill files are short-lived, so speed matters more than size
+
+def _dump_floor(floor: Floor, path: str):
+    rows = [(x, y, cell.explored, cell.icon.value, cell.label, cell.locked) for (x, y), cell in floor.items()]
+    edges = {key: bytes(masks) for key, masks in floor.edges.chunks.items()}
+    with open(path, 'wb') as f:
+        f.write(zlib.compress(pickle.dumps((rows, edges), protocol=pickle.HIGHEST_PROTOCOL), SPILL_COMPRESSION))
+
+def _load_floor(path: str) -> Floor:
+    with open(path, 'rb') as f:
+        rows, edges = pickle.loads(zlib.decompress(f.read()))
+    floor = Floor()
+    floor.set_states(((x, y), (explored, IconType(icon), label, locked)) for x, y, explored, icon, label, locked in rows)
+    for key, masks in edges.items():
+        floor.edges.set_chunk(key, masks)
+    return floor
+
+def _revision(floor: Floor):
+    return (floor.version, floor.edges.version)
+
+class FloorStore(MutableMapping):
+    """
+    Floor number -> Floor, with at most `resident` floors in memory.
+
+    Looking a floor up makes it the most recently used. Adding or loading a floor may
+    spill the least recently used one. items() and values() do not change what is
+    resident: spilled floors are loaded for the iteration only, so treat them as
+    read-only there (save, export and hashing only read).
+    """
+    def __init__(self, floors=None, resident: int = None):
+        self.max_resident = max(1, resident or RESIDENT_FLOORS)
+        self.resident: "OrderedDict[int, Floor]" = OrderedDict()  # Least recently used first
+        self.spilled: Dict[int, Optional[str]] = {}  # floor -> spill file, None for an empty floor
+        self.counts: Dict[int, int] = {}  # Cell counts of spilled floors
+        self.versions: Dict[int, int] = {}  # Floor.version of spilled floors when they were spilled
+        self.clean: Dict[int, tuple] = {}  # floor -> its _revision() when it was loaded from its spill file
+        self.hashes: Dict[int, FloorHashes] = {}  # map_hash hashes of spilled floors that have them
+        self.cache_dir = None
+        self.faults = 0  # Floors loaded back from the cache
+        if floors:
+            for number, floor in floors.items():
+                self[number] = floor
+
+    def _path(self, number: int) -> str:
+        if self.cache_dir is None:
+            self.cache_dir = tempfile.mkdtemp(prefix="crawltographer-floors-")
+            weakref.finalize(self, shutil.rmtree, self.cache_dir, True)
+        return os.path.join(self.cache_dir, f"floor_{number}.bin")
+
+    def _spill(self, number: int):
+        floor = self.resident.pop(number)
+        if not len(floor) and not len(floor.edges):
+            path = None
+        elif self.clean.get(number) == _revision(floor):
+            path = self._path(number) # Unchanged since it was loaded; the file is still current
+        else:
+            path = self._path(number)
+            _dump_floor(floor, path)
+        self.clean.pop(number, None)
+        self.spilled[number] = path
+        self.counts[number] = len(floor)
+        self.versions[number] = floor.version
+        if floor.hashes is not None:
+            self.hashes[number] = floor.hashes.update(floor)
+
+    def _evict(self):
+        while len(self.resident) > self.max_resident:
+            self._spill(next(iter(self.resident)))
+
+    def _read_spilled(self, number: int) -> Floor:
+        path = self.spilled[number]
+        return _load_floor(path) if path else Floor()
+
+    def __getitem__(self, number: int) -> Floor:
+        floor = self.resident.get(number)
+        if floor is not None:
+            self.resident.move_to_end(number)
+            return floor
+        if number not in self.spilled:
+            raise KeyError(number)
+        floor = self._read_spilled(number)
+        del self.spilled[number], self.counts[number], self.versions[number]
+        self.clean[number] = _revision(floor)
+        hashes = self.hashes.pop(number, None)
+        if hashes is not None:
+            floor.hashes = hashes.rebase(floor)
+        self.faults += 1
+        self.resident[number] = floor
+        self._evict()
+        return floor
+
+    def __setitem__(self, number: int, floor: Floor):
+        self._forget(number)
+        self.resident[number] = floor
+        self._evict()
+
+    def __delitem__(self, number: int):
+        if number not in self:
+            raise KeyError(number)
+        self._forget(number)
+
+    def _forget(self, number: int):
+        self.resident.pop(number, None)
+        self.clean.pop(number, None)
+        self.counts.pop(number, None)
+        self.versions.pop(number, None)
+        self.hashes.pop(number, None)
+        path = self.spilled.pop(number, None)
+        if path:
+            os.remove(path)
+
+    def __contains__(self, number) -> bool:
+        return number in self.resident or number in self.spilled
+
+    def __len__(self) -> int:
+        return len(self.resident) + len(self.spilled)
+
+    def __iter__(self) -> Iterator[int]:
+        # A snapshot, so lookups during iteration can move floors in and out
+        return iter(list(self.resident) + list(self.spilled))
+
+    def touch(self, number: int) -> Floor:
+        """Makes a floor the most recently used, loading it back if it was spilled, and returns it."""
+        return self[number]
+
+    def peek(self, number: int) -> Floor:
+        """A floor without changing what is resident. Treat a spilled floor as read-only."""
+        floor = self.resident.get(number)
+        return floor if floor is not None else self._read_spilled(number)
+
+    def items(self):
+        for number in list(self):
+            if number in self:
+                yield number, self.peek(number)
+
+    def values(self):
+        for _, floor in self.items():
+            yield floor
+
+    def cell_count(self, number: int) -> int:
+        """The number of cells on a floor, without loading it."""
+        floor = self.resident.get(number)
+        return len(floor) if floor is not None else self.counts.get(number, 0)
+
+    def version(self, number: int) -> int:
+        """
+        A floor's Floor.version, without loading it. It changes whenever the floor does;
+        a spilled floor keeps the version it was spilled with until it is loaded back.
+        """
+        floor = self.resident.get(number)
+        return floor.version if floor is not None else self.versions[number]
+
+    def floor_hashes(self, number: int) -> FloorHashes:
+        """map_hash.floor_hashes of a floor. A spilled floor is only read if it was never hashed."""
+        floor = self.resident.get(number)
+        if floor is not None:
+            return floor_hashes(floor)
+        hashes = self.hashes.get(number)
+        if hashes is None:
+            hashes = self.hashes[number] = floor_hashes(self._read_spilled(number))
+        return hashes
+
+    def attach_hashes(self, number: int, hashes: FloorHashes):
+        """Takes `hashes` (e.g. from a map index) as those of the floor as it is now."""
+        floor = self.resident.get(number)
+        if floor is not None:
+            floor.hashes = hashes.rebase(floor)
+        elif number in self.spilled:
+            self.hashes[number] = hashes
+
+    def total_cells(self) -> int:
+        return sum(len(floor) for floor in self.resident.values()) + sum(self.counts.values())
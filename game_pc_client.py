@@ -1,15 +1,50 @@
 import time
+import queue
+import random
+import selectors
 import socket
 import threading
-from inputs import get_gamepad, UnpluggedError
+from collections import OrderedDict
+
+# Gamepad backends: evdev where available (Linux), otherwise the `inputs` package.
+# The sender below is also used without either (e.g. for loopback testing).
+try:
+    import evdev
+    from evdev import ecodes
+except ImportError:
+    evdev = None
+
+try:
+    import inputs
+    from inputs import UnpluggedError
+except ImportError:
+    inputs = None
+    UnpluggedError = OSError
+
+try:
+    from net_stats import NetStats, StatsWriter
+except ImportError:
+    NetStats = None
 
 # --- CONFIGURATION ---
 # >>> REPLACE THIS WITH THE ACTUAL LOCAL IP OF YOUR MAPPER PC <<<
-MAPPER_PC_IP = "192.168.1.213" 
+MAPPER_PC_IP = "192.168.1.213"
 MAPPER_PC_PORT = 5000
 
-ACK_TIMEOUT = 0.1 # 100ms
-COMMAND_COOLDOWN = 0.15 # 150ms cooldown. Adjust if needed.
+ACK_TIMEOUT = 0.1 # 100ms. Initial retransmit timeout, used until the first RTT sample arrives.
+# Minimum spacing between new transmissions. Commands are queued, not dropped, so any
+# cooldown delays every queued command; holding an input only sends one command anyway.
+COMMAND_COOLDOWN = 0.0
+WINDOW_SIZE = 8 # Maximum number of unacknowledged commands in flight.
+MIN_RTO = 0.02 # Lower bound for the retransmit timeout (20ms).
+MAX_RTO = 1.0 # Upper bound for the retransmit timeout after backoff.
+FAST_RETRANSMIT_DUP_ACKS = 2 # Repeated acks that trigger an immediate resend of the oldest command.
+MAX_TRANSMISSIONS = 15 # Sends of one command (about 10s at MAX_RTO) before the sender gives up and starts over.
+STATS_FILE = None # e.g. "client_net_stats.csv" to log RTT, retransmits and loss every STATS_INTERVAL seconds.
+STATS_INTERVAL = 5.0
+HOTPLUG_RESCAN_SECONDS = 1.0 # How often to look for newly connected controllers.
+INPUTS_RESCAN_SECONDS = 2.0 # With the `inputs` fallback, which must enumerate every device to find new ones.
+
 # Map controller input codes to the command strings expected by the mapper.
 COMMAND_MAP = {
     # D-Pad Y-axis: -1 for UP, 1 for DOWN
@@ -20,11 +55,218 @@ COMMAND_MAP = {
     'ABS_Z': lambda state: 'mark_cell' if state == 255 else None,
 }
 
+def parse_ack(message: bytes):
+    """(seq, mapper epoch) from an "ack;N;epoch" datagram (epoch None for "ack;N"), or None."""
+    parts = message.decode('utf-8', 'replace').split(';')
+    if len(parts) < 2 or parts[0] != 'ack':
+        return None
+    try:
+        return int(parts[1]), (parts[2] if len(parts) > 2 else None)
+    except ValueError:
+        return None
+
+class RttEstimator:
+    """Smoothed round-trip time and retransmit timeout, as in RFC 6298."""
+    def __init__(self, initial_rto=ACK_TIMEOUT):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+
+    def add_sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def backoff(self):
+        self.rto = min(MAX_RTO, self.rto * 2)
+
+class ReliableSender:
+    """
+    Sliding-window sender for "session;seq;command" datagrams.
+
+    Up to `window_size` commands may be unacknowledged at once. The mapper acks
+    cumulatively ("ack;N;epoch" means every command up to N has reached the mapper),
+    so a single ack can release several commands. This class is a plain state machine:
+    the caller feeds it commands and acks and calls `poll` when a timer expires.
+
+    Sequence numbers restart at 1 with every new session. A new session starts when
+    the mapper's epoch changes (the mapper restarted and lost track of this client),
+    with the unacknowledged commands sent again, and when a command goes unacked
+    MAX_TRANSMISSIONS times, with the commands waiting dropped.
+
+    Every `now` is time.monotonic(), so RTT and retransmit timeouts are not thrown
+    off when the wall clock is adjusted.
+    """
+    def __init__(self, sock, address, window_size: int = WINDOW_SIZE, verbose: bool = True, stats=None):
+        self.sock = sock
+        self.address = address
+        self.window_size = window_size
+        self.verbose = verbose
+        self.stats = stats
+        self.rtt = RttEstimator()
+        self.session = None
+        self.mapper_epoch = None  # Epoch of the mapper in the last ack
+        self.next_seq = 1
+        self.pending = []  # Commands waiting for space in the window
+        self.outstanding = OrderedDict()  # seq -> [command, first_sent, last_sent, transmissions]
+        self.last_send_time = 0.0
+        self.acked_seq = 0
+        self.dup_acks = 0
+        self._new_session()
+
+    def _new_session(self, resend: bool = False):
+        """Numbers commands from 1 again. Unacked commands are sent again if `resend`, otherwise dropped."""
+        unacked = [entry[0] for entry in self.outstanding.values()]
+        if resend:
+            self.pending[:0] = unacked
+        elif self.stats and unacked + self.pending:
+            self.stats.increment('dropped', len(unacked) + len(self.pending))
+        if not resend:
+            self.pending.clear()
+        self.outstanding.clear()
+        self.session = f"{random.getrandbits(32):08x}"
+        self.next_seq = 1
+        self.acked_seq = 0
+        self.dup_acks = 0
+
+    def submit(self, command: str, now: float):
+        self.pending.append(command)
+        self.poll(now)
+
+    def handle_ack(self, ack_seq: int, now: float, epoch: str = None):
+        """Releases every outstanding command up to and including `ack_seq`."""
+        if epoch is not None and epoch != self.mapper_epoch:
+            restarted = self.mapper_epoch is not None
+            self.mapper_epoch = epoch
+            if restarted:
+                if self.verbose:
+                    print("The mapper restarted; sending unacknowledged commands again")
+                self._new_session(resend=True)
+                self.poll(now)
+                return
+        ack_seq = min(ack_seq, self.next_seq - 1) # Never release commands that were not sent yet
+        if ack_seq < self.acked_seq:
+            return
+        if ack_seq == self.acked_seq:
+            # A repeated ack means a later command arrived while an earlier one is missing.
+            # Resend the missing one right away instead of waiting for its timer.
+            self.dup_acks += 1
+            if self.stats:
+                self.stats.increment('duplicate_acks')
+            if self.dup_acks == FAST_RETRANSMIT_DUP_ACKS and self.outstanding:
+                seq, entry = next(iter(self.outstanding.items()))
+                self._retransmit(seq, entry, now)
+                if self.stats:
+                    self.stats.increment('fast_retransmits')
+            return
+
+        in_order = self.dup_acks == 0
+        self.acked_seq = ack_seq
+        self.dup_acks = 0
+        while self.outstanding:
+            seq, entry = next(iter(self.outstanding.items()))
+            if seq > ack_seq:
+                break
+            del self.outstanding[seq]
+            # Karn's algorithm: only a command sent exactly once, and not held back
+            # behind a lost one, gives a usable RTT sample.
+            if seq == ack_seq and entry[3] == 1 and in_order:
+                self.rtt.add_sample(now - entry[1])
+                if self.stats:
+                    self.stats.record_latency('rtt', now - entry[1])
+            if self.stats:
+                # Time from first send until the command was known to be applied, retransmits included.
+                self.stats.record_latency('delivery', now - entry[1])
+        if self.stats:
+            self.stats.set_value('srtt_ms', round((self.rtt.srtt or 0) * 1000, 3))
+            self.stats.set_value('rto_ms', round(self.rtt.rto * 1000, 3))
+        self.poll(now)
+
+    def poll(self, now: float):
+        """Retransmits expired commands and fills the window. Returns seconds until the next deadline."""
+        rto = self.rtt.rto
+        timed_out = False
+        for seq, entry in self.outstanding.items():
+            if now - entry[2] >= rto and entry[3] >= MAX_TRANSMISSIONS:
+                print(f"No ack from the mapper after {entry[3]} tries; dropping "
+                      f"{len(self.outstanding) + len(self.pending)} command(s) and starting over")
+                self._new_session()
+                return self.next_deadline(now)
+            if now - entry[2] >= rto:
+                if self.verbose:
+                    print(f"Timeout, retransmitting '{entry[0]}' (Seq: {seq})")
+                self._retransmit(seq, entry, now)
+                timed_out = True
+        if timed_out:
+            self.rtt.backoff()
+
+        while self.pending and len(self.outstanding) < self.window_size:
+            if now - self.last_send_time < COMMAND_COOLDOWN:
+                break
+            command = self.pending.pop(0)
+            seq = self.next_seq
+            self.next_seq += 1
+            if self.verbose:
+                print(f"Sending: '{command}' (Seq: {seq})")
+            self._transmit(seq, command)
+            self.outstanding[seq] = [command, now, now, 1]
+            self.last_send_time = now
+            if self.stats:
+                self.stats.record_command()
+
+        return self.next_deadline(now)
+
+    def next_deadline(self, now: float):
+        deadlines = [entry[2] + self.rtt.rto - now for entry in self.outstanding.values()]
+        if self.pending and len(self.outstanding) < self.window_size:
+            deadlines.append(self.last_send_time + COMMAND_COOLDOWN - now)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines))
+
+    def _retransmit(self, seq: int, entry: list, now: float):
+        if self.stats:
+            self.stats.increment('retransmits')
+            if entry[3] == 1:
+                self.stats.increment('lost') # First time this command had to be resent
+        self._transmit(seq, entry[0])
+        entry[2] = now
+        entry[3] += 1
+
+    def _transmit(self, seq: int, command: str):
+        self.sock.sendto(f"{self.session};{seq};{command}".encode('utf-8'), self.address)
+
+    def run(self, event_queue: "queue.Queue"):
+        """
+        Drives the sender from a queue of ('command', str) and ('ack', (seq, epoch)) items.
+        Input reading and ack reception happen on other threads and only ever
+        touch the queue, so no locking is needed here.
+        """
+        timeout = None
+        while True:
+            try:
+                kind, value = event_queue.get(timeout=timeout)
+            except queue.Empty:
+                kind = None
+            now = time.monotonic()
+            if kind == 'command':
+                self.submit(value, now)
+            elif kind == 'ack':
+                self.handle_ack(value[0], now, value[1])
+            elif kind == 'stop':
+                return
+            timeout = self.poll(now)
+
 class AckListener(threading.Thread):
     """A thread to listen for acknowledgment packets from the mapper."""
-    def __init__(self, sock):
+    def __init__(self, sock, event_queue=None):
         super().__init__(daemon=True)
         self.sock = sock
+        self.event_queue = event_queue
         self.latest_ack_seq = -1
         self.running = True
 
@@ -32,91 +274,222 @@ class AckListener(threading.Thread):
         while self.running:
             try:
                 data, _ = self.sock.recvfrom(1024)
-                ack_msg = data.decode('utf-8')
-                if ack_msg.startswith('ack;'):
-                    self.latest_ack_seq = int(ack_msg.split(';')[1])
+                ack = parse_ack(data)
+                if ack:
+                    self.latest_ack_seq = ack[0]
+                    if self.event_queue is not None:
+                        self.event_queue.put(('ack', ack))
             except (socket.timeout, BlockingIOError):
                 continue # Ignore timeouts, just keep listening
             except Exception:
                 break # Exit on other errors
 
+class ClientLoop:
+    """
+    The client's single event loop. Acks, gamepad input and hot-plug checks all
+    wake one selector, and between presses it sleeps until the next retransmit
+    deadline or HOTPLUG_RESCAN_SECONDS, so the client uses no CPU while idle.
+    """
+    def __init__(self, sock, sender: ReliableSender):
+        self.sock = sock
+        self.sender = sender
+        self.selector = selectors.DefaultSelector()
+        self.active = {}  # (device, input code) -> command currently held down
+        self.running = True
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ, self._read_acks)
+
+    def _read_acks(self):
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return # e.g. ICMP port unreachable while the mapper is down; retransmits cover it
+            ack = parse_ack(data)
+            if ack:
+                self.sender.handle_ack(ack[0], time.monotonic(), ack[1])
+
+    def on_input(self, device, code: str, state: int):
+        """Called by the gamepad backends for every input event."""
+        if code not in COMMAND_MAP:
+            return
+        command = COMMAND_MAP[code](state)
+        # Only a fresh press produces a command; holding or releasing the
+        # input just updates the latch for that code on that controller.
+        key = (device, code)
+        if command and self.active.get(key) != command:
+            print(f"Detected command: {command}")
+            self.sender.submit(command, time.monotonic())
+        self.active[key] = command
+
+    def forget(self, device):
+        """Drops the latches of a controller that was unplugged."""
+        for key in [key for key in self.active if key[0] == device]:
+            del self.active[key]
+
+    def run(self, gamepads):
+        next_scan = 0.0
+        while self.running:
+            now = time.monotonic()
+            if now >= next_scan:
+                gamepads.scan()
+                next_scan = now + HOTPLUG_RESCAN_SECONDS
+            timeout = next_scan - now
+            deadline = self.sender.poll(now)
+            if deadline is not None:
+                timeout = min(timeout, deadline)
+            for key, _ in self.selector.select(timeout):
+                key.data()
+
+class EvdevGamepads:
+    """
+    Linux: every gamepad under /dev/input, read with evdev when the selector reports
+    events on its file descriptor. An unplugged controller is dropped as soon as a
+    read fails, and new ones are picked up by scan().
+    """
+    def __init__(self, loop: ClientLoop):
+        self.loop = loop
+        self.devices = {}  # path -> evdev.InputDevice
+        self.ignored = set()  # Paths that are not gamepads (keyboards, mice, ...)
+        # Numeric evdev codes of the inputs in COMMAND_MAP
+        self.codes = {getattr(ecodes, name): name for name in COMMAND_MAP if hasattr(ecodes, name)}
+
+    def scan(self):
+        paths = set(evdev.list_devices())
+        self.ignored &= paths
+        for path in paths - self.devices.keys() - self.ignored:
+            try:
+                device = evdev.InputDevice(path)
+            except OSError:
+                continue # No permission, or gone again already
+            abs_codes = {code[0] if isinstance(code, tuple) else code for code in device.capabilities().get(ecodes.EV_ABS, [])}
+            if not abs_codes & self.codes.keys():
+                device.close()
+                self.ignored.add(path)
+                continue
+            self.devices[path] = device
+            self.loop.selector.register(device.fd, selectors.EVENT_READ, lambda path=path: self._read(path))
+            print(f"Controller connected: {device.name} ({path})")
+
+    def _read(self, path: str):
+        device = self.devices[path]
+        try:
+            for event in device.read():
+                if event.type == ecodes.EV_ABS and event.code in self.codes:
+                    self.loop.on_input(path, self.codes[event.code], event.value)
+        except BlockingIOError:
+            pass
+        except OSError:
+            print(f"Controller disconnected: {device.name} ({path})")
+            self.loop.selector.unregister(device.fd)
+            del self.devices[path]
+            self.loop.forget(path)
+            try:
+                device.close()
+            except OSError:
+                pass
+
+class InputsGamepads:
+    """
+    Fallback for Windows, macOS and Linux without evdev: the `inputs` package can
+    only block on one gamepad at a time, so each gamepad gets a reader thread. The
+    threads hand events over through a queue and wake the loop with a byte on a
+    socket pair. A thread ends when its gamepad is unplugged, and scan() starts one
+    for every gamepad connected since. Listing devices means enumerating all of them
+    again, so it is only done after a gamepad reported an error or every
+    INPUTS_RESCAN_SECONDS; in between, scan() only drops finished readers.
+    """
+    def __init__(self, loop: ClientLoop):
+        self.loop = loop
+        self.events = queue.Queue()
+        self.readers = {}  # device key -> reader thread
+        self.manager = None  # The inputs.DeviceManager gamepads were last listed from
+        self.next_rescan = 0.0
+        self.lost = False  # A reader ended since the last listing
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        loop.selector.register(self.wake_recv, selectors.EVENT_READ, self._drain)
+
+    def scan(self):
+        for key in [key for key, thread in self.readers.items() if not thread.is_alive()]:
+            del self.readers[key]
+        now = time.monotonic()
+        if self.manager is not None and not self.lost and now < self.next_rescan:
+            return
+        try:
+            # inputs.devices is enumerated once at import; only a new DeviceManager sees later changes
+            manager = inputs.DeviceManager() if self.manager is not None else inputs.devices
+            gamepads = manager.gamepads
+        except Exception as e:
+            print(f"Could not list gamepads: {e}")
+            return
+        self.manager = manager
+        self.next_rescan = now + INPUTS_RESCAN_SECONDS
+        self.lost = False
+        for gamepad in gamepads:
+            # The device file on Linux, the XInput slot on Windows
+            key = getattr(gamepad, "_character_device_path", None) or getattr(gamepad, "_GamePad__device_number", str(gamepad))
+            if key not in self.readers:
+                thread = threading.Thread(target=self._read, args=(key, gamepad), daemon=True)
+                self.readers[key] = thread
+                thread.start()
+                print(f"Controller connected: {gamepad}")
+
+    def _read(self, key, gamepad):
+        try:
+            while True:
+                for event in gamepad.read():
+                    if event.code in COMMAND_MAP:
+                        self.events.put((key, event.code, event.state))
+                        self.wake_send.send(b"\0")
+        except (UnpluggedError, OSError):
+            print(f"Controller disconnected: {gamepad}")
+        except Exception as e:
+            print(f"An unexpected error occurred while reading the gamepad: {e}")
+        self.events.put((key, None, None))
+        self.wake_send.send(b"\0")
+
+    def _drain(self):
+        try:
+            while self.wake_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                key, code, state = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if code is None:
+                self.loop.forget(key)
+                self.lost = True
+            else:
+                self.loop.on_input(key, code, state)
+
 def process_gamepad_events():
+    if evdev is None and inputs is None:
+        print("ERROR: Reading the gamepad needs the 'evdev' package on Linux (pip install evdev) "
+              "or the 'inputs' package (pip install inputs).")
+        return
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP socket
-    sock.settimeout(0.05) # Set a short timeout for receiving acks
-    last_sent_command = None
-    sequence_number = 0
 
-    last_send_time = 0
+    stats = NetStats() if NetStats else None
+    sender = ReliableSender(sock, (MAPPER_PC_IP, MAPPER_PC_PORT), stats=stats)
+    if stats and STATS_FILE:
+        StatsWriter(stats, STATS_FILE, STATS_INTERVAL).start()
+
+    # Acks, gamepad input and hot-plug are all handled by one event loop
+    loop = ClientLoop(sock, sender)
+    gamepads = EvdevGamepads(loop) if evdev is not None else InputsGamepads(loop)
 
-    # Start the acknowledgment listener thread
-    ack_listener = AckListener(sock)
-    ack_listener.start()
-    
     print(f"Listening for input and sending UDP to {MAPPER_PC_IP}:{MAPPER_PC_PORT}")
-    
-    while True:
-        try:
-            events = get_gamepad()
-            current_command = None
-            dpad_released = False
-
-            for event in events:
-                # print(f"Raw Event: code={event.code}, state={event.state}, event_type={event.ev_type}") # DEBUG
-                if event.code in COMMAND_MAP:
-                    command = COMMAND_MAP[event.code](event.state)
-                    if command:
-                        current_command = command
-                        print(f"Detected command: {current_command}")
-                    elif event.state == 0:
-                        dpad_released = True
-
-            # If the D-pad was released, we must clear the last sent command
-            # to allow the next press to be registered.
-            if dpad_released:
-                last_sent_command = None
-
-            # Transmit only if the command is active and different from the last sent command
-            if current_command and current_command != last_sent_command:
-                now = time.time()
-                if now - last_send_time < COMMAND_COOLDOWN:
-                    # If we are in the cooldown period, ignore the command.
-                    continue
-                last_send_time = now
-
-                sequence_number += 1
-                message = f"{sequence_number};{current_command}"
-                
-                # Retry loop
-                retries = 3
-                while retries > 0:
-                    print(f"Sending: '{current_command}' (Seq: {sequence_number})")
-                    sock.sendto(message.encode('utf-8'), (MAPPER_PC_IP, MAPPER_PC_PORT))
-                    
-                    # Wait for acknowledgment
-                    wait_until = time.time() + ACK_TIMEOUT
-                    while time.time() < wait_until:
-                        if ack_listener.latest_ack_seq == sequence_number:
-                            break # Ack received!
-                        time.sleep(0.01)
-                    
-                    if ack_listener.latest_ack_seq == sequence_number:
-                        break # Exit retry loop
-                    
-                    print(f"Timeout, retrying... ({retries-1} left)")
-                    retries -= 1
-
-                last_sent_command = current_command
-                
-            time.sleep(0.005) # Maintain fast polling
-
-        except UnpluggedError:
-            print("Controller disconnected. Waiting for reconnection...")
-            last_sent_command = None
-            time.sleep(2)
-        except Exception as e:
-            # Catch any other unexpected errors during event processing or sending
-            print(f"An unexpected error occurred in game_pc_client: {e}")
-            time.sleep(0.1)
+    try:
+        loop.run(gamepads)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     process_gamepad_events()
@@ -0,0 +1,128 @@
+"""
+Ghost floors (O key): the floors above and below drawn as translucent layers under
+the current one, to line up stairs and pits.
+
+A ghost floor is not drawn cell by cell. Each floor near the current one has a
+FloorRaster, holding one 16x16 pixel tile per chunk at one pixel per cell. A tile is
+redrawn only when its chunk's version changes. To draw a layer, the visible tiles
+are copied into one small surface, which is scaled to the zoom once, rotated once
+and blitted once with the layer's alpha.
+
+The current floor's raster is kept up to date too. After change_floor, the old
+current floor is already rasterized and becomes a ghost without being redrawn.
+Rasters remember floor versions, not floors, and are read through FloorStore.peek(),
+so drawing a spilled neighbor does not load it back; it is read once per change of
+version. The rasters are dropped when ghost floors are turned off.
+"""
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import pygame
+
+import config
+from data_models import CHUNK_SHIFT, CHUNK_SIZE, Floor, IconType
+
+GHOST_KEY = (255, 0, 255)  # Colorkey for empty tile pixels
+GHOST_CACHED_FLOORS = 5  # Rasters kept: the current floor, its neighbors and the last ones left
+ICON_GHOST_COLORS = {IconType.STAIRS_UP: (80, 220, 80), IconType.STAIRS_DOWN: (220, 80, 80)}
+
+def _cell_color(cell):
+    if not cell.explored:
+        return None
+    color = ICON_GHOST_COLORS.get(cell.icon)
+    if color:
+        return color
+    return config.LABELED_CELL_COLOR if cell.label else config.EXPLORED_COLOR
+
+class FloorRaster:
+    """One floor at one pixel per cell, as a tile per chunk, updated chunk by chunk."""
+    def __init__(self):
+        self.version = None  # FloorStore.version() of the floor rasterized
+        self.chunk_versions: Dict[Tuple[int, int], int] = {}
+        self.tiles: Dict[Tuple[int, int], pygame.Surface] = {}
+
+    def update(self, floor: Floor, version: int):
+        # Floor versions are unique across floors, so a floor replaced or loaded back
+        # from the store has no chunk version in common with the one rasterized before
+        for key in self.chunk_versions.keys() - floor.chunk_versions.keys():
+            del self.chunk_versions[key]
+            self.tiles.pop(key, None)
+        for key, chunk_version in floor.chunk_versions.items():
+            if self.chunk_versions.get(key) != chunk_version:
+                self._draw_tile(floor, key)
+                self.chunk_versions[key] = chunk_version
+        self.version = version
+
+    def _draw_tile(self, floor: Floor, key: Tuple[int, int]):
+        cells = floor.chunk_cells(key)
+        if not cells:
+            self.tiles.pop(key, None)
+            return
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = pygame.Surface((CHUNK_SIZE, CHUNK_SIZE))
+        tile.fill(GHOST_KEY)
+        for (x, y), cell in cells.items():
+            color = _cell_color(cell)
+            if color:
+                tile.set_at((x & (CHUNK_SIZE - 1), y & (CHUNK_SIZE - 1)), color)
+
+class GhostLayers:
+    def __init__(self, app):
+        self.app = app
+        self.rasters: "OrderedDict[int, FloorRaster]" = OrderedDict()  # Least recently used first
+
+    def raster(self, number: int):
+        """The up-to-date raster of a floor, or None if the floor does not exist."""
+        floors = self.app.floors
+        if number not in floors:
+            return None
+        raster = self.rasters.get(number)
+        if raster is None:
+            raster = self.rasters[number] = FloorRaster()
+        self.rasters.move_to_end(number)
+        version = floors.version(number)
+        if version != raster.version:
+            raster.update(floors.peek(number), version)
+        while len(self.rasters) > GHOST_CACHED_FLOORS:
+            self.rasters.popitem(last=False)
+        return raster
+
+    def clear(self):
+        self.rasters.clear()
+
+    def draw(self):
+        app = self.app
+        self.raster(app.current_floor) # Kept current so it can become a ghost without a full redraw
+        size = config.CELL_SIZE * app.zoom
+        x0, y0, x1, y1 = app.visible_grid_rect()
+        # Whole chunks, so tiles are copied without clipping
+        cx0, cy0, cx1, cy1 = x0 >> CHUNK_SHIFT, y0 >> CHUNK_SHIFT, x1 >> CHUNK_SHIFT, y1 >> CHUNK_SHIFT
+        left, top = cx0 << CHUNK_SHIFT, cy0 << CHUNK_SHIFT
+        width, height = (cx1 - cx0 + 1) << CHUNK_SHIFT, (cy1 - cy0 + 1) << CHUNK_SHIFT
+        # Only the visible cells are scaled
+        visible = pygame.Rect(x0 - left, y0 - top, x1 - x0 + 1, y1 - y0 + 1)
+        corners = [app.grid_to_screen(x0 + dx - 0.5, y0 + dy - 0.5) for dx in (0, visible.width) for dy in (0, visible.height)]
+        screen_pos = (round(min(x for x, _ in corners)), round(min(y for _, y in corners)))
+
+        for number, alpha in ((app.current_floor - 1, config.GHOST_BELOW_ALPHA), (app.current_floor + 1, config.GHOST_ABOVE_ALPHA)):
+            raster = self.raster(number)
+            if raster is None or not raster.tiles:
+                continue
+            layer = pygame.Surface((width, height))
+            layer.fill(GHOST_KEY)
+            drawn = False
+            for cy in range(cy0, cy1 + 1):
+                for cx in range(cx0, cx1 + 1):
+                    tile = raster.tiles.get((cx, cy))
+                    if tile is not None:
+                        layer.blit(tile, ((cx - cx0) << CHUNK_SHIFT, (cy - cy0) << CHUNK_SHIFT))
+                        drawn = True
+            if not drawn:
+                continue
+            layer = pygame.transform.scale(layer.subsurface(visible), (max(1, round(visible.width * size)), max(1, round(visible.height * size))))
+            if app.rotation:
+                layer = pygame.transform.rotate(layer, -app.rotation) # The map turns clockwise
+            layer.set_colorkey(GHOST_KEY)
+            layer.set_alpha(alpha)
+            app.screen.blit(layer, screen_pos)
@@ -0,0 +1,462 @@
+"""
+Import and export of dungeon layouts made by other tools: ASCII art (.txt), CSV
+grids (.csv) and Tiled maps (.tmx).
+
+Files are read a row at a time, and each row goes straight into a data_models.Floor
+with set_states. No list of lines, grid array or XML tree of the whole file is built
+(TMX is parsed with an incremental SAX parser), so reading needs memory for the floors
+only. With a FloorStore or a .jsonl file (save_map_stream) as the destination, that is
+about one floor. Writing walks each floor CHUNK_SIZE rows at a time in the same way.
+
+    ASCII   one character per cell. A line "=== floor N @ x,y ===" starts floor N with
+            its top-left character at x,y. A file without one is a single floor at 0,0.
+    CSV     one token per cell and one floor per file.
+    TMX     one tile layer per floor: the layer's "floor" property, or else its order.
+            Layer data in CSV, XML or base64 (plain, zlib or gzip), and infinite maps.
+
+Characters, tokens and tile ids become icons through a mapping: DEFAULT_MAPPINGS below,
+overridden per format by a JSON file given with --mapping or CRAWLTOGRAPHER_TILE_MAPPING:
+
+    {"ascii": {"#": null, "$": "chest"}, "tmx": {"17": "door", "18": null}}
+
+A null icon means "no cell" (walls, rock, empty tiles). Anything not in the mapping
+becomes an explored cell without an icon. Labels, locks and walls are not exported.
+
+    python -m map_tool import layout.tmx -o dungeon.jsonl
+    python -m map_tool export-grid dungeon.jsonl -o dungeon.txt
+
+In the mapper, File > Import Grid... and File > Export Grid... do the same.
+"""
+import base64
+import csv
+import json
+import os
+import re
+import sys
+import xml.sax
+import zlib
+from array import array
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import config
+from data_models import CHUNK_SHIFT, CellState, Floor, IconType
+from file_manager import _absolute
+
+GRID_EXTENSIONS = {".txt": "ascii", ".asc": "ascii", ".csv": "csv", ".tmx": "tmx"}
+TILE_MAPPING_FILE = os.environ.get("CRAWLTOGRAPHER_TILE_MAPPING")
+READ_BLOCK = 1 << 16       # Bytes of a TMX file fed to the parser at a time
+TMX_TILE_SIZE = 32
+TMX_ORIGIN_PROPERTY = "crawltographer_origin"  # Map property: grid position of the top-left tile
+_GID_MASK = 0x1FFFFFFF     # Tiled keeps flip flags in the top three bits of a gid
+_FLOOR_LINE = re.compile(r"===\s*floor\s+(-?\d+)(?:\s*@\s*(-?\d+)\s*,\s*(-?\d+))?\s*===\s*$")
+
+Mapping = Dict[str, Optional[IconType]]
+# (floor, None) when a floor starts, then (floor, [(pos, state), ...]) for each of its rows
+Rows = Iterator[Tuple[int, Optional[list]]]
+FloorsSource = Callable[[], Iterable[Tuple[int, Floor]]]
+
+ASCII_ICONS = {
+    ".": IconType.NONE, "E": IconType.ENTRANCE, "C": IconType.CHEST, "D": IconType.LOCKED_DOOR,
+    "<": IconType.STAIRS_UP, ">": IconType.STAIRS_DOWN, "B": IconType.BOSS, "N": IconType.NPC,
+    "S": IconType.SWITCH, "T": IconType.TRAP, "P": IconType.SAVE_POINT,
+}
+DEFAULT_MAPPINGS: Dict[str, Mapping] = {
+    "ascii": {" ": None, "#": None, **ASCII_ICONS},
+    "csv": {"": None, "0": None, **ASCII_ICONS, **{icon.value: icon for icon in IconType}},
+    # Tile 1 is an empty room, then one tile per icon in IconType order
+    "tmx": {"0": None, **{str(i + 1): icon for i, icon in enumerate(IconType)}},
+}
+PLAIN_CELL: CellState = (True, IconType.NONE, "", False)
+
+def grid_format(filename: str) -> Optional[str]:
+    """'ascii', 'csv' or 'tmx' from a file's extension, or None for anything else."""
+    return GRID_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+def load_mapping(fmt: str, path: str = None) -> Mapping:
+    """
+    The token -> icon mapping for a format: the entries of the JSON mapping file (`path`,
+    or CRAWLTOGRAPHER_TILE_MAPPING) first, then the defaults they do not override.
+
+    Raises OSError or ValueError for an unreadable file or an unknown icon.
+    """
+    mapping = {}
+    path = path or TILE_MAPPING_FILE
+    if path:
+        with open(path, 'r') as f:
+            section = json.load(f).get(fmt, {})
+        for token, icon in section.items():
+            if fmt == "ascii" and len(token) != 1:
+                raise ValueError(f"ASCII mapping keys must be single characters, not {token!r}")
+            if fmt == "tmx":
+                int(token)
+            mapping[token] = None if icon is None else IconType(icon)
+    for token, icon in DEFAULT_MAPPINGS[fmt].items():
+        mapping.setdefault(token, icon)
+    return mapping
+
+def _states(mapping: Mapping) -> Dict[str, Optional[CellState]]:
+    return {token: None if icon is None else (True, icon, "", False) for token, icon in mapping.items()}
+
+def _tokens(mapping: Mapping, fmt: str) -> Dict[Optional[IconType], str]:
+    """Icon (None for no cell) -> the first token that maps to it, for writing."""
+    tokens = {}
+    for source in (mapping, DEFAULT_MAPPINGS[fmt]):
+        for token, icon in source.items():
+            tokens.setdefault(icon, token)
+    return tokens
+
+def _row(tokens, x0: int, y: int, states) -> list:
+    row = []
+    for i, token in enumerate(tokens):
+        state = states.get(token, PLAIN_CELL)
+        if state is not None:
+            row.append(((x0 + i, y), state))
+    return row
+
+# Readers: each yields Rows (see above), so callers can build floors or just scan (find_start)
+
+def _ascii_rows(path: str, mapping: Mapping, floor: int) -> Rows:
+    states = _states(mapping)
+    started = False
+    x0 = y0 = y = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if line.startswith("==="):
+                match = _FLOOR_LINE.match(line)
+                if not match:
+                    raise ValueError(f"{path}:{line_number}: expected '=== floor N @ x,y ===', got {line!r}")
+                floor = int(match.group(1))
+                x0, y0 = (int(match.group(2)), int(match.group(3))) if match.group(2) else (0, 0)
+                y = 0
+                started = True
+                yield floor, None
+                continue
+            if not started:
+                started = True
+                yield floor, None
+            yield floor, _row(line, x0, y0 + y, states)
+            y += 1
+
+def _csv_rows(path: str, mapping: Mapping, floor: int) -> Rows:
+    states = _states(mapping)
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        yield floor, None
+        for y, fields in enumerate(csv.reader(f)):
+            yield floor, _row((field.strip() for field in fields), 0, y, states)
+
+class _TMXHandler(xml.sax.ContentHandler):
+    """Turns tile layers into Rows as the parser reaches them; see _tmx_rows."""
+    def __init__(self, states: Dict[int, Optional[CellState]]):
+        super().__init__()
+        self.states = states
+        self.rows = deque()
+        self.elements = []
+        self.origin = (0, 0)
+        self.layers = 0
+        self.layer_floor = None
+        self.floor = None  # Number of the layer being read, once its data starts
+        self.layer_width = 0
+        self.encoding = None
+        self.compression = None
+        self.decompressor = None
+        self.text = ""
+        self.raw = b""
+        # The block of tiles being read: the layer's <data>, or one <chunk> of an infinite map
+        self.block_origin = (0, 0)
+        self.block_width = 0
+        self.index = 0
+        self.row = []
+
+    def startElement(self, name, attrs):
+        parent = self.elements[-2:]
+        self.elements.append(name)
+        if name == "property":
+            if parent == ["map", "properties"] and attrs.get("name") == TMX_ORIGIN_PROPERTY:
+                x, y = attrs.get("value", "0,0").split(",")
+                self.origin = (int(x), int(y))
+            elif parent == ["layer", "properties"] and attrs.get("name") == "floor":
+                self.layer_floor = int(attrs.get("value"))
+        elif name == "layer":
+            self.layers += 1
+            self.layer_floor = None
+            self.floor = None
+            self.layer_width = int(attrs.get("width", 0))
+        elif name == "data" and parent[-1:] == ["layer"]:
+            self.floor = self.layer_floor if self.layer_floor is not None else self.layers - 1
+            self.rows.append((self.floor, None))
+            self.encoding = attrs.get("encoding", "xml")
+            compression = attrs.get("compression")
+            if self.encoding not in ("csv", "base64", "xml"):
+                raise ValueError(f"unsupported layer encoding {self.encoding!r}")
+            if compression not in (None, "zlib", "gzip"):
+                raise ValueError(f"unsupported layer compression {compression!r}")
+            self.compression = compression
+            self._start_block(self.origin, self.layer_width)
+        elif name == "chunk" and self.floor is not None:
+            x, y = int(attrs.get("x", 0)), int(attrs.get("y", 0))
+            self._start_block((self.origin[0] + x, self.origin[1] + y), int(attrs.get("width", 0)))
+        elif name == "tile" and self.floor is not None and self.encoding == "xml":
+            self._put(int(attrs.get("gid", 0)))
+
+    def endElement(self, name):
+        self.elements.pop()
+        if name == "chunk" and self.floor is not None:
+            self._end_block()
+        elif name == "data" and self.floor is not None:
+            self._end_block()
+            self.floor = None
+
+    def characters(self, content):
+        if self.floor is None or self.elements[-1] not in ("data", "chunk"):
+            return
+        if self.encoding == "csv":
+            parts = (self.text + content).split(",")
+            self.text = parts.pop()
+            for part in parts:
+                if not part.isspace() and part:
+                    self._put(int(part))
+        elif self.encoding == "base64":
+            self.text += "".join(content.split())
+            usable = len(self.text) // 4 * 4
+            if usable:
+                self._add_bytes(base64.b64decode(self.text[:usable]))
+                self.text = self.text[usable:]
+
+    def _start_block(self, origin, width):
+        if width <= 0:
+            raise ValueError("tile layer without a width")
+        self.block_origin = origin
+        self.block_width = width
+        self.index = 0
+        self.text = ""
+        self.raw = b""
+        self.decompressor = None
+        if self.compression:
+            self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | (16 if self.compression == "gzip" else 0))
+
+    def _end_block(self):
+        if self.encoding == "csv" and self.text.strip():
+            self._put(int(self.text))
+        elif self.encoding == "base64" and self.decompressor:
+            self._add_bytes(b"", flush=True)
+        self.text = ""
+        if self.row:
+            self.rows.append((self.floor, self.row))
+            self.row = []
+
+    def _add_bytes(self, data: bytes, flush: bool = False):
+        if self.decompressor:
+            data = self.decompressor.decompress(data) + (self.decompressor.flush() if flush else b"")
+        self.raw += data
+        usable = len(self.raw) // 4 * 4
+        gids = array('I')
+        gids.frombytes(self.raw[:usable])
+        if sys.byteorder == "big":
+            gids.byteswap()
+        self.raw = self.raw[usable:]
+        for gid in gids:
+            self._put(gid)
+
+    def _put(self, gid: int):
+        y, x = divmod(self.index, self.block_width)
+        self.index += 1
+        state = self.states.get(gid & _GID_MASK, PLAIN_CELL)
+        if state is not None:
+            self.row.append(((self.block_origin[0] + x, self.block_origin[1] + y), state))
+        if x == self.block_width - 1 and self.row:
+            self.rows.append((self.floor, self.row))
+            self.row = []
+
+def _tmx_rows(path: str, mapping: Mapping, floor: int) -> Rows:
+    handler = _TMXHandler({int(token): state for token, state in _states(mapping).items()})
+    parser = xml.sax.make_parser()
+    parser.setContentHandler(handler)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            try:
+                if block:
+                    parser.feed(block)
+                else:
+                    parser.close()
+            except xml.sax.SAXException as e:
+                raise ValueError(f"not a readable TMX file: {e}")
+            while handler.rows:
+                yield handler.rows.popleft()
+            if not block:
+                return
+
+_READERS = {"ascii": _ascii_rows, "csv": _csv_rows, "tmx": _tmx_rows}
+
+def read_rows(path: str, mapping: Mapping = None, floor: int = 0) -> Rows:
+    """
+    The cells of an ASCII, CSV or TMX file as Rows. `floor` numbers an ASCII or CSV file
+    without floor lines. Raises OSError or ValueError for unreadable files.
+    """
+    fmt = grid_format(path)
+    if fmt is None:
+        raise ValueError(f"{path} is not a .txt, .csv or .tmx file")
+    return _READERS[fmt](path, load_mapping(fmt) if mapping is None else mapping, floor)
+
+def read_grid(path: str, mapping: Mapping = None, floor: int = 0) -> Iterator[Tuple[int, Floor]]:
+    """(floor number, Floor) for each floor of a file, each one yielded once it is complete."""
+    number = cells = None
+    for n, row in read_rows(path, mapping, floor):
+        if row is None:
+            if cells is not None:
+                yield number, cells
+            number, cells = n, Floor()
+        else:
+            cells.set_states(row)
+    if cells is not None:
+        yield number, cells
+
+def find_start(path: str, mapping: Mapping = None, floor: int = 0) -> Optional[Tuple[int, Tuple[int, int]]]:
+    """
+    (floor, position) of the first entrance in a file, or of its first cell if it has no
+    entrance; None for a file without cells. Stops reading at the entrance.
+    """
+    first = None
+    for number, row in read_rows(path, mapping, floor):
+        for pos, state in row or ():
+            if state[1] is IconType.ENTRANCE:
+                return number, pos
+            if first is None:
+                first = (number, pos)
+    return first
+
+def start_header(start: Optional[Tuple[int, Tuple[int, int]]], floor: int = 0) -> Dict:
+    """A map header (see file_manager.read_map_stream) that puts the player at find_start's result."""
+    if start is None:
+        return {"current_floor": floor, "current_pos": (config.GRID_SIZE // 2, config.GRID_SIZE // 2), "rotation": 0}
+    return {"current_floor": start[0], "current_pos": start[1], "rotation": 0}
+
+def import_grid(filename: str, floors=None, mapping: Mapping = None, floor: int = 0) -> Optional[Dict]:
+    """
+    Like file_manager.load_map_data, for an ASCII, CSV or TMX file: returns the map's
+    data with its floors added one at a time to `floors` (a new dict by default), or
+    None after printing why the file could not be read.
+    """
+    filename = _absolute(filename)
+    floors = {} if floors is None else floors
+    try:
+        header = start_header(find_start(filename, mapping, floor), floor)
+        for number, cells in read_grid(filename, mapping, floor):
+            floors[number] = cells
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Error importing {filename}: {e}")
+        return None
+    print(f"Map imported from {filename}")
+    return dict(header, floors=floors)
+
+# Writers
+
+def _rows_of(cells: Floor, bounds: Tuple[int, int, int, int], tokens: Dict) -> Iterator[list]:
+    """Every row of `bounds` as a list of tokens, filled CHUNK_SIZE rows at a time from the floor's chunks."""
+    min_x, min_y, max_x, max_y = bounds
+    width = max_x - min_x + 1
+    empty, plain = tokens[None], tokens[IconType.NONE]
+    for cy in range(min_y >> CHUNK_SHIFT, (max_y >> CHUNK_SHIFT) + 1):
+        top = max(min_y, cy << CHUNK_SHIFT)
+        rows = [[empty] * width for _ in range(min(max_y, ((cy + 1) << CHUNK_SHIFT) - 1) - top + 1)]
+        for cx in range(min_x >> CHUNK_SHIFT, (max_x >> CHUNK_SHIFT) + 1):
+            for (x, y), cell in cells.chunk_cells((cx, cy)).items():
+                if cell.explored:
+                    rows[y - top][x - min_x] = tokens.get(cell.icon, plain)
+        yield from rows
+
+def write_ascii(path: str, floors: FloorsSource, mapping: Mapping = None) -> int:
+    """Writes floors as ASCII art, each after its floor line. Returns the number of floors."""
+    tokens = _tokens(load_mapping("ascii") if mapping is None else mapping, "ascii")
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for number, cells in floors():
+            bounds = cells.bounds()
+            f.write(f"=== floor {number} @ {bounds[0] if bounds else 0},{bounds[1] if bounds else 0} ===\n")
+            if bounds:
+                for row in _rows_of(cells, bounds, tokens):
+                    f.write("".join(row) + "\n")
+            written += 1
+    return written
+
+def write_csv_grid(path: str, floors: FloorsSource, mapping: Mapping = None) -> int:
+    """Writes the first floor `floors` yields as a CSV grid of its bounds. Returns 1, or 0 if there is none."""
+    tokens = _tokens(load_mapping("csv") if mapping is None else mapping, "csv")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for _, cells in floors():
+            bounds = cells.bounds()
+            if bounds:
+                csv.writer(f).writerows(_rows_of(cells, bounds, tokens))
+            return 1
+    return 0
+
+def write_tmx(path: str, floors: FloorsSource, mapping: Mapping = None) -> int:
+    """
+    Writes floors as the CSV-encoded tile layers of one Tiled map covering all of them.
+    `floors` is called twice: once to measure the map, once to write it.
+    """
+    tokens = _tokens(load_mapping("tmx") if mapping is None else mapping, "tmx")
+    count = 0
+    bounds = None
+    for _, cells in floors():
+        count += 1
+        floor_bounds = cells.bounds()
+        if floor_bounds and bounds:
+            bounds = (min(bounds[0], floor_bounds[0]), min(bounds[1], floor_bounds[1]),
+                      max(bounds[2], floor_bounds[2]), max(bounds[3], floor_bounds[3]))
+        elif floor_bounds:
+            bounds = floor_bounds
+    bounds = bounds or (0, 0, 0, 0)
+    width, height = bounds[2] - bounds[0] + 1, bounds[3] - bounds[1] + 1
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<map version="1.10" orientation="orthogonal" renderorder="right-down" width="{width}" height="{height}" '
+                f'tilewidth="{TMX_TILE_SIZE}" tileheight="{TMX_TILE_SIZE}" infinite="0" nextlayerid="{count + 1}" nextobjectid="1">\n')
+        f.write(f' <properties>\n  <property name="{TMX_ORIGIN_PROPERTY}" value="{bounds[0]},{bounds[1]}"/>\n </properties>\n')
+        # A tileset without images: each tile only says which icon it stands for
+        gids = sorted((int(token), icon) for icon, token in tokens.items() if icon is not None and int(token) > 0)
+        f.write(f' <tileset firstgid="1" name="crawltographer" tilewidth="{TMX_TILE_SIZE}" tileheight="{TMX_TILE_SIZE}" '
+                f'tilecount="{max((gid for gid, _ in gids), default=0)}" columns="0">\n')
+        for gid, icon in gids:
+            f.write(f'  <tile id="{gid - 1}">\n   <properties>\n    <property name="icon" value="{icon.value}"/>\n   </properties>\n  </tile>\n')
+        f.write(' </tileset>\n')
+        for layer_id, (number, cells) in enumerate(floors(), 1):
+            f.write(f' <layer id="{layer_id}" name="Floor {number}" width="{width}" height="{height}">\n'
+                    f'  <properties>\n   <property name="floor" type="int" value="{number}"/>\n  </properties>\n'
+                    '  <data encoding="csv">\n')
+            for y, row in enumerate(_rows_of(cells, bounds, tokens)):
+                f.write(",".join(row) + ("," if y < height - 1 else "") + "\n")
+            f.write('</data>\n </layer>\n')
+        f.write('</map>\n')
+    return count
+
+_WRITERS = {"ascii": write_ascii, "csv": write_csv_grid, "tmx": write_tmx}
+
+def write_grid(path: str, floors: FloorsSource, mapping: Mapping = None) -> int:
+    """Writes floors in the format of `path`'s extension. Returns the number of floors written."""
+    fmt = grid_format(path)
+    if fmt is None:
+        raise ValueError(f"{path} is not a .txt, .csv or .tmx file")
+    path = _absolute(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return _WRITERS[fmt](path, floors, mapping)
+
+def export_grid(filename: str, floors, current_floor: int, mapping: Mapping = None) -> bool:
+    """
+    Writes an open map (a dict or FloorStore of Floors) to an ASCII, CSV or TMX file.
+    A CSV grid holds only `current_floor`. Prints the outcome; returns True on success.
+    """
+    if grid_format(filename) == "csv":
+        source = lambda: [(current_floor, floors[current_floor])] if current_floor in floors else []
+    else:
+        source = lambda: ((number, floors[number]) for number in sorted(floors))
+    try:
+        written = write_grid(filename, source, mapping)
+    except (OSError, ValueError) as e:
+        print(f"Error exporting to {filename}: {e}")
+        return False
+    print(f"Exported {written} floor(s) to {_absolute(filename)}")
+    return True
@@ -0,0 +1,128 @@
+"""
+Undo/redo entries.
+
+Each entry describes one user action on one floor and knows how to apply itself to a
+data_models.Floor in either direction. apply() and touched() return the positions the
+entry affects so the caller can notify change listeners.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from data_models import CellState, Floor, IconType
+
+Position = Tuple[int, int]
+
+class CellChanges:
+    """The before and after state of every cell an action touched."""
+    __slots__ = ('floor', 'changes')
+
+    def __init__(self, floor: int):
+        self.floor = floor
+        self.changes: Dict[Position, Tuple[Optional[CellState], Optional[CellState]]] = {}
+
+    def record(self, pos: Position, prev: Optional[CellState], new: Optional[CellState]):
+        """Adds a change. A cell touched twice keeps its first 'before' and its last 'after'."""
+        earlier = self.changes.get(pos)
+        self.changes[pos] = (earlier[0] if earlier else prev, new)
+
+    def __bool__(self) -> bool:
+        return bool(self.changes)
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def touched(self) -> List[Position]:
+        return list(self.changes)
+
+    def apply(self, floor: Floor, reverse: bool = False) -> List[Position]:
+        index = 0 if reverse else 1
+        floor.set_states((pos, states[index]) for pos, states in self.changes.items())
+        return list(self.changes)
+
+class MoveCells:
+    """
+    Cells relocated within a floor: sources[i] moves to targets[i].
+
+    Covers moves, rotations and mirrors. The moved states are not stored, they are read
+    from the floor when the entry is applied; only cells that were overwritten at the
+    destination (and are not themselves moving) are kept in `displaced`.
+    """
+    __slots__ = ('floor', 'sources', 'targets', 'displaced')
+
+    def __init__(self, floor: int, sources: List[Position], targets: List[Position], displaced: Dict[Position, CellState]):
+        self.floor = floor
+        self.sources = sources
+        self.targets = targets
+        self.displaced = displaced
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def touched(self) -> List[Position]:
+        return list(self.sources) + list(self.targets)
+
+    def apply(self, floor: Floor, reverse: bool = False) -> List[Position]:
+        origin, destination = (self.targets, self.sources) if reverse else (self.sources, self.targets)
+        states = [floor.get_state(pos) for pos in origin]
+        floor.set_states((pos, None) for pos in origin)
+        if reverse:
+            floor.set_states(self.displaced.items())
+        floor.set_states(zip(destination, states))
+        return list(self.sources) + list(self.targets)
+
+class FillCells:
+    """
+    A flood fill: every position in `positions` became explored with `icon`.
+
+    Filled cells were empty or unexplored, so only the few that already existed (e.g.
+    an unexplored cell with a label) need their previous state kept in `previous`.
+    """
+    __slots__ = ('floor', 'positions', 'icon', 'previous')
+
+    def __init__(self, floor: int, positions: List[Position], icon: IconType, previous: Dict[Position, CellState]):
+        self.floor = floor
+        self.positions = positions
+        self.icon = icon
+        self.previous = previous
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def touched(self) -> List[Position]:
+        return list(self.positions)
+
+    def apply(self, floor: Floor, reverse: bool = False) -> List[Position]:
+        previous = self.previous
+        if reverse:
+            floor.set_states((pos, previous.get(pos)) for pos in self.positions)
+        else:
+            filled = (True, self.icon, "", False)
+            floor.set_states(
+                (pos, (True, self.icon, previous[pos][2], False) if pos in previous else filled)
+                for pos in self.positions)
+        return list(self.positions)
+
+class EdgeChanges:
+    """The before and after edge masks (see data_models.EdgeLayer) of every cell an action touched."""
+    __slots__ = ('floor', 'changes')
+
+    def __init__(self, floor: int):
+        self.floor = floor
+        self.changes: Dict[Position, Tuple[int, int]] = {}
+
+    def record(self, pos: Position, prev: int, new: int):
+        earlier = self.changes.get(pos)
+        self.changes[pos] = (earlier[0] if earlier else prev, new)
+
+    def __bool__(self) -> bool:
+        return bool(self.changes)
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def touched(self) -> List[Position]:
+        return list(self.changes)
+
+    def apply(self, floor: Floor, reverse: bool = False) -> List[Position]:
+        index = 0 if reverse else 1
+        floor.edges.set_masks((pos, masks[index]) for pos, masks in self.changes.items())
+        return list(self.changes)
@@ -0,0 +1,381 @@
+"""
+Content hashes of maps, kept up to date as cells change: cell -> chunk -> floor -> map.
+
+A chunk's hash covers what saving would write for its 16x16 cells (explored or
+locked cells, and the chunk's walls and doors), so two chunks with the same hash
+save the same. A floor's digest is the sum of one term per chunk, and a map's digest
+the sum of one term per non-empty floor (mod 2**128). Editing a chunk therefore
+changes its floor's digest by subtracting the old term and adding the new one,
+without looking at the floor's other chunks.
+
+Every Floor has a FloorHashes in `floor.hashes`, created the first time it is
+needed. update() rehashes only the chunks whose version changed since the last
+call, so checking an unchanged floor costs one comparison. FloorStore keeps the
+hashes of spilled floors, so hashing the map does not load them back.
+
+Saving writes the floors' chunk hashes to a sidecar index next to the map, with
+each floor's byte range in a .jsonl file. With it:
+- loading trusts the index instead of hashing every floor,
+- saving and autosave copy the lines of unchanged floors from the previous file
+  instead of encoding them again, and
+- diff_maps compares floor digests, then the chunk hashes of the floors that differ,
+  then the cells of the chunks that differ, reading only those floors from a file.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from data_models import CHUNK_SHIFT, Floor
+from file_manager import JSONL_FORMAT, SavedCells, SavedLine, decode_cells, read_map_stream, save_map_stream
+
+DIGEST_BYTES = 16
+DIGEST_MASK = (1 << (DIGEST_BYTES * 8)) - 1
+INDEX_FORMAT = "crawltographer-index"
+INDEX_VERSION = 1
+
+ChunkKey = Tuple[int, int]
+
+def chunk_hash(floor: Floor, key: ChunkKey) -> Optional[bytes]:
+    """Hash of the saved cells and edges of one chunk, or None if it has neither."""
+    cells = sorted((pos, cell) for pos, cell in floor.chunk_cells(key).items() if cell.explored or cell.locked)
+    masks = floor.edges.chunk(key)
+    if not cells and masks is None:
+        return None
+    digest = hashlib.blake2b(digest_size=DIGEST_BYTES)
+    digest.update("".join(f"{x},{y};{int(cell.explored)};{cell.icon.value};{int(cell.locked)};{cell.label}\n"
+                          for (x, y), cell in cells).encode('utf-8'))
+    if masks is not None:
+        digest.update(b"edges;" + bytes(masks))
+    return digest.digest()
+
+def _term(label: str, digest: bytes) -> int:
+    """One chunk's (or floor's) share of the digest above it."""
+    return int.from_bytes(hashlib.blake2b(label.encode('utf-8') + digest, digest_size=DIGEST_BYTES).digest(), 'little')
+
+class FloorHashes:
+    """The chunk hashes and digest of one floor. A digest of 0 means the floor saves nothing."""
+    __slots__ = ("chunks", "versions", "revision", "digest")
+
+    def __init__(self, chunks: Dict[ChunkKey, bytes] = None):
+        self.chunks: Dict[ChunkKey, bytes] = dict(chunks or {})
+        self.versions: Dict[ChunkKey, tuple] = {}  # (cell version, edge version) each hash was made from
+        self.revision = None  # The floor's (version, edge version) at the last update
+        self.digest = sum(_term(f"{cx},{cy}", digest) for (cx, cy), digest in self.chunks.items()) & DIGEST_MASK
+
+    def update(self, floor: Floor) -> "FloorHashes":
+        """Rehashes the chunks of `floor` that changed since the last update."""
+        revision = (floor.version, floor.edges.version)
+        if revision == self.revision:
+            return self
+        edge_versions = floor.edges.chunk_versions
+        for key in floor.chunk_versions.keys() | edge_versions.keys():
+            versions = (floor.chunk_versions.get(key), edge_versions.get(key))
+            if self.versions.get(key) != versions:
+                self._set(key, chunk_hash(floor, key))
+                self.versions[key] = versions
+        self.revision = revision
+        return self
+
+    def rebase(self, floor: Floor) -> "FloorHashes":
+        """Takes the hashes as current for `floor`, e.g. one just loaded from the file they were made from."""
+        edge_versions = floor.edges.chunk_versions
+        self.versions = {key: (floor.chunk_versions.get(key), edge_versions.get(key))
+                         for key in floor.chunk_versions.keys() | edge_versions.keys()}
+        self.revision = (floor.version, floor.edges.version)
+        return self
+
+    def copy(self) -> "FloorHashes":
+        """A snapshot of the hashes, e.g. for the index of a file just saved."""
+        snapshot = FloorHashes.__new__(FloorHashes)
+        snapshot.chunks = dict(self.chunks)
+        snapshot.versions = {}
+        snapshot.revision = None
+        snapshot.digest = self.digest
+        return snapshot
+
+    def _set(self, key: ChunkKey, digest: Optional[bytes]):
+        old = self.chunks.get(key)
+        if old == digest:
+            return
+        label = f"{key[0]},{key[1]}"
+        if old is not None:
+            self.digest = (self.digest - _term(label, old)) & DIGEST_MASK
+            del self.chunks[key]
+        if digest is not None:
+            self.digest = (self.digest + _term(label, digest)) & DIGEST_MASK
+            self.chunks[key] = digest
+
+def floor_hashes(floor: Floor) -> FloorHashes:
+    """The up-to-date hashes of a floor, kept in floor.hashes."""
+    if floor.hashes is None:
+        floor.hashes = FloorHashes()
+    return floor.hashes.update(floor)
+
+def store_hashes(floors, number: int) -> FloorHashes:
+    """floor_hashes of one floor of a FloorStore (without loading a spilled floor) or a dict."""
+    method = getattr(floors, "floor_hashes", None)
+    return method(number) if method else floor_hashes(floors[number])
+
+def _peek(floors, number: int) -> Floor:
+    method = getattr(floors, "peek", None)
+    return method(number) if method else floors[number]
+
+def _combine(floor_digests: Iterable[Tuple[int, int]]) -> int:
+    total = 0
+    for number, digest in floor_digests:
+        if digest:
+            total += _term(str(number), digest.to_bytes(DIGEST_BYTES, 'little'))
+    return total & DIGEST_MASK
+
+def map_digest(floors) -> int:
+    """Digest of every floor of a map. Maps that save the same cells and edges have the same digest."""
+    return _combine((number, store_hashes(floors, number).digest) for number in floors)
+
+def index_path(map_path: str) -> str:
+    return os.path.splitext(map_path)[0] + ".index"
+
+class MapIndex:
+    """
+    The chunk hashes of a saved map file, and where each floor's line is in a .jsonl file.
+    An index is only used while the map file has the size and modification time it records.
+    """
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.size = None
+        self.mtime_ns = None
+        self.floors: Dict[int, FloorHashes] = {}
+        self.lines: Dict[int, Tuple[int, int]] = {}  # floor -> (byte offset, length) in a .jsonl file
+
+    def matches_file(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def stamp(self):
+        """Records the map file's current size and modification time."""
+        stat = os.stat(self.path)
+        self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+
+    def digest(self) -> int:
+        """map_digest of the saved map."""
+        return _combine((number, hashes.digest) for number, hashes in self.floors.items())
+
+    def save(self):
+        """Writes the index next to the map file."""
+        data = {
+            "format": INDEX_FORMAT, "version": INDEX_VERSION, "map": os.path.basename(self.path), "size": self.size, "mtime_ns": self.mtime_ns,
+            "floors": {str(number): {"chunks": {f"{cx},{cy}": digest.hex() for (cx, cy), digest in sorted(hashes.chunks.items())},
+                                     **({"line": list(self.lines[number])} if number in self.lines else {})}
+                       for number, hashes in sorted(self.floors.items())},
+        }
+        with open(index_path(self.path), 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["MapIndex"]:
+        """The index saved for a map file, or None if there is none or the file changed since."""
+        index = cls(path)
+        try:
+            with open(index_path(index.path), 'r') as f:
+                data = json.load(f)
+            if (not isinstance(data, dict) or data.get("format") != INDEX_FORMAT or data.get("version") != INDEX_VERSION
+                    or data.get("map") != os.path.basename(index.path)): # dungeon.json and dungeon.jsonl share an index path
+                return None
+            index.size, index.mtime_ns = data["size"], data["mtime_ns"]
+            if not index.matches_file():
+                return None
+            for number, entry in data["floors"].items():
+                chunks = {}
+                for key, digest in entry["chunks"].items():
+                    cx, cy = map(int, key.split(','))
+                    chunks[(cx, cy)] = bytes.fromhex(digest)
+                index.floors[int(number)] = FloorHashes(chunks)
+                if "line" in entry:
+                    offset, length = entry["line"]
+                    index.lines[int(number)] = (int(offset), int(length))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return index
+
+    @classmethod
+    def build(cls, path: str) -> "MapIndex":
+        """Hashes a map file one floor at a time. Raises OSError or ValueError for unreadable files."""
+        index = cls(path)
+        if index.path.lower().endswith(".jsonl"):
+            with open(index.path, 'rb') as f:
+                first = json.loads(f.readline() or b"null")
+                if not isinstance(first, dict) or first.get("format") != JSONL_FORMAT:
+                    raise ValueError(f"{index.path} is not a {JSONL_FORMAT} file")
+                while True:
+                    offset = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    if not line.strip():
+                        continue
+                    number, floor = _decode_line(line)
+                    index.floors[number] = floor_hashes(floor).copy()
+                    index.lines[number] = (offset, len(line))
+        else:
+            for number, cells in read_map_stream(index.path)[1]:
+                index.floors[number] = floor_hashes(decode_cells(cells)).copy()
+        index.stamp()
+        return index
+
+def _decode_line(line: bytes) -> Tuple[int, Floor]:
+    entry = json.loads(line)
+    return int(entry["floor"]), decode_cells(SavedCells(entry["cells"], entry.get("edges")))
+
+def _in_chunks(cells: SavedCells, chunks) -> SavedCells:
+    """The saved cells and edges of `cells` that lie in the given chunks."""
+    def inside(key: str, shift: int) -> bool:
+        x, y = key.split(',')
+        return (int(x) >> shift, int(y) >> shift) in chunks
+    return SavedCells(((key, cell) for key, cell in cells.items() if inside(key, CHUNK_SHIFT)),
+                      {key: masks for key, masks in cells.edges.items() if inside(key, 0)})
+
+def read_floor(index: MapIndex, number: int, chunks=None) -> Floor:
+    """
+    One floor of the indexed map file, or only its cells in `chunks` (a set of chunk keys).
+    A .jsonl floor is read from its line alone.
+    """
+    line = index.lines.get(number)
+    if line is not None:
+        with open(index.path, 'rb') as f:
+            f.seek(line[0])
+            entry = json.loads(f.read(line[1]))
+        if int(entry["floor"]) != number:
+            raise ValueError(f"{index.path} changed since it was indexed")
+        found = [(number, SavedCells(entry["cells"], entry.get("edges")))]
+    else:
+        found = (item for item in read_map_stream(index.path)[1] if item[0] == number)
+    for _, cells in found:
+        return decode_cells(cells if chunks is None else _in_chunks(cells, chunks))
+    return Floor()
+
+def save_map_indexed(filename: str, floors, header: Dict, previous: MapIndex = None) -> MapIndex:
+    """
+    Saves a map like file_manager.save_map_data and writes its index. When `previous` is
+    the index of the .jsonl file being overwritten, floors whose digest did not change
+    are copied from it as they are, without being loaded or encoded.
+    """
+    path = os.path.abspath(filename)
+    index = MapIndex(path)
+    numbers = sorted(floors)
+    for number in numbers:
+        hashes = store_hashes(floors, number)
+        old = previous.floors.get(number) if previous else None
+        index.floors[number] = old if old is not None and old.digest == hashes.digest else hashes.copy()
+
+    reusable = previous is not None and previous.path == path and bool(previous.lines) and previous.matches_file()
+    old_file = open(path, 'rb') if reusable else None
+
+    def entries():
+        for number in numbers:
+            line = previous.lines.get(number) if reusable else None
+            if line is not None and index.floors[number] is previous.floors.get(number):
+                old_file.seek(line[0])
+                yield number, SavedLine(old_file.read(line[1]))
+            else:
+                yield number, _peek(floors, number)
+        if old_file:
+            old_file.close() # Before the new file replaces it
+    try:
+        index.lines = save_map_stream(path, header, entries())
+    finally:
+        if old_file:
+            old_file.close()
+    index.stamp()
+    index.save()
+    return index
+
+class FileSource:
+    """A saved map as one side of diff_maps, read through its index (built in memory if missing)."""
+    def __init__(self, path: str, index: MapIndex = None):
+        self.index = index if index is not None and index.matches_file() else MapIndex.load(path) or MapIndex.build(path)
+
+    def numbers(self) -> Iterable[int]:
+        return self.index.floors
+
+    def hashes(self, number: int) -> Optional[FloorHashes]:
+        return self.index.floors.get(number)
+
+    def floor(self, number: int, chunks=None) -> Floor:
+        return read_floor(self.index, number, chunks)
+
+class OpenMapSource:
+    """A map in memory (a FloorStore or a dict of Floors) as one side of diff_maps."""
+    def __init__(self, floors):
+        self.floors = floors
+
+    def numbers(self) -> Iterable[int]:
+        return self.floors
+
+    def hashes(self, number: int) -> Optional[FloorHashes]:
+        return store_hashes(self.floors, number) if number in self.floors else None
+
+    def floor(self, number: int, chunks=None) -> Floor:
+        return _peek(self.floors, number)
+
+class FloorDiff:
+    """How one floor differs between two maps: cells of the second map relative to the first."""
+    __slots__ = ("floor", "chunks", "added", "removed", "changed", "edges")
+
+    def __init__(self, floor: int):
+        self.floor = floor
+        self.chunks: List[ChunkKey] = []  # Chunks whose hashes differ
+        self.added: List[Tuple[int, int]] = []
+        self.removed: List[Tuple[int, int]] = []
+        self.changed: List[Tuple[int, int]] = []
+        self.edges: List[ChunkKey] = []  # Chunks whose walls and doors differ
+
+    def as_dict(self) -> Dict:
+        return {"floor": self.floor, "chunks": [list(key) for key in self.chunks],
+                "added": [list(pos) for pos in self.added], "removed": [list(pos) for pos in self.removed],
+                "changed": [list(pos) for pos in self.changed], "edges": [list(key) for key in self.edges]}
+
+def _saved_states(floor: Floor, key: ChunkKey) -> Dict[Tuple[int, int], tuple]:
+    return {pos: cell.state() for pos, cell in floor.chunk_cells(key).items() if cell.explored or cell.locked}
+
+def diff_maps(a, b) -> List[FloorDiff]:
+    """
+    The floors, chunks and cells where map `b` differs from map `a` (FileSource or
+    OpenMapSource). Only floors whose digests differ are compared chunk by chunk, and only
+    chunks whose hashes differ are compared cell by cell.
+    """
+    empty = FloorHashes()
+    diffs = []
+    for number in sorted(set(a.numbers()) | set(b.numbers())):
+        hashes_a, hashes_b = a.hashes(number) or empty, b.hashes(number) or empty
+        if hashes_a.digest == hashes_b.digest:
+            continue
+        diff = FloorDiff(number)
+        diff.chunks = sorted(key for key in hashes_a.chunks.keys() | hashes_b.chunks.keys()
+                             if hashes_a.chunks.get(key) != hashes_b.chunks.get(key))
+        wanted = set(diff.chunks)
+        floor_a = a.floor(number, wanted) if hashes_a.chunks else Floor()
+        floor_b = b.floor(number, wanted) if hashes_b.chunks else Floor()
+        for key in diff.chunks:
+            cells_a, cells_b = _saved_states(floor_a, key), _saved_states(floor_b, key)
+            for pos in sorted(cells_a.keys() | cells_b.keys()):
+                state_a, state_b = cells_a.get(pos), cells_b.get(pos)
+                if state_a is None:
+                    diff.added.append(pos)
+                elif state_b is None:
+                    diff.removed.append(pos)
+                elif state_a != state_b:
+                    diff.changed.append(pos)
+            masks_a, masks_b = floor_a.edges.chunk(key), floor_b.edges.chunk(key)
+            if (bytes(masks_a) if masks_a else None) != (bytes(masks_b) if masks_b else None):
+                diff.edges.append(key)
+        diffs.append(diff)
+    return diffs
+
+def describe_diff(diffs: List[FloorDiff]) -> List[str]:
+    """One line per differing floor, for printing."""
+    return [f"floor {diff.floor}: {len(diff.chunks)} chunk(s) differ, {len(diff.added)} cell(s) added, "
+            f"{len(diff.removed)} removed, {len(diff.changed)} changed, walls/doors in {len(diff.edges)} chunk(s)"
+            for diff in diffs]
@@ -0,0 +1,81 @@
+"""
+Cell labels drawn on the map (T key), instead of only in the hover tooltip.
+
+Rendering text is the expensive part, so each label is rendered once per font size
+and kept in an LRU cache of surfaces. Labels that would overlap one already placed
+this frame are culled with a coarse screen-space grid. Labels nearest the player are
+placed first. Below LABEL_MIN_ZOOM the text would be unreadable and no labels are
+drawn at all.
+"""
+from collections import OrderedDict
+
+import pygame
+
+import config
+
+class LabelLayer:
+    def __init__(self, app):
+        self.app = app
+        self.enabled = False
+        self.fonts = {}  # Font size -> pygame.font.Font
+        self.text_surfaces = OrderedDict()  # (label, font size) -> surface, least recently used first
+
+    def toggle(self):
+        self.enabled = not self.enabled
+
+    def font_size(self) -> int:
+        return max(config.LABEL_MIN_FONT_SIZE, round(config.LABEL_FONT_SIZE * self.app.zoom))
+
+    def text_surface(self, label: str, size: int) -> pygame.Surface:
+        """The label rendered at `size` on a LABEL_BG_COLOR box, from the cache when possible."""
+        key = (label, size)
+        surface = self.text_surfaces.get(key)
+        if surface is not None:
+            self.text_surfaces.move_to_end(key)
+            return surface
+
+        font = self.fonts.get(size)
+        if font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            font = self.fonts[size] = pygame.font.Font(None, size)
+        text = font.render(label, True, config.TEXT_COLOR)
+        surface = pygame.Surface((text.get_width() + 6, text.get_height() + 2), pygame.SRCALPHA)
+        surface.fill(config.LABEL_BG_COLOR)
+        surface.blit(text, (3, 1))
+
+        self.text_surfaces[key] = surface
+        if len(self.text_surfaces) > config.LABEL_CACHE_ENTRIES:
+            self.text_surfaces.popitem(last=False)
+        return surface
+
+    def draw(self) -> int:
+        """Draws the labels of the visible cells that fit without overlapping. Returns how many were drawn."""
+        app = self.app
+        if not self.enabled or app.zoom < config.LABEL_MIN_ZOOM:
+            return 0
+        floor = app.floors.get(app.current_floor)
+        if floor is None:
+            return 0
+
+        px, py = app.current_pos
+        labeled = [(pos, cell.label) for pos, cell in floor.cells_in_rect(*app.visible_grid_rect()) if cell.label]
+        labeled.sort(key=lambda item: (item[0][0] - px) ** 2 + (item[0][1] - py) ** 2)
+
+        size = self.font_size()
+        bucket = config.LABEL_GRID_BUCKET
+        placed = {}  # (bucket x, bucket y) -> rects placed there this frame
+        drawn = 0
+        for pos, label in labeled:
+            surface = self.text_surface(label, size)
+            screen_x, screen_y = app.grid_to_screen(*pos)
+            rect = surface.get_rect(center=(round(screen_x), round(screen_y)))
+            buckets = [(bx, by) for bx in range(rect.left // bucket, rect.right // bucket + 1)
+                       for by in range(rect.top // bucket, rect.bottom // bucket + 1)]
+            if any(rect.colliderect(other) for key in buckets for other in placed.get(key, ())):
+                continue
+            for key in buckets:
+                placed.setdefault(key, []).append(rect)
+            app.screen.blit(surface, rect)
+            drawn += 1
+        return drawn
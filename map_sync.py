@@ -0,0 +1,402 @@
+"""
+Collaborative mapping: two or more mappers on the local network edit the same map.
+
+Every cell is a last-writer-wins register. A committed change (anything that reaches
+DungeonMapper.change_listeners) is stamped with (Lamport clock, replica id), and all of
+a frame's changes go to the peers as one "ops" message. A peer applies an op only if
+its stamp is newer than the stamp it holds for that cell, so every mapper ends up with
+the same map whatever order the ops arrive in. A write made after merging another one
+always wins over it. Edits made concurrently, before either mapper has seen the other's,
+are settled by the stamps alone: the higher clock, then the higher replica id. That is
+not necessarily the edit made last by wall-clock time. Erasing a cell leaves a stamped
+tombstone, so an erase is not undone by an older write. Ops a mapper accepts are
+passed on to its other peers, so peers do not all need to be connected to each other.
+Cells nobody has edited since the mapper started have stamp (0, 0). Where two mappers
+disagree about such a cell, the stamps tie: a cell wins over no cell, and otherwise the
+larger state wins.
+
+A peer that connects or reconnects catches up by anti-entropy, not by a full
+transfer. Both sides send one hash per floor. For the floors that differ they send one
+hash per 16x16 chunk (see data_models.CHUNK_SIZE), then the cells of the chunks that
+differ. Chunk hashes cover cells, tombstones and stamps, and are cached per chunk version.
+Floors are read through FloorStore.peek(), so hashing a spilled floor reads it once per
+change of its version and does not load it back.
+
+Set CRAWLTOGRAPHER_SYNC_PORT to the port to listen on (default 5002), and
+CRAWLTOGRAPHER_SYNC_PEERS to the mappers to connect to ("host:port,..."). Sync is on
+when either is set. Listing a peer on one side is enough; that side reconnects
+every SYNC_RETRY_SECONDS after losing the connection.
+
+Messages are newline-delimited JSON:
+    {"t":"hello","id":replica,"floors":{floor:hash}}
+    {"t":"hashes","f":floor,"h":{"cx,cy":hash}}
+    {"t":"ops","f":floor,"o":[[x,y,lamport,replica,state],...]}
+where state is [flags, icon, label] (flags: 1 explored, 2 locked) or null for no cell.
+Only cells are synced. Walls and doors are not, and neither are the players' positions.
+"""
+import hashlib
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from data_models import CHUNK_SHIFT, CellState, IconType
+
+SYNC_HOST = "0.0.0.0"
+SYNC_PORT = int(os.environ.get("CRAWLTOGRAPHER_SYNC_PORT") or 5002)
+SYNC_PEERS = os.environ.get("CRAWLTOGRAPHER_SYNC_PEERS", "")
+SYNC_ENABLED = bool(os.environ.get("CRAWLTOGRAPHER_SYNC_PORT") or SYNC_PEERS)
+SYNC_RETRY_SECONDS = 3.0
+SYNC_BATCH_OPS = 1024  # Ops per message when sending whole chunks
+
+Position = Tuple[int, int]
+Stamp = Tuple[int, int]  # (Lamport clock, replica id)
+NO_STAMP: Stamp = (0, 0)
+
+def _encode(message) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+def _visible_state(cell) -> Optional[CellState]:
+    """A cell's state as synced: None for no cell or one that would not be saved."""
+    if cell is None or not (cell.explored or cell.locked):
+        return None
+    return cell.state()
+
+def encode_state(state: Optional[CellState]):
+    if state is None:
+        return None
+    explored, icon, label, locked = state
+    return [(1 if explored else 0) | (2 if locked else 0), icon.value, label]
+
+def decode_state(entry) -> Optional[CellState]:
+    if entry is None:
+        return None
+    flags, icon, label = entry
+    return (bool(flags & 1), IconType(icon), label, bool(flags & 2))
+
+def _wins(stamp: Stamp, state, other_stamp: Stamp, other_state) -> bool:
+    """True if (stamp, state) replaces (other_stamp, other_state) under last-writer-wins."""
+    if stamp != other_stamp:
+        return stamp > other_stamp
+    # Equal stamps only happen for cells nobody edited this session. A cell beats no cell (a
+    # mapper without the chunk sends nothing for it), and any total order settles the rest.
+    if state is None or other_state is None:
+        return other_state is None and state is not None
+    return json.dumps(encode_state(state)) > json.dumps(encode_state(other_state))
+
+class _Peer:
+    """One connection. Lines are read and written by their own threads; the main thread only queues."""
+    def __init__(self, sock, addr, inbox: queue.Queue):
+        self.sock = sock
+        self.addr = addr
+        self.id = None  # Replica id, from the peer's hello
+        self.outbox = queue.Queue()
+        self.alive = True
+        self.pending: List[bytes] = []  # This frame's messages, sent together by flush()
+        self.inbox = inbox
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def queue(self, message: dict):
+        self.pending.append(_encode(message))
+
+    def flush(self):
+        if self.pending:
+            self.outbox.put(b''.join(self.pending))
+            self.pending = []
+
+    def close(self):
+        self.alive = False
+        self.outbox.put(None)
+
+    def _read_loop(self):
+        try:
+            for line in self.sock.makefile('rb'):
+                self.inbox.put((self, json.loads(line)))
+        except (OSError, ValueError):
+            pass
+        self.inbox.put((self, None))
+
+    def _write_loop(self):
+        while True:
+            data = self.outbox.get()
+            if data is None:
+                break
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                break
+        self.alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+class MapSync:
+    """
+    The sync state of one mapper: its clock, the stamps of edited cells, and its peers.
+
+    Network threads only move bytes. Stamping local changes, merging remote ops and
+    answering anti-entropy all happen in publish_frame(), on the main thread, once per frame.
+    """
+    def __init__(self, app, port: int = SYNC_PORT, peers: Iterable[str] = (), host: str = SYNC_HOST):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.replica = random.SystemRandom().randrange(1, 1 << 31)
+        self.clock = 0
+        # floor -> chunk -> position -> stamp, for every cell (or tombstone) edited since startup
+        self.stamps: Dict[int, Dict[Tuple[int, int], Dict[Position, Stamp]]] = {}
+        self.hashes: Dict[int, Dict[Tuple[int, int], tuple]] = {}  # floor -> chunk -> (chunk version, hash)
+        self.hashed: Dict[int, Optional[int]] = {}  # floor -> FloorStore.version() its chunk hashes are current for
+        self.dirty: Dict[int, set] = {}  # floor -> positions changed locally this frame
+        self.applying = False  # Set while remote ops are applied, so they are not sent back out
+        self.peers: List[_Peer] = []
+        self.inbox = queue.Queue()  # (peer, message); message None = disconnected, "connected" = new peer
+        self.addresses = [_parse_address(peer) for peer in peers if peer.strip()]
+        self.ops_received = 0
+        self.ops_sent = 0
+        app.change_listeners.append(self.on_cells_changed)
+
+    def start(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind((self.host, self.port))
+            server.listen()
+        except OSError as e:
+            print(f"ERROR: Could not start map sync on port {self.port}. {e}")
+        else:
+            self.port = server.getsockname()[1]  # The port actually bound, if 0 was asked for
+            print(f"Map sync listening on port {self.port}...")
+            threading.Thread(target=self._accept_loop, args=(server,), daemon=True).start()
+        for address in self.addresses:
+            threading.Thread(target=self._dial_loop, args=(address,), daemon=True).start()
+
+    def _accept_loop(self, server):
+        while True:
+            try:
+                sock, addr = server.accept()
+            except OSError:
+                break
+            self._connected(sock, addr)
+
+    def _dial_loop(self, address: Tuple[str, int]):
+        """Keeps a connection to one configured peer, reconnecting when it drops."""
+        while True:
+            try:
+                sock = socket.create_connection(address, timeout=SYNC_RETRY_SECONDS)
+            except OSError:
+                time.sleep(SYNC_RETRY_SECONDS)
+                continue
+            sock.settimeout(None)
+            peer = self._connected(sock, address)
+            while peer.alive:
+                time.sleep(SYNC_RETRY_SECONDS / 4)
+            time.sleep(SYNC_RETRY_SECONDS)
+
+    def _connected(self, sock, addr) -> _Peer:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        peer = _Peer(sock, addr, self.inbox)
+        self.inbox.put((peer, "connected"))
+        return peer
+
+    # Local changes
+
+    def on_cells_changed(self, floor, positions):
+        if self.applying:
+            return
+        if floor is None:
+            # A new or loaded map: its cells count as unedited, and peers are re-compared
+            self.stamps.clear()
+            self.hashes.clear()
+            self.hashed.clear()
+            self.dirty.clear()
+            for peer in self.peers:
+                peer.queue(self._hello())
+            return
+        self.dirty.setdefault(floor, set()).update(positions)
+
+    def publish_frame(self):
+        """Stamps and sends this frame's local changes, then handles what peers sent. Called from the main loop."""
+        if self.dirty:
+            self.clock += 1
+            stamp = (self.clock, self.replica)
+            for floor, positions in self.dirty.items():
+                cells = self.app.floors.get(floor, {})
+                ops = []
+                for pos in positions:
+                    self._set_stamp(floor, pos, stamp)
+                    ops.append([pos[0], pos[1], stamp[0], stamp[1], encode_state(_visible_state(cells.get(pos)))])
+                self._broadcast(floor, ops)
+            self.dirty.clear()
+
+        while True:
+            try:
+                peer, message = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if message == "connected":
+                self.peers.append(peer)
+                peer.queue(self._hello())
+            elif message is None:
+                if peer in self.peers:
+                    self.peers.remove(peer)
+                    print(f"Map sync peer {peer.addr} disconnected")
+                peer.close()
+            elif peer.alive:
+                try:
+                    self._receive(peer, message)
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Map sync: bad message from {peer.addr}: {e}")
+                    peer.close()
+
+        for peer in self.peers:
+            peer.flush()
+
+    def _broadcast(self, floor: int, ops: list, exclude: _Peer = None):
+        # Peers whose hello has not arrived yet get the ops too: this mapper's hello went
+        # out first on the same connection, and it was hashed before these ops were made
+        for peer in self.peers:
+            if peer is not exclude:
+                peer.queue({'t': 'ops', 'f': floor, 'o': ops})
+                self.ops_sent += len(ops)
+
+    # Remote changes
+
+    def _receive(self, peer: _Peer, message: dict):
+        kind = message['t']
+        if kind == 'hello':
+            peer.id = message['id']
+            print(f"Map sync peer {peer.addr} connected")
+            theirs = {int(floor): digest for floor, digest in message['floors'].items()}
+            mine = self.floor_hashes()
+            for floor in sorted(set(mine) | set(theirs)):
+                if mine.get(floor) != theirs.get(floor):
+                    peer.queue({'t': 'hashes', 'f': floor, 'h': {f"{cx},{cy}": digest for (cx, cy), digest in self.chunk_hashes(floor).items()}})
+        elif kind == 'hashes':
+            floor = message['f']
+            theirs = message['h']
+            keys = [key for key, digest in self.chunk_hashes(floor).items() if theirs.get(f"{key[0]},{key[1]}") != digest]
+            cells = self._peek(floor) if keys else None
+            ops = []
+            for key in keys:
+                ops.extend(self._chunk_ops(floor, cells, key))
+            for start in range(0, len(ops), SYNC_BATCH_OPS):
+                peer.queue({'t': 'ops', 'f': floor, 'o': ops[start:start + SYNC_BATCH_OPS]})
+            self.ops_sent += len(ops)
+        elif kind == 'ops':
+            self.merge(message['f'], message['o'], peer)
+
+    def merge(self, floor: int, ops: list, source: _Peer = None) -> int:
+        """Applies the ops that win over what this mapper holds and passes them on. Returns how many won."""
+        self.ops_received += len(ops)
+        cells = self.app.get_floor(floor)
+        accepted = []
+        writes = []
+        for op in ops:
+            x, y, lamport, replica, entry = op
+            pos = (x, y)
+            stamp = (lamport, replica)
+            if lamport > self.clock:
+                self.clock = lamport
+            state = decode_state(entry)
+            if not _wins(stamp, state, self._stamp(floor, pos), _visible_state(cells.get(pos))):
+                continue
+            self._set_stamp(floor, pos, stamp)
+            writes.append((pos, state))
+            accepted.append(op)
+        if writes:
+            cells.set_states(writes)
+            self.applying = True
+            try:
+                self.app._notify_cells_changed(floor, [pos for pos, _ in writes])
+            finally:
+                self.applying = False
+            self._broadcast(floor, accepted, exclude=source)
+        return len(accepted)
+
+    # Stamps and hashes
+
+    def _stamp(self, floor: int, pos: Position) -> Stamp:
+        chunk = self.stamps.get(floor, {}).get((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+        return chunk.get(pos, NO_STAMP) if chunk else NO_STAMP
+
+    def _set_stamp(self, floor: int, pos: Position, stamp: Stamp):
+        key = (pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT)
+        self.stamps.setdefault(floor, {}).setdefault(key, {})[pos] = stamp
+        self.hashes.get(floor, {}).pop(key, None)
+        self.hashed.pop(floor, None)
+
+    def _peek(self, floor: int):
+        """The Floor, without changing which floors are resident; None if there is no such floor."""
+        floors = self.app.floors
+        return floors.peek(floor) if floor in floors else None
+
+    def _chunk_entries(self, floor: int, cells, key: Tuple[int, int]) -> list:
+        """(position, stamp, encoded state) for every cell and tombstone of a chunk of `cells`, sorted."""
+        chunk = cells.chunk_cells(key) if cells is not None else {}
+        stamps = self.stamps.get(floor, {}).get(key, {})
+        entries = []
+        for pos in set(chunk) | set(stamps):
+            state = encode_state(_visible_state(chunk.get(pos)))
+            stamp = stamps.get(pos, NO_STAMP)
+            if state is not None or stamp != NO_STAMP:
+                entries.append((pos, stamp, state))
+        entries.sort()
+        return entries
+
+    def _chunk_ops(self, floor: int, cells, key: Tuple[int, int]) -> list:
+        return [[x, y, stamp[0], stamp[1], state] for (x, y), stamp, state in self._chunk_entries(floor, cells, key)]
+
+    def chunk_hashes(self, floor: int) -> Dict[Tuple[int, int], str]:
+        """chunk -> hash of its cells, tombstones and stamps, for the non-empty chunks of a floor."""
+        floors = self.app.floors
+        version = floors.version(floor) if floor in floors else None
+        cache = self.hashes.setdefault(floor, {})
+        if floor not in self.hashed or self.hashed[floor] != version:
+            # Chunk versions are unique across floors, so entries made from a floor that
+            # was since replaced, or spilled and loaded back, are never taken as current
+            cells = self._peek(floor)
+            keys = set(cells.chunks) if cells is not None else set()
+            keys.update(self.stamps.get(floor, {}))
+            for key in cache.keys() - keys:
+                del cache[key]
+            for key in keys:
+                chunk_version = cells.chunk_versions.get(key) if cells is not None else None
+                cached = cache.get(key)
+                if cached is None or cached[0] != chunk_version:
+                    entries = self._chunk_entries(floor, cells, key)
+                    digest = hashlib.blake2b(json.dumps(entries, separators=(',', ':')).encode('utf-8'), digest_size=8).hexdigest() if entries else None
+                    cache[key] = (chunk_version, digest)
+            self.hashed[floor] = version
+        return {key: digest for key, (_, digest) in cache.items() if digest}
+
+    def floor_hashes(self) -> Dict[int, str]:
+        """floor -> hash of its chunk hashes, for every floor with cells or tombstones."""
+        result = {}
+        for floor in set(self.app.floors) | set(self.stamps):
+            chunks = self.chunk_hashes(floor)
+            if chunks:
+                joined = ";".join(f"{cx},{cy}:{digest}" for (cx, cy), digest in sorted(chunks.items()))
+                result[floor] = hashlib.blake2b(joined.encode('utf-8'), digest_size=8).hexdigest()
+        return result
+
+    def _hello(self) -> dict:
+        return {'t': 'hello', 'id': self.replica, 'floors': {str(floor): digest for floor, digest in self.floor_hashes().items()}}
+
+    def close(self):
+        for peer in self.peers:
+            peer.close()
+
+def _parse_address(text: str) -> Tuple[str, int]:
+    """"host:port", "host" or ":port" -> (host, port)."""
+    host, separator, port = text.strip().rpartition(':')
+    if not separator:
+        return (port, SYNC_PORT)
+    return (host or "127.0.0.1", int(port))
@@ -0,0 +1,373 @@
+"""
+Command-line tools for map files. Needs no display (and no pygame).
+
+    python -m map_tool stats maps/*.json
+    python -m map_tool validate archive/*.json --jobs 8
+    python -m map_tool convert archive/*.json --to .jsonl --out-dir converted/
+    python -m map_tool merge dungeon.json -o merged.json --floors 2,3 --into 1
+    python -m map_tool export dungeon.json -o dungeon.csv
+    python -m map_tool png dungeon.json --out-dir png/ --cell-size 32 --jobs 8
+    python -m map_tool import layout.tmx rooms/*.txt --to .jsonl --mapping tiles.json
+    python -m map_tool export-grid dungeon.jsonl -o dungeon.tmx
+    python -m map_tool diff dungeon.jsonl dungeon.autosave.jsonl
+    python -m map_tool index maps/*.jsonl
+
+Floors are processed one at a time (see file_manager.read_map_stream), so with .jsonl
+maps memory use is bounded by the largest floor rather than the whole map. Commands
+that take several files can spread them over a process pool with --jobs.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from data_models import EdgeLayer, IconType
+from file_manager import SavedCells, decode_cells, decode_edges, encode_edges, read_map_stream, save_map_stream
+from grid_formats import find_start, grid_format, load_mapping, read_grid, start_header, write_grid
+from map_hash import FileSource, MapIndex, describe_diff, diff_maps, index_path
+
+MAX_REPORTED_ERRORS = 20
+ICON_VALUES = {icon.value for icon in IconType}
+
+def _parse_pos(pos_str: str):
+    x, y = pos_str.split(',')
+    return int(x), int(y)
+
+def map_stats(path: str) -> dict:
+    """Cell, icon and bounds statistics for every floor of a map."""
+    header, floors = read_map_stream(path)
+    result = {'file': path, 'current_floor': header['current_floor'], 'floors': []}
+    for floor, cells in floors:
+        icons = Counter()
+        explored = locked = labelled = 0
+        min_x = min_y = max_x = max_y = None
+        for pos_str, cell in cells.items():
+            x, y = _parse_pos(pos_str)
+            if min_x is None:
+                min_x, min_y, max_x, max_y = x, y, x, y
+            else:
+                min_x, min_y, max_x, max_y = min(min_x, x), min(min_y, y), max(max_x, x), max(max_y, y)
+            explored += bool(cell.get('explored', True))
+            locked += bool(cell.get('locked', False))
+            labelled += bool(cell.get('label'))
+            if cell['icon'] != IconType.NONE.value:
+                icons[cell['icon']] += 1
+        result['floors'].append({
+            'floor': floor,
+            'cells': len(cells),
+            'explored': explored,
+            'locked': locked,
+            'labelled': labelled,
+            'icons': dict(sorted(icons.items())),
+            'edge_cells': len(decode_edges(cells.edges)),
+            'bounds': [min_x, min_y, max_x, max_y] if cells else None,
+        })
+    return result
+
+def validate_map(path: str) -> dict:
+    """Checks a map file against the format save_map_data writes. Returns the problems found."""
+    errors = []
+    try:
+        header, floors = read_map_stream(path)
+        if not isinstance(header['current_floor'], int):
+            errors.append(f"current_floor is not an integer: {header['current_floor']!r}")
+        pos = header['current_pos']
+        if len(pos) != 2 or not all(isinstance(v, int) for v in pos):
+            errors.append(f"current_pos is not an (x, y) pair of integers: {list(pos)!r}")
+        if header['rotation'] not in (0, 90, 180, 270):
+            errors.append(f"rotation is not 0, 90, 180 or 270: {header['rotation']!r}")
+
+        seen = set()
+        for floor, cells in floors:
+            if floor in seen:
+                errors.append(f"floor {floor} appears more than once")
+            seen.add(floor)
+            if not isinstance(cells, dict):
+                errors.append(f"floor {floor}: cells are not an object")
+                continue
+            for pos_str, cell in cells.items():
+                where = f"floor {floor}, cell {pos_str}"
+                try:
+                    _parse_pos(pos_str)
+                except ValueError:
+                    errors.append(f"{where}: position is not 'x,y'")
+                if not isinstance(cell, dict):
+                    errors.append(f"{where}: not an object")
+                    continue
+                if cell.get('icon') not in ICON_VALUES:
+                    errors.append(f"{where}: unknown icon {cell.get('icon')!r}")
+                if not isinstance(cell.get('label', ""), str):
+                    errors.append(f"{where}: label is not a string")
+                for flag in ('explored', 'locked'):
+                    if not isinstance(cell.get(flag, False), bool):
+                        errors.append(f"{where}: {flag} is not true/false")
+            for key, data in cells.edges.items():
+                try:
+                    decode_edges({key: data})
+                except (ValueError, TypeError) as e:
+                    errors.append(f"floor {floor}, edges {key}: {e}")
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        errors.append(f"unreadable: {e}")
+    return {'file': path, 'valid': not errors, 'errors': errors}
+
+def convert_map(path: str, output: str) -> dict:
+    """Rewrites a map in the format implied by the output's extension (.json or .jsonl)."""
+    header, floors = read_map_stream(path)
+    save_map_stream(output, header, ((floor, decode_cells(cells)) for floor, cells in floors))
+    return {'file': path, 'output': output}
+
+def merge_floors(path: str, output: str, sources, target: int) -> dict:
+    """
+    Merges the `sources` floors into floor `target`. The target's own cells come first and
+    each source is laid over it in the order given, so later floors win where cells overlap.
+    The source floors are removed; all other floors are copied unchanged.
+    """
+    header, floors = read_map_stream(path)
+    sources = [floor for floor in sources if floor != target]
+    held = {}
+
+    def passthrough():
+        for floor, cells in floors:
+            if floor == target or floor in sources:
+                held[floor] = cells
+            else:
+                yield floor, decode_cells(cells)
+        merged = SavedCells(held.get(target, {}))
+        edges = EdgeLayer()
+        for floor in [target] + sources:
+            saved = held.get(floor)
+            if saved is None:
+                continue
+            if floor != target:
+                merged.update(saved)
+            edges.set_masks((pos, mask) for pos, mask in decode_edges(saved.edges).items())
+        merged.edges = encode_edges(edges)
+        yield target, decode_cells(merged)
+
+    save_map_stream(output, header, passthrough())
+    return {'file': path, 'output': output, 'merged': sorted(held)}
+
+def export_csv(path: str, output: str) -> dict:
+    """Writes every saved cell as a CSV row: floor, x, y, explored, icon, label, locked."""
+    _, floors = read_map_stream(path)
+    rows = 0
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['floor', 'x', 'y', 'explored', 'icon', 'label', 'locked'])
+        for floor, cells in floors:
+            for pos_str, cell in cells.items():
+                x, y = _parse_pos(pos_str)
+                writer.writerow([floor, x, y, int(cell.get('explored', True)), cell['icon'],
+                                 cell.get('label', ""), int(cell.get('locked', False))])
+                rows += 1
+    return {'file': path, 'output': output, 'rows': rows}
+
+def import_grid_file(path: str, output: str, floor: int = 0, mapping_path: str = None) -> dict:
+    """
+    Converts an ASCII, CSV or TMX layout to a map file. With a .jsonl output, each floor
+    is written as soon as it has been read.
+    """
+    fmt = grid_format(path)
+    if fmt is None:
+        raise ValueError("not a .txt, .csv or .tmx file")
+    mapping = load_mapping(fmt, mapping_path)
+    header = start_header(find_start(path, mapping, floor), floor)
+    counts = []
+
+    def floors():
+        for number, cells in read_grid(path, mapping, floor):
+            counts.append(len(cells))
+            yield number, cells
+
+    save_map_stream(output, header, floors())
+    return {'file': path, 'output': output, 'floors': len(counts), 'cells': sum(counts)}
+
+def export_grid_file(path: str, output: str, floor: int = None, mapping_path: str = None) -> dict:
+    """
+    Writes a map file as an ASCII, CSV or TMX layout, one floor at a time. A CSV grid
+    holds one floor: `floor`, or the map's current floor.
+    """
+    fmt = grid_format(output)
+    if fmt is None:
+        raise ValueError(f"{output} is not a .txt, .csv or .tmx file")
+    header, _ = read_map_stream(path)
+    if floor is None and fmt == "csv":
+        floor = header['current_floor']
+
+    def floors():
+        _, stream = read_map_stream(path)
+        for number, cells in stream:
+            if floor is None or number == floor:
+                yield number, decode_cells(cells)
+
+    written = write_grid(output, floors, load_mapping(fmt, mapping_path))
+    return {'file': path, 'output': output, 'floors': written}
+
+def index_map(path: str) -> dict:
+    """Writes the chunk-hash index (see map_hash) next to a map, so diffs and saves can skip unchanged floors."""
+    index = MapIndex.build(path)
+    index.save()
+    return {'file': path, 'output': index_path(index.path), 'floors': len(index.floors),
+            'chunks': sum(len(hashes.chunks) for hashes in index.floors.values())}
+
+def diff_files(first: str, second: str) -> dict:
+    """The floors, chunks and cells where `second` differs from `first`."""
+    diffs = diff_maps(FileSource(first), FileSource(second))
+    return {'file': first, 'other': second, 'same': not diffs, 'summary': describe_diff(diffs),
+            'floors': [diff.as_dict() for diff in diffs]}
+
+def _call(job):
+    function, args = job
+    try:
+        return function(*args)
+    except (OSError, ValueError, KeyError, TypeError, csv.Error) as e:
+        return {'file': args[0], 'error': str(e)}
+
+def run_jobs(function, arg_lists, jobs: int):
+    """Runs function(*args) for each entry, in a process pool when jobs > 1. Results keep input order."""
+    work = [(function, args) for args in arg_lists]
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(_call, work, chunksize=max(1, len(work) // (jobs * 4))))
+    return [_call(job) for job in work]
+
+def _output_path(path: str, args, suffix: str) -> str:
+    if args.output:
+        return args.output
+    base = os.path.splitext(os.path.basename(path))[0] + (args.to or suffix)
+    return os.path.join(args.out_dir or os.path.dirname(path), base)
+
+def _print_stats(result: dict):
+    print(result['file'])
+    for floor in result['floors']:
+        bounds = floor['bounds']
+        extent = f"({bounds[0]},{bounds[1]})-({bounds[2]},{bounds[3]})" if bounds else "empty"
+        print(f"  floor {floor['floor']}: {floor['cells']} cells ({floor['explored']} explored, "
+              f"{floor['locked']} locked, {floor['labelled']} labelled, {floor['edge_cells']} with walls), bounds {extent}")
+        if floor['icons']:
+            print("    icons: " + ", ".join(f"{icon}={count}" for icon, count in floor['icons'].items()))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="map_tool", description="Batch operations on Dungeon Crawltographer map files.")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for multi-file commands")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stats = sub.add_parser("stats", help="Cells, icons and bounds per floor")
+    stats.add_argument("files", nargs="+")
+
+    validate = sub.add_parser("validate", help="Check files against the map format")
+    validate.add_argument("files", nargs="+")
+
+    for name, help_text in (("convert", "Rewrite maps as .json or .jsonl"), ("export", "Export cells to CSV")):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("files", nargs="+")
+        command.add_argument("-o", "--output", help="Output file (single input only)")
+        command.add_argument("--out-dir", help="Directory for outputs (default: next to each input)")
+        command.add_argument("--to", help="Output extension, e.g. .jsonl" if name == "convert" else argparse.SUPPRESS)
+
+    png = sub.add_parser("png", help="Render every floor to a PNG image (floors in parallel with --jobs)")
+    png.add_argument("files", nargs="+")
+    png.add_argument("--out-dir", default=".")
+    png.add_argument("--cell-size", type=int, default=32, help="Pixels per cell")
+
+    grid_import = sub.add_parser("import", help="Convert ASCII (.txt), CSV grid (.csv) or Tiled (.tmx) layouts to maps")
+    grid_import.add_argument("files", nargs="+")
+    grid_import.add_argument("-o", "--output", help="Output file (single input only)")
+    grid_import.add_argument("--out-dir", help="Directory for outputs (default: next to each input)")
+    grid_import.add_argument("--to", help="Output extension, .json (default) or .jsonl")
+    grid_import.add_argument("--floor", type=int, default=0, help="Floor number for files without floor markers")
+    grid_import.add_argument("--mapping", help="JSON file mapping characters/tiles to icons (see grid_formats)")
+
+    grid_export = sub.add_parser("export-grid", help="Write maps as ASCII (.txt), CSV grid (.csv) or Tiled (.tmx) layouts")
+    grid_export.add_argument("files", nargs="+")
+    grid_export.add_argument("-o", "--output", help="Output file (single input only)")
+    grid_export.add_argument("--out-dir", help="Directory for outputs (default: next to each input)")
+    grid_export.add_argument("--to", help="Output extension: .txt, .csv or .tmx")
+    grid_export.add_argument("--floor", type=int, help="Export only this floor (CSV default: the current floor)")
+    grid_export.add_argument("--mapping", help="JSON file mapping icons to characters/tiles (see grid_formats)")
+
+    diff = sub.add_parser("diff", help="List the floors, chunks and cells that differ between two maps (exit code 1 if any)")
+    diff.add_argument("first")
+    diff.add_argument("second")
+
+    index = sub.add_parser("index", help="Write chunk-hash indexes next to maps, for fast diffs and saves")
+    index.add_argument("files", nargs="+")
+
+    merge = sub.add_parser("merge", help="Merge floors of a map into one floor")
+    merge.add_argument("file")
+    merge.add_argument("-o", "--output", required=True)
+    merge.add_argument("--floors", required=True, help="Comma-separated floors to merge, e.g. 2,3")
+    merge.add_argument("--into", type=int, required=True, help="Floor that receives the cells")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "png":
+        from floor_export import export_map_file
+        results = []
+        for path in args.files:
+            try:
+                for floor in export_map_file(path, args.out_dir, args.cell_size, args.jobs):
+                    results.append(dict(floor, file=path, output=floor['path']))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                results.append({'file': path, 'error': str(e)})
+    elif args.command == "diff":
+        result = _call((diff_files, (args.first, args.second)))
+        if args.json:
+            json.dump(result, sys.stdout, indent=2)
+            print()
+        elif 'error' in result:
+            print(f"{result['file']}: error: {result['error']}")
+        else:
+            print(f"{args.first} and {args.second} are the same" if result['same'] else f"{args.second} differs from {args.first}:")
+            for line in result['summary']:
+                print(f"  {line}")
+        return 0 if result.get('same') else 1
+    elif args.command == "index":
+        results = run_jobs(index_map, [(path,) for path in args.files], args.jobs)
+    elif args.command == "merge":
+        sources = [int(floor) for floor in args.floors.split(',')]
+        results = [_call((merge_floors, (args.file, args.output, sources, args.into)))]
+    elif args.command in ("convert", "export", "import", "export-grid"):
+        if args.output and len(args.files) > 1:
+            parser.error("-o/--output needs a single input; use --out-dir for several")
+        if args.command in ("convert", "export-grid") and not (args.output or args.to):
+            parser.error(f"{args.command} needs -o/--output or --to")
+        if args.out_dir:
+            os.makedirs(args.out_dir, exist_ok=True)
+        if args.command in ("import", "export-grid"):
+            function = import_grid_file if args.command == "import" else export_grid_file
+            results = run_jobs(function, [(path, _output_path(path, args, ".json"), args.floor, args.mapping)
+                                          for path in args.files], args.jobs)
+        else:
+            function, suffix = (convert_map, ".json") if args.command == "convert" else (export_csv, ".csv")
+            results = run_jobs(function, [(path, _output_path(path, args, suffix)) for path in args.files], args.jobs)
+    else:
+        function = map_stats if args.command == "stats" else validate_map
+        results = run_jobs(function, [(path,) for path in args.files], args.jobs)
+
+    failed = [r for r in results if 'error' in r or r.get('valid') is False]
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        for result in results:
+            if 'error' in result:
+                print(f"{result['file']}: error: {result['error']}")
+            elif args.command == "stats":
+                _print_stats(result)
+            elif args.command == "validate":
+                print(f"{result['file']}: " + ("ok" if result['valid'] else f"{len(result['errors'])} problem(s)"))
+                for error in result['errors'][:MAX_REPORTED_ERRORS]:
+                    print(f"  {error}")
+                if len(result['errors']) > MAX_REPORTED_ERRORS:
+                    print(f"  ... and {len(result['errors']) - MAX_REPORTED_ERRORS} more")
+            else:
+                print(f"{result['file']} -> {result['output']}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
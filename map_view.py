@@ -0,0 +1,81 @@
+import math
+from typing import Optional, Tuple
+
+import config
+
+class MapView:
+    """
+    Screen <-> grid coordinate conversion for anything that draws the map.
+
+    Expects the subclass to provide window_width, window_height, show_icon_panel,
+    current_pos, camera_x, camera_y, zoom and rotation.
+    """
+
+    def screen_to_grid(self, screen_x: int, screen_y: int) -> Optional[Tuple[int, int]]:
+        """Convert screen coordinates to grid coordinates"""
+        grid_x, grid_y = self.screen_to_grid_float(screen_x, screen_y)
+        return (round(grid_x), round(grid_y))
+
+    def screen_to_grid_float(self, screen_x: float, screen_y: float) -> Tuple[float, float]:
+        """Like screen_to_grid, without rounding: cell centers are at whole numbers."""
+        # Adjust for camera and menu bar
+        panel_h = config.ICON_PANEL_HEIGHT if self.show_icon_panel else 0
+        top_bar_height = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
+        grid_center_x = self.window_width // 2
+        grid_center_y = (self.window_height - top_bar_height - panel_h) // 2 + top_bar_height + panel_h
+
+        # Offset from center
+        offset_x = (screen_x - grid_center_x) / (config.CELL_SIZE * self.zoom)
+        offset_y = (screen_y - grid_center_y) / (config.CELL_SIZE * self.zoom)
+
+        # Apply rotation
+        angle = math.radians(self.rotation)
+        rotated_x = offset_x * math.cos(angle) + offset_y * math.sin(angle)
+        rotated_y = -offset_x * math.sin(angle) + offset_y * math.cos(angle)
+
+        # Add current position and camera
+        return (self.current_pos[0] + rotated_x - self.camera_x, self.current_pos[1] + rotated_y - self.camera_y)
+
+    def visible_grid_rect(self, margin: int = 1) -> Tuple[int, int, int, int]:
+        """(x0, y0, x1, y1), the grid cells the window shows, widened by `margin` cells."""
+        corners = [self.screen_to_grid_float(x, y) for x in (0, self.window_width) for y in (0, self.window_height)]
+        xs = [x for x, _ in corners]
+        ys = [y for _, y in corners]
+        return (math.floor(min(xs)) - margin, math.floor(min(ys)) - margin,
+                math.ceil(max(xs)) + margin, math.ceil(max(ys)) + margin)
+
+    def grid_to_screen(self, grid_x: int, grid_y: int) -> Tuple[float, float]:
+        """Convert grid coordinates to screen coordinates"""
+        return self._grid_to_screen_rotated(grid_x, grid_y)
+
+    def grid_to_screen_unrotated(self, grid_x: int, grid_y: int) -> Tuple[float, float]:
+        """
+        Convert grid coordinates to screen coordinates, ignoring rotation.
+        Useful for drawing UI elements like the selection box that should not rotate with the map.
+        """
+        return self._grid_to_screen_rotated(grid_x, grid_y, apply_rotation=False)
+
+    def _grid_to_screen_rotated(self, grid_x: int, grid_y: int, apply_rotation: bool = True) -> Tuple[float, float]:
+        """Internal helper for grid to screen conversion with optional rotation."""
+        panel_h = config.ICON_PANEL_HEIGHT if self.show_icon_panel else 0
+        top_bar_height = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
+        grid_center_x = self.window_width // 2
+        grid_center_y = (self.window_height - top_bar_height - panel_h) // 2 + top_bar_height + panel_h
+
+        # Offset from current position
+        offset_x = grid_x - self.current_pos[0] + self.camera_x
+        offset_y = grid_y - self.current_pos[1] + self.camera_y
+
+        # Apply rotation
+        if apply_rotation:
+            angle = math.radians(-self.rotation)
+            rotated_x = offset_x * math.cos(angle) + offset_y * math.sin(angle)
+            rotated_y = -offset_x * math.sin(angle) + offset_y * math.cos(angle)
+        else:
+            rotated_x, rotated_y = offset_x, offset_y
+
+        # Convert to screen space
+        screen_x = grid_center_x + rotated_x * config.CELL_SIZE * self.zoom
+        screen_y = grid_center_y + rotated_y * config.CELL_SIZE * self.zoom
+
+        return (screen_x, screen_y)
@@ -0,0 +1,175 @@
+"""
+Latency and throughput counters for the controller link.
+
+Used on both ends: game_pc_client records round-trip times and retransmits, the
+mapper records how long a command takes from arriving on the socket to being
+applied. Standard library only, so the gaming PC needs nothing extra.
+"""
+import csv
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+class LatencyHistogram:
+    """Log-spaced histogram of durations in seconds, from 0.1ms to ~10s."""
+    MIN_VALUE = 0.0001
+    GROWTH = 1.25  # Each bucket is 25% wider than the one before, so percentiles are within ~12%
+    BUCKET_COUNT = 52
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKET_COUNT + 1)  # Last bucket catches everything larger
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        if seconds <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(self.BUCKET_COUNT, int(math.log(seconds / self.MIN_VALUE, self.GROWTH)) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def bucket_upper_bound(self, index: int) -> float:
+        return self.MIN_VALUE * self.GROWTH ** index
+
+    def percentile(self, p: float) -> float:
+        """Approximate p-th percentile (0-100), reported as the upper bound of its bucket."""
+        if not self.count:
+            return 0.0
+        target = math.ceil(self.count * p / 100)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self.max, self.bucket_upper_bound(index))
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> dict:
+        """Count, mean, percentiles and max, in milliseconds."""
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean() * 1000, 3),
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p95_ms': round(self.percentile(95) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+class NetStats:
+    """Thread-safe counters and histograms for one end of the link."""
+    RATE_WINDOW = 5.0  # Seconds of history used for commands per second
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.histograms = {}  # name -> LatencyHistogram
+        self.values = {}  # name -> counter or gauge value
+        self.command_times = deque()
+
+    def record_latency(self, name: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def increment(self, name: str, amount: int = 1):
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + amount
+
+    def set_value(self, name: str, value):
+        with self.lock:
+            self.values[name] = value
+
+    def record_command(self):
+        """Counts one command sent (client) or applied (mapper) for the rate estimate."""
+        now = time.time()
+        with self.lock:
+            self.values['commands'] = self.values.get('commands', 0) + 1
+            self.command_times.append(now)
+            self._trim(now)
+
+    def commands_per_second(self) -> float:
+        now = time.time()
+        with self.lock:
+            self._trim(now)
+            window = min(self.RATE_WINDOW, now - self.started) or self.RATE_WINDOW
+            return len(self.command_times) / window
+
+    def _trim(self, now: float):
+        while self.command_times and now - self.command_times[0] > self.RATE_WINDOW:
+            self.command_times.popleft()
+
+    def snapshot(self) -> dict:
+        rate = self.commands_per_second()
+        with self.lock:
+            data = {
+                'timestamp': round(time.time(), 3),
+                'uptime_s': round(time.time() - self.started, 1),
+                'commands_per_second': round(rate, 2),
+            }
+            data.update(self.values)
+            for name, histogram in self.histograms.items():
+                data[name] = histogram.summary()
+        return data
+
+def flatten(data: dict, prefix: str = '') -> dict:
+    """Turns nested summaries into flat columns, e.g. {'rtt': {'p50_ms': 1}} -> {'rtt_p50_ms': 1}."""
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}_"))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+class StatsWriter(threading.Thread):
+    """
+    Periodically writes NetStats to disk.
+
+    A .csv path gets one row appended per interval (a time series to plot); any
+    other path is overwritten with the latest snapshot as JSON.
+    """
+    def __init__(self, stats: NetStats, path: str, interval: float = 5.0):
+        super().__init__(daemon=True)
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.columns = None
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Error writing network stats to {self.path}: {e}")
+
+    def write(self):
+        snapshot = self.stats.snapshot()
+        if not self.path.lower().endswith('.csv'):
+            with open(self.path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            return
+
+        row = flatten(snapshot)
+        # Histograms appear on first use, so widen the header when new columns show up.
+        if self.columns is None or not set(row) <= set(self.columns):
+            self.columns = list(dict.fromkeys((self.columns or []) + list(row)))
+            write_header = True
+        else:
+            write_header = not os.path.exists(self.path)
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
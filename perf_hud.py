@@ -0,0 +1,163 @@
+"""
+Frame-time HUD (F3).
+
+While the HUD is on, DungeonMapper.run() calls PerfHUD.run_frame(), which runs the
+usual DungeonMapper.frame() with a timer around each phase:
+
+    events       EventHandler.handle_events
+    broadcast    DungeonMapper.publish_frame (map sync, spectators, second view, autosave)
+    grid lines   Renderer.draw_grid_lines
+    ghosts       Renderer.draw_ghost_floors (floors above and below, O)
+    cells        Renderer.draw_cells
+    heat map     Renderer.draw_heat_map (player trail, G)
+    edges        Renderer.draw_edges (walls, doors, one-way passages)
+    labels       Renderer.draw_labels (on-map labels, T)
+    overlays     Renderer.draw_overlays (selection, move preview, player marker)
+    ui           UIManager.draw_ui
+    dialogs      UIManager.draw_dialogs and the label prompt
+    flip         pygame.display.flip
+
+When the HUD is off, nothing is timed or recorded. Shift+F3 writes the last
+HISTORY_FRAMES samples to a CSV file in the working directory.
+"""
+import csv
+import time
+from collections import deque
+
+import pygame
+
+import config
+
+try:
+    from udp_listener import REMOTE_MOVE_EVENT
+except ImportError:
+    REMOTE_MOVE_EVENT = -1
+
+PHASES = ("events", "broadcast", "grid lines", "ghosts", "cells", "heat map", "edges", "labels", "overlays", "ui", "dialogs", "flip")
+HISTORY_FRAMES = 240    # Samples kept for the graph and the CSV dump
+AVERAGE_FRAMES = 60     # Frames averaged for the per-phase figures
+FRAME_BUDGET_MS = 1000 / 60
+GRAPH_HEIGHT = 60
+PHASE_COLORS = {
+    "events": (220, 120, 80), "broadcast": (200, 80, 200), "grid lines": (140, 140, 160), "ghosts": (90, 110, 140),
+    "cells": (100, 150, 200), "heat map": (255, 90, 40), "edges": (235, 235, 240), "labels": (255, 200, 120), "overlays": (150, 200, 255), "ui": (144, 238, 144),
+    "dialogs": (255, 220, 50), "flip": (180, 180, 180),
+}
+
+class PerfHUD:
+    def __init__(self, app):
+        self.app = app
+        self.enabled = False
+        # One dict per frame: frame_ms, phase times in ms and the gauges shown in the HUD
+        self.samples = deque(maxlen=HISTORY_FRAMES)
+        self.last_frame_start = None
+        self.frame_number = 0
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.last_frame_start = None # The gap while the HUD was off is not a frame time
+
+    def run_frame(self):
+        """One frame of DungeonMapper.run(), with every phase timed."""
+        app = self.app
+        clock = time.perf_counter
+        started = clock()
+        sample = {"frame": self.frame_number,
+                  "frame_ms": (started - self.last_frame_start) * 1000 if self.last_frame_start else 0.0}
+        self.last_frame_start = started
+        self.frame_number += 1
+
+        # Remote commands waiting in the pygame queue when the frame starts
+        events = pygame.event.get()
+        sample["remote_queue"] = sum(1 for event in events if event.type == REMOTE_MOVE_EVENT)
+
+        def timed(phase, function):
+            before = clock()
+            result = function()
+            sample[phase] = (clock() - before) * 1000
+            return result
+
+        def overlay(visible_cells):
+            # Everything but the flip is timed by now; the HUD shows this frame too
+            sample["visible_cells"] = visible_cells
+            sample["floor_cells"] = app.floors.cell_count(app.current_floor)
+            sample["total_cells"] = app.floors.total_cells()
+            sample["history"] = len(app.history)
+            sample["work_ms"] = sum(sample[phase] for phase in PHASES if phase in sample)
+            self.samples.append(sample)
+            self.draw()
+
+        app.frame(timed, events, overlay)
+        sample["work_ms"] += sample["flip"]
+
+    def _averages(self) -> dict:
+        recent = list(self.samples)[-AVERAGE_FRAMES:]
+        averages = {}
+        for key in PHASES + ("frame_ms", "work_ms"):
+            values = [sample[key] for sample in recent if key in sample]
+            averages[key] = sum(values) / len(values) if values else 0.0
+        return averages
+
+    def draw(self):
+        """Draws the HUD panel in the top-right corner of the map area."""
+        if not self.samples:
+            return
+        app = self.app
+        latest = self.samples[-1]
+        averages = self._averages()
+        frame_ms = averages["frame_ms"]
+        fps = 1000 / frame_ms if frame_ms else 0.0
+
+        lines = [(f"Frame {frame_ms:5.1f} ms ({fps:4.0f} fps)  work {averages['work_ms']:5.1f} ms", config.TEXT_COLOR)]
+        lines += [(f"{phase:<10} {averages[phase]:6.2f} ms", PHASE_COLORS[phase]) for phase in PHASES]
+        floor_counts = "  ".join(f"{floor}:{app.floors.cell_count(floor)}" for floor in sorted(app.floors)[:6])
+        lines += [
+            (f"Visible cells: {latest['visible_cells']}  Floor: {latest['floor_cells']}  All: {latest['total_cells']}", config.TEXT_COLOR),
+            (f"Per floor: {floor_counts}" + ("  ..." if len(app.floors) > 6 else ""), config.TEXT_COLOR),
+            (f"Floors in memory: {len(app.floors.resident)}/{len(app.floors)}  Loaded from cache: {app.floors.faults}", config.TEXT_COLOR),
+            (f"History: {latest['history']}/{app.max_history}  Remote queue: {latest['remote_queue']}", config.TEXT_COLOR),
+            ("F3 hide | Shift+F3 save CSV", (140, 140, 160)),
+        ]
+        surfaces = [config.SMALL_FONT.render(text, True, color) for text, color in lines]
+        width = max(HISTORY_FRAMES + 20, max(surf.get_width() for surf in surfaces) + 20)
+        height = len(surfaces) * 18 + GRAPH_HEIGHT + 25
+        top = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT + (config.ICON_PANEL_HEIGHT if app.show_icon_panel else 0) + 10
+        panel_rect = pygame.Rect(app.window_width - width - 10, top, width, height)
+        pygame.draw.rect(app.screen, config.UI_BG_COLOR, panel_rect)
+        pygame.draw.rect(app.screen, config.GRID_COLOR, panel_rect, 1)
+        for i, surf in enumerate(surfaces):
+            app.screen.blit(surf, (panel_rect.x + 10, panel_rect.y + 7 + i * 18))
+
+        self._draw_graph(pygame.Rect(panel_rect.x + 10, panel_rect.bottom - GRAPH_HEIGHT - 10, HISTORY_FRAMES, GRAPH_HEIGHT))
+
+    def _draw_graph(self, rect):
+        """Work time per frame as stacked phase bars, one pixel per frame; the line is 60 fps."""
+        screen = self.app.screen
+        pygame.draw.rect(screen, config.BG_COLOR, rect)
+        scale = rect.height / (FRAME_BUDGET_MS * 2)
+        x = rect.right - len(self.samples)
+        for sample in self.samples:
+            y = rect.bottom
+            for phase in PHASES:
+                height = sample.get(phase, 0.0) * scale
+                if height >= 0.5:
+                    top = max(rect.top, y - height)
+                    pygame.draw.line(screen, PHASE_COLORS[phase], (x, y), (x, top))
+                    y = top
+            x += 1
+        budget_y = rect.bottom - FRAME_BUDGET_MS * scale
+        pygame.draw.line(screen, config.CURRENT_POS_COLOR, (rect.left, budget_y), (rect.right - 1, budget_y))
+
+    def dump_csv(self, path: str = None) -> str:
+        """Writes the recorded samples to a CSV file and returns its path."""
+        if path is None:
+            path = time.strftime("perf_%Y%m%d_%H%M%S.csv")
+        columns = ["frame", "frame_ms", "work_ms", *PHASES, "visible_cells", "floor_cells",
+                   "total_cells", "history", "remote_queue"]
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for sample in self.samples:
+                writer.writerow([round(value, 3) if isinstance(value, float) else value
+                                 for value in (sample.get(column, "") for column in columns)])
+        return path
@@ -0,0 +1,145 @@
+"""
+On-demand profiling and tracing, for attaching to bug reports.
+
+Profile captures: F4 starts a cProfile capture of the main loop and F4 again stops
+it early. Otherwise it stops by itself after CAPTURE_SECONDS. Setting
+CRAWLTOGRAPHER_PROFILE=<seconds> instead captures the first seconds after startup.
+Each capture writes two files to the working directory:
+
+    profile_20240101_120000.prof   load with pstats or snakeviz
+    profile_20240101_120000.txt    the top functions by cumulative and own time,
+                                   plus the traced spans seen during the capture
+
+Tracing: functions decorated with @traced (save_map, load_map, move_selection,
+handle_remote_command) record a span each time they run. Spans are collected during
+a profile capture. With CRAWLTOGRAPHER_TRACE=trace.json they are also written to a
+Chrome trace file, which chrome://tracing and Perfetto can open. When neither is
+active, a traced call costs only a flag check.
+"""
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+
+CAPTURE_SECONDS = 10.0
+SUMMARY_FUNCTIONS = 25  # Functions listed per table in the text summary
+
+class Tracer:
+    """Records named spans to a Chrome trace file and/or the running profile capture."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False  # True while there is somewhere to send spans
+        self.file = None
+        self.started = time.perf_counter()
+        self.collected = None  # name -> [durations] during a profile capture
+
+    def open_file(self, path: str):
+        # The closing bracket is optional in the trace event format, so events can be
+        # streamed one per line and the file stays valid if the mapper is killed.
+        self.file = open(path, 'w')
+        self.file.write("[\n")
+        self.active = True
+
+    def collect(self, enabled: bool):
+        """Starts (enabled=True) or stops keeping span durations; returns what was kept."""
+        with self.lock:
+            collected, self.collected = self.collected, (defaultdict(list) if enabled else None)
+            self.active = self.file is not None or self.collected is not None
+        return collected or {}
+
+    def record(self, name: str, started: float, ended: float):
+        with self.lock:
+            if self.collected is not None:
+                self.collected[name].append(ended - started)
+            if self.file:
+                event = {"name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                         "ts": round((started - self.started) * 1e6), "dur": round((ended - started) * 1e6)}
+                self.file.write(json.dumps(event) + ",\n")
+                self.file.flush()
+
+tracer = Tracer()
+if os.environ.get("CRAWLTOGRAPHER_TRACE"):
+    tracer.open_file(os.environ["CRAWLTOGRAPHER_TRACE"])
+
+def traced(name: str):
+    """Decorator that records a span named `name` around each call while tracing is active."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.active:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(name, started, time.perf_counter())
+        return wrapper
+    return decorate
+
+class ProfileCapture:
+    """A cProfile capture of the main loop that stops after a set time."""
+    def __init__(self):
+        self.profile = None
+        self.stop_at = None
+        self.path = None
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None
+
+    def start(self, seconds: float = CAPTURE_SECONDS):
+        if self.running:
+            return
+        self.path = time.strftime("profile_%Y%m%d_%H%M%S")
+        self.stop_at = time.perf_counter() + seconds
+        tracer.collect(True)
+        print(f"Profiling for up to {seconds:g} s (F4 stops early)")
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def check(self):
+        """Called once per frame while running; stops the capture when its time is up."""
+        if time.perf_counter() >= self.stop_at:
+            self.stop()
+
+    def stop(self) -> str:
+        """Ends the capture, writes the .prof and .txt files and returns the .prof path."""
+        if not self.running:
+            return None
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+        spans = tracer.collect(False)
+
+        prof_path = self.path + ".prof"
+        profile.dump_stats(prof_path)
+        with open(self.path + ".txt", 'w') as f:
+            f.write(summarize(profile, spans))
+        print(f"Profile written to {prof_path} (summary in {self.path}.txt)")
+        return prof_path
+
+def summarize(profile: cProfile.Profile, spans: dict) -> str:
+    """The text summary of a capture: top functions and the spans recorded."""
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out).strip_dirs()
+    out.write(f"Top {SUMMARY_FUNCTIONS} functions by cumulative time\n")
+    stats.sort_stats("cumulative").print_stats(SUMMARY_FUNCTIONS)
+    out.write(f"\nTop {SUMMARY_FUNCTIONS} functions by own time\n")
+    stats.sort_stats("tottime").print_stats(SUMMARY_FUNCTIONS)
+    if spans:
+        out.write("\nTraced spans\n")
+        out.write(f"  {'name':<24} {'count':>7} {'mean ms':>10} {'max ms':>10} {'total ms':>10}\n")
+        for name, durations in sorted(spans.items()):
+            out.write(f"  {name:<24} {len(durations):>7} {sum(durations) / len(durations) * 1000:>10.3f} "
+                      f"{max(durations) * 1000:>10.3f} {sum(durations) * 1000:>10.3f}\n")
+    return out.getvalue()
@@ -0,0 +1,337 @@
+from itertools import repeat
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import config
+from data_models import CHUNK_SHIFT, Cell, CellState, Floor, IconType
+from history import CellChanges, FillCells, MoveCells
+
+Position = Tuple[int, int]
+
+def bounding_box(positions: Iterable[Position]) -> Optional[Tuple[int, int, int, int]]:
+    """(min_x, min_y, max_x, max_y) of a set of positions, or None if it is empty."""
+    positions = list(positions)
+    if not positions:
+        return None
+    xs = [x for x, _ in positions]
+    ys = [y for _, y in positions]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def grid_line(start: Position, end: Position) -> List[Position]:
+    """The cells on the line from start to end, both included (Bresenham)."""
+    x, y = start
+    x1, y1 = end
+    dx, dy = abs(x1 - x), -abs(y1 - y)
+    step_x = 1 if x < x1 else -1
+    step_y = 1 if y < y1 else -1
+    error = dx + dy
+    cells = [(x, y)]
+    while (x, y) != (x1, y1):
+        doubled = 2 * error
+        if doubled >= dy:
+            error += dy
+            x += step_x
+        if doubled <= dx:
+            error += dx
+            y += step_y
+        cells.append((x, y))
+    return cells
+
+class RegionEditor:
+    """
+    Bulk edits on rectangular or arbitrary regions of the current floor.
+
+    Every operation works in one pass over the chunks the region covers and is
+    recorded as a single undo entry (history.CellChanges or history.MoveCells), no
+    matter how many cells it touches. Locked cells are never modified.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.clipboard: List[Tuple[int, int, CellState]] = []  # (dx, dy, state) from the copied region's top-left
+
+    def _floor(self) -> Floor:
+        return self.app.get_floor(self.app.current_floor)
+
+    def existing_cells(self, floor: Floor, positions) -> List[Tuple[Position, Cell]]:
+        """The (pos, cell) pairs of `positions` that hold a cell."""
+        box = bounding_box(positions)
+        if box is None:
+            return []
+        x0, y0, x1, y1 = box
+        if len(positions) == (x1 - x0 + 1) * (y1 - y0 + 1):
+            # A full rectangle (e.g. a box selection): walk only the chunks under it.
+            return list(floor.cells_in_rect(x0, y0, x1, y1))
+        found = []
+        for pos in positions:
+            cell = floor.get(pos)
+            if cell is not None:
+                found.append((pos, cell))
+        return found
+
+    # --- Edits that join the current action (clicks and drag strokes) ---
+
+    def paint(self, positions: Iterable[Position], button: int):
+        """
+        Applies a click to many cells at once: button 1 marks them explored with the
+        selected icon, button 3 erases them. The changes are added to the app's current
+        action, which is committed to history by save_state() (e.g. on mouse up).
+        """
+        floor = self._floor()
+        action = self.app.begin_action()
+        icon = self.app.selected_icon
+        for pos in positions:
+            cell = floor.get(pos)
+            if cell is not None and cell.locked:
+                continue # Skip locked cells
+            prev_state = cell.state() if cell is not None else None
+            if button == 1:
+                new_state = (True, icon, prev_state[2] if prev_state else "", False)
+                if new_state == prev_state:
+                    continue
+            elif button == 3:
+                if prev_state is None:
+                    continue
+                new_state = None
+            else:
+                continue
+            floor.set_state(pos, new_state)
+            action.record(pos, prev_state, new_state)
+
+    # --- Self-contained operations (one history entry each) ---
+
+    def _commit_changes(self, states: Dict[Position, Optional[CellState]]) -> Optional[CellChanges]:
+        floor = self._floor()
+        entry = CellChanges(self.app.current_floor)
+        for pos, new_state in states.items():
+            prev_state = floor.get_state(pos)
+            if prev_state == new_state:
+                continue
+            floor.set_state(pos, new_state)
+            entry.record(pos, prev_state, new_state)
+        if not entry:
+            return None
+        self.app.push_history(entry)
+        return entry
+
+    def fill(self, positions: Iterable[Position], icon: IconType):
+        """Marks every unlocked cell in the region explored with `icon`, keeping labels."""
+        positions = set(positions)
+        floor = self._floor()
+        states = {}
+        for pos in positions:
+            cell = floor.get(pos)
+            if cell is None:
+                states[pos] = (True, icon, "", False)
+            elif not cell.locked:
+                states[pos] = (True, icon, cell.label, False)
+        return self._commit_changes(states)
+
+    def clear(self, positions: Iterable[Position]):
+        """Removes every unlocked cell in the region."""
+        positions = set(positions)
+        floor = self._floor()
+        states = {pos: None for pos, cell in self.existing_cells(floor, positions) if not cell.locked}
+        return self._commit_changes(states)
+
+    def set_locked(self, positions: Iterable[Position], locked: bool):
+        """Locks or unlocks every cell in the region. Locking an empty cell creates a locked, unexplored one."""
+        floor = self._floor()
+        states = {}
+        for pos in set(positions):
+            cell = floor.get(pos)
+            if cell is None:
+                if locked:
+                    states[pos] = (False, IconType.NONE, "", True)
+            elif not locked and not cell.explored:
+                states[pos] = None # Nothing left worth keeping
+            else:
+                states[pos] = (cell.explored, cell.icon, cell.label, locked)
+        return self._commit_changes(states)
+
+    def set_label(self, pos: Position, label: str):
+        cell = self._floor().get(pos)
+        if cell is None or cell.locked:
+            return None
+        return self._commit_changes({pos: (cell.explored, cell.icon, label, cell.locked)})
+
+    def copy(self, positions: Iterable[Position]) -> int:
+        """Copies the cells of the region to the clipboard. Returns how many were copied."""
+        positions = set(positions)
+        box = bounding_box(positions)
+        if box is None:
+            return 0
+        x0, y0 = box[0], box[1]
+        self.clipboard = [(x - x0, y - y0, cell.state()) for (x, y), cell in self.existing_cells(self._floor(), positions)]
+        return len(self.clipboard)
+
+    def cut(self, positions: Iterable[Position]):
+        positions = set(positions)
+        self.copy(positions)
+        return self.clear(positions)
+
+    def paste(self, anchor: Position) -> Set[Position]:
+        """Pastes the clipboard with its top-left at `anchor`. Returns the pasted positions."""
+        floor = self._floor()
+        states = {}
+        for dx, dy, state in self.clipboard:
+            pos = (anchor[0] + dx, anchor[1] + dy)
+            cell = floor.get(pos)
+            if cell is None or not cell.locked:
+                states[pos] = state
+        self._commit_changes(states)
+        return set(states)
+
+    def move(self, positions: Iterable[Position], dx: int, dy: int) -> Set[Position]:
+        """Moves the region by (dx, dy). Returns the moved region, e.g. to update the selection."""
+        positions = set(positions)
+        return self._relocate(positions, lambda pos: (pos[0] + dx, pos[1] + dy))
+
+    def rotate(self, positions: Iterable[Position], clockwise: bool = True) -> Set[Position]:
+        """Rotates the region 90 degrees around the center of its bounding box."""
+        positions = set(positions)
+        box = bounding_box(positions)
+        if box is None:
+            return positions
+        x0, y0, x1, y1 = box
+        width, height = x1 - x0 + 1, y1 - y0 + 1
+        # Top-left of the rotated box, chosen so the box keeps (roughly) the same center.
+        ox = x0 + (width - height) // 2
+        oy = y0 + (height - width) // 2
+        if clockwise:
+            transform = lambda pos: (ox + (y1 - pos[1]), oy + (pos[0] - x0))
+        else:
+            transform = lambda pos: (ox + (pos[1] - y0), oy + (x1 - pos[0]))
+        return self._relocate(positions, transform)
+
+    def mirror(self, positions: Iterable[Position], horizontal: bool = True) -> Set[Position]:
+        """Mirrors the region left-right (horizontal) or top-bottom within its bounding box."""
+        positions = set(positions)
+        box = bounding_box(positions)
+        if box is None:
+            return positions
+        x0, y0, x1, y1 = box
+        if horizontal:
+            transform = lambda pos: (x0 + x1 - pos[0], pos[1])
+        else:
+            transform = lambda pos: (pos[0], y0 + y1 - pos[1])
+        return self._relocate(positions, transform)
+
+    def flood_fill(self, start: Position, icon: IconType, max_cells: Optional[int] = None) -> Optional[FillCells]:
+        """
+        Fills the area of unexplored cells around `start` with `icon`, stopping at explored
+        or locked cells. Uses a scanline fill: whole horizontal runs are filled at once and
+        only the run starts on the rows above and below are queued.
+
+        Anything outside the floor's bounding box is open space, so an area that reaches
+        the edge of the box is not enclosed and nothing is filled. Areas larger than
+        max_cells (config.FLOOD_FILL_MAX_CELLS by default) are refused as well.
+        """
+        if max_cells is None:
+            max_cells = config.FLOOD_FILL_MAX_CELLS
+        floor = self._floor()
+        chunks = floor.chunks
+
+        def blocked(x, y):
+            chunk = chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if chunk is None:
+                return False
+            cell = chunk.get((x, y))
+            return cell is not None and (cell.explored or cell.locked)
+
+        sx, sy = start
+        if blocked(sx, sy):
+            return None
+        bounds = floor.bounds()
+        if bounds is None:
+            print("Flood fill: the area is not enclosed")
+            return None
+        x0, y0, x1, y1 = bounds
+
+        filled = set()
+        stack = [start]
+        while stack:
+            x, y = stack.pop()
+            if (x, y) in filled:
+                continue
+            # Cells on the bounding box edge touch the open space outside it.
+            if not (x0 < x < x1 and y0 < y < y1):
+                print("Flood fill: the area is not enclosed")
+                return None
+            left = x
+            while left > x0 and not blocked(left - 1, y):
+                left -= 1
+            right = x
+            while right < x1 and not blocked(right + 1, y):
+                right += 1
+            if left == x0 or right == x1:
+                print("Flood fill: the area is not enclosed")
+                return None
+            filled.update(zip(range(left, right + 1), repeat(y)))
+            if len(filled) > max_cells:
+                print(f"Flood fill: the area is larger than {max_cells} cells")
+                return None
+
+            # Queue the start of every open run directly above and below this one.
+            for ny in (y - 1, y + 1):
+                in_run = False
+                for fx in range(left, right + 1):
+                    if blocked(fx, ny) or (fx, ny) in filled:
+                        in_run = False
+                    elif not in_run:
+                        stack.append((fx, ny))
+                        in_run = True
+
+        # Only the (unexplored) cells that already existed need their old state kept;
+        # there are far fewer of them than filled positions.
+        previous = {pos: cell.state() for pos, cell in floor.cells_in_rect(x0, y0, x1, y1) if pos in filled}
+        entry = FillCells(self.app.current_floor, list(filled), icon, previous)
+        entry.apply(floor)
+        self.app.push_history(entry)
+        return entry
+
+    def _relocate(self, positions: Set[Position], transform: Callable[[Position], Position]) -> Set[Position]:
+        """
+        Moves every unlocked cell of the region to transform(pos), as one MoveCells entry.
+        Returns the region afterwards: the cells that stayed put (locked, or blocked by a
+        locked cell or by a cell that stayed) where they are, and every other position
+        transformed.
+        """
+        floor = self._floor()
+        cells = self.existing_cells(floor, positions)
+        moves = {pos: transform(pos) for pos, cell in cells if not cell.locked}
+        stayed = {pos for pos, cell in cells if cell.locked}
+
+        # A locked cell that is not itself moving blocks whatever would land on it, and
+        # so does a cell that stays because its own move was blocked. Dropping a move can
+        # therefore block the move onto its source, down a whole chain of cells.
+        sources = {target: source for source, target in moves.items()}
+        blocked = []
+        for source, target in moves.items():
+            if target not in moves:
+                cell = floor.get(target)
+                if cell is not None and cell.locked:
+                    blocked.append(source)
+        while blocked:
+            source = blocked.pop()
+            if source not in moves:
+                continue
+            del moves[source]
+            stayed.add(source)
+            follower = sources.get(source)
+            if follower in moves:
+                blocked.append(follower)
+        region = stayed | {transform(pos) for pos in positions if pos not in stayed}
+
+        moves = {source: target for source, target in moves.items() if source != target}
+        if not moves:
+            return region
+        displaced = {}
+        for target in moves.values():
+            if target not in moves:
+                state = floor.get_state(target)
+                if state is not None:
+                    displaced[target] = state
+
+        entry = MoveCells(self.app.current_floor, list(moves), list(moves.values()), displaced)
+        entry.apply(floor)
+        self.app.push_history(entry)
+        return region
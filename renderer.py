@@ -1,16 +1,39 @@
 import pygame
 import math
+from collections import OrderedDict
 
-from data_models import IconType
+from data_models import (CHUNK_SHIFT, CHUNK_SIZE, EDGE_DOOR, EDGE_ONE_WAY, EDGE_WALL, SIDE_E, SIDE_N,
+                         SIDE_S, SIDE_W, IconType, edge_kind)
 import config
+from ghost_floors import GhostLayers
+from map_labels import LabelLayer
 
 class Renderer:
     def __init__(self, app):
         self.app = app
         self.screen = app.screen
+        # Rendered edge chunks: (floor, chunk) -> (version, cell size, rotation, surface),
+        # least recently drawn first
+        self.edge_surfaces = OrderedDict()
+        self.edge_surface_bytes = 0
+        self.labels = LabelLayer(app)
+        self.ghosts = GhostLayers(app)
+        self.heat_squares = (None, [])  # (cell size, one translucent square per heat level)
 
     def draw_grid(self):
         """Draw the grid and cells"""
+        self.draw_grid_lines()
+        self.draw_ghost_floors()
+        self.draw_cells()
+        self.draw_heat_map()
+        self.draw_edges()
+        self.draw_labels()
+        self.draw_overlays()
+
+    # draw_grid's passes, also called one by one by the performance HUD to time them
+
+    def draw_grid_lines(self):
+        """Draws the empty grid around the current position."""
         grid_range = 40
         size = config.CELL_SIZE * self.app.zoom
 
@@ -26,11 +49,20 @@ class Renderer:
                     rect = pygame.Rect(int(screen_x - size/2), int(screen_y - size/2), int(size), int(size))
                     pygame.draw.rect(self.screen, config.GRID_COLOR, rect, 1)
 
-        # Pass 1: Draw cell backgrounds and icons
+    def draw_ghost_floors(self):
+        """Draws the floors above and below, translucent, under the current one (O)."""
+        if self.app.show_ghost_floors:
+            self.ghosts.draw()
+
+    def draw_cells(self) -> int:
+        """Draws cell backgrounds, icons and locks. Returns the number of cells on screen."""
+        size = config.CELL_SIZE * self.app.zoom
+        visible = 0
         if self.app.current_floor in self.app.floors:
             for (x, y), cell in self.app.floors[self.app.current_floor].items():
                 screen_x, screen_y = self.app.grid_to_screen(x, y)
                 if -size <= screen_x <= self.app.window_width + size and -size <= screen_y <= self.app.window_height + size:
+                    visible += 1
                     # Draw explored cell background and main icon
                     if cell.explored:
                         # Use a different color if the cell has a label
@@ -43,7 +75,122 @@ class Renderer:
                     # Always draw the lock icon if the cell is locked, regardless of explored state
                     if cell.locked:
                         self.draw_lock_icon(screen_x, screen_y, size)
+        return visible
 
+    def draw_heat_map(self):
+        """Shades visited cells by how often the player stepped on them (G). Does nothing while hidden."""
+        if not self.app.show_heat_map:
+            return
+        trail = self.app.trail
+        chunks = trail.heat.get(self.app.current_floor)
+        if not chunks:
+            return
+        size = config.CELL_SIZE * self.app.zoom
+        if self.heat_squares[0] != int(size):
+            squares = []
+            for level in range(config.HEAT_LEVELS):
+                square = pygame.Surface((int(size), int(size)), pygame.SRCALPHA)
+                square.fill((*config.HEAT_COLOR, 40 + 180 * level // max(1, config.HEAT_LEVELS - 1)))
+                squares.append(square)
+            self.heat_squares = (int(size), squares)
+        squares = self.heat_squares[1]
+
+        x0, y0, x1, y1 = self.app.visible_grid_rect()
+        for cy in range(y0 >> CHUNK_SHIFT, (y1 >> CHUNK_SHIFT) + 1):
+            for cx in range(x0 >> CHUNK_SHIFT, (x1 >> CHUNK_SHIFT) + 1):
+                counts = chunks.get((cx, cy))
+                if counts is None:
+                    continue
+                for index, visits in enumerate(counts):
+                    if visits:
+                        screen_x, screen_y = self.app.grid_to_screen((cx << CHUNK_SHIFT) | (index & (CHUNK_SIZE - 1)),
+                                                                     (cy << CHUNK_SHIFT) | (index >> CHUNK_SHIFT))
+                        level = trail.heat_level(self.app.current_floor, visits, len(squares))
+                        self.screen.blit(squares[level], (int(screen_x - size/2), int(screen_y - size/2)))
+
+    def draw_edges(self):
+        """
+        Draws walls, doors and one-way passages. Each chunk of edges is rendered once
+        to a transparent surface and blitted from then on; the surface is rebuilt only
+        when the chunk changes, or the zoom or rotation does.
+        """
+        floor = self.app.floors.get(self.app.current_floor)
+        if floor is None or not len(floor.edges):
+            return
+        size = config.CELL_SIZE * self.app.zoom
+        chunk_pixels = max(1, round(CHUNK_SIZE * size))
+        x0, y0, x1, y1 = self.app.visible_grid_rect()
+        for cy in range(y0 >> CHUNK_SHIFT, (y1 >> CHUNK_SHIFT) + 1):
+            for cx in range(x0 >> CHUNK_SHIFT, (x1 >> CHUNK_SHIFT) + 1):
+                masks = floor.edges.chunk((cx, cy))
+                if masks is None:
+                    continue
+                surface = self._edge_surface(floor, (cx, cy), masks, chunk_pixels)
+                # Screen corners of the chunk; after rotation any of them can be the top-left
+                left, top = cx << CHUNK_SHIFT, cy << CHUNK_SHIFT
+                corners = [self.app.grid_to_screen(left + dx - 0.5, top + dy - 0.5) for dx in (0, CHUNK_SIZE) for dy in (0, CHUNK_SIZE)]
+                self.screen.blit(surface, (round(min(x for x, _ in corners)), round(min(y for _, y in corners))))
+
+    def _edge_surface(self, floor, key, masks, chunk_pixels: int):
+        cache_key = (self.app.current_floor, key)
+        version = floor.edges.chunk_versions.get(key)
+        cached = self.edge_surfaces.get(cache_key)
+        if cached and cached[:3] == (version, chunk_pixels, self.app.rotation):
+            self.edge_surfaces.move_to_end(cache_key)
+            return cached[3]
+        if cached:
+            self.edge_surface_bytes -= cached[3].get_width() * cached[3].get_height() * 4
+
+        surface = pygame.Surface((chunk_pixels, chunk_pixels), pygame.SRCALPHA)
+        cell = chunk_pixels / CHUNK_SIZE
+        for index, mask in enumerate(masks):
+            if mask:
+                self.draw_cell_edges(surface, (index & (CHUNK_SIZE - 1)) * cell, (index >> CHUNK_SHIFT) * cell, cell, mask)
+        if self.app.rotation:
+            surface = pygame.transform.rotate(surface, -self.app.rotation) # The map turns clockwise
+
+        self.edge_surfaces[cache_key] = (version, chunk_pixels, self.app.rotation, surface)
+        self.edge_surfaces.move_to_end(cache_key)
+        self.edge_surface_bytes += surface.get_width() * surface.get_height() * 4
+        while self.edge_surface_bytes > config.EDGE_CACHE_BYTES and len(self.edge_surfaces) > 1:
+            _, old = self.edge_surfaces.popitem(last=False)
+            self.edge_surface_bytes -= old[3].get_width() * old[3].get_height() * 4
+        return surface
+
+    def draw_cell_edges(self, surface, left: float, top: float, size: float, mask: int):
+        """Draws one cell's edges onto a chunk surface; (left, top) is the cell's corner."""
+        width = max(2, int(size / 8))
+        right, bottom = left + size, top + size
+        ends = {SIDE_N: ((left, top), (right, top)), SIDE_E: ((right, top), (right, bottom)),
+                SIDE_S: ((left, bottom), (right, bottom)), SIDE_W: ((left, top), (left, bottom))}
+        for side, (start, end) in ends.items():
+            kind = edge_kind(mask, side)
+            if kind == EDGE_WALL:
+                pygame.draw.line(surface, config.WALL_COLOR, start, end, width)
+            elif kind == EDGE_DOOR:
+                # A wall with a door leaf across its middle third
+                third = ((end[0] - start[0]) / 3, (end[1] - start[1]) / 3)
+                door_start = (start[0] + third[0], start[1] + third[1])
+                door_end = (start[0] + 2 * third[0], start[1] + 2 * third[1])
+                pygame.draw.line(surface, config.WALL_COLOR, start, door_start, width)
+                pygame.draw.line(surface, config.WALL_COLOR, door_end, end, width)
+                pygame.draw.line(surface, config.DOOR_COLOR, door_start, door_end, width * 2)
+            elif kind == EDGE_ONE_WAY:
+                # A thin line with an arrow pointing out of the cell
+                pygame.draw.line(surface, config.ONE_WAY_COLOR, start, end, max(1, width // 2))
+                mid_x, mid_y = (start[0] + end[0]) / 2, (start[1] + end[1]) / 2
+                out_x, out_y = mid_x - (left + size / 2), mid_y - (top + size / 2) # Towards the side
+                tip = (mid_x + out_x / 3, mid_y + out_y / 3)
+                base = (mid_x - out_x / 3, mid_y - out_y / 3)
+                pygame.draw.polygon(surface, config.ONE_WAY_COLOR, [tip, (base[0] - out_y / 3, base[1] + out_x / 3), (base[0] + out_y / 3, base[1] - out_x / 3)])
+
+    def draw_labels(self) -> int:
+        """Draws cell labels on the map when they are turned on (T). Returns how many were drawn."""
+        return self.labels.draw()
+
+    def draw_overlays(self):
+        """Selection, move preview and the player marker, drawn over the cells."""
+        size = config.CELL_SIZE * self.app.zoom
         self._draw_selection_highlight()
         self._draw_moving_selection_ghost()
 
@@ -74,7 +221,7 @@ class Renderer:
         if not self.app.multi_select_mode or not self.app.selection_start_pos:
             return
 
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = self.app.mouse_pos
         start_screen_pos = self.app.grid_to_screen_unrotated(*self.app.selection_start_pos)
         
         width = mouse_pos[0] - start_screen_pos[0]
@@ -88,7 +235,7 @@ class Renderer:
         if not self.app.is_moving_selection or not self.app.selected_cells:
             return
 
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = self.app.mouse_pos
         current_grid_pos = self.app.screen_to_grid(*mouse_pos)
         start_grid_pos = self.app.move_start_grid_pos
 
@@ -0,0 +1,290 @@
+"""
+A second, borderless full-screen view of the map for another monitor (F6).
+
+The mapper publishes the current floor and the player's position into a
+multiprocessing.shared_memory block. A separate viewer process (this module's
+main()) maps the same block and draws it with its own Renderer. The extra view
+therefore costs the editor no drawing time, and nothing is encoded or sent over a
+socket.
+
+Block layout (little-endian):
+    header   HEADER: magic, generation, floor, player x, y, rotation, cell count,
+             capacity, flags (1 = the floor has more cells than the block holds)
+    cells    `count` RECORDs of x, y, flags (1 explored, 2 locked, 4 labeled), icon index
+
+The publisher keeps one record slot per cell and rewrites only the slots of chunks
+whose version changed since the last frame. A frame with no changes costs one
+version comparison. Updates are bracketed by the generation counter, which is odd
+while a write is in progress. The viewer copies the block only when the
+generation is even and has changed, then checks that it did not change during the
+copy (a seqlock).
+
+    python second_view.py --name <block> [--display 1] [--follow] [--windowed]
+"""
+import argparse
+import os
+import struct
+import subprocess
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Set, Tuple
+
+import pygame
+
+import config
+from data_models import Floor, IconType
+from map_view import MapView
+from renderer import Renderer
+
+SECOND_VIEW_CELLS = 1 << 20  # Cells the block can hold; larger floors are shown truncated
+VIEW_MAGIC = b"CRVIEW01"
+HEADER = struct.Struct("<8sQiiiiIIB")
+RECORD = struct.Struct("<iiBB")
+_GENERATION = struct.Struct("<Q")  # The generation field, at offset 8
+FLAG_TRUNCATED = 1
+LABEL_PLACEHOLDER = " "  # Labels are not shared; the viewer only needs to know a cell has one
+ICONS = tuple(IconType)  # Records store an icon as its index here
+ICON_INDEX = {icon: i for i, icon in enumerate(ICONS)}
+
+Position = Tuple[int, int]
+
+def _cell_flags(cell) -> int:
+    return (1 if cell.explored else 0) | (2 if cell.locked else 0) | (4 if cell.label else 0)
+
+class SecondViewPublisher:
+    """Mapper side: owns the shared block and the viewer process."""
+    def __init__(self, app, capacity: int = SECOND_VIEW_CELLS):
+        self.app = app
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=HEADER.size + capacity * RECORD.size)
+        self.buf = self.shm.buf
+        self.generation = 0
+        self.process = None
+
+        # What the block currently holds
+        self.floor = None  # The Floor object published, compared by identity
+        self.version = None
+        self.chunk_versions: Dict[Tuple[int, int], int] = {}
+        self.chunk_positions: Dict[Tuple[int, int], Set[Position]] = {}
+        self.slots: Dict[Position, int] = {}
+        self.positions: List[Position] = []  # Slot -> position
+        self.view = None
+        self.truncated = False
+        self._write_header()
+
+    def launch(self, *args: str):
+        """Starts the viewer process on this block."""
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "second_view.py")
+        self.process = subprocess.Popen([sys.executable, script, "--name", self.shm.name, *args])
+        print(f"Second view started (shared block {self.shm.name})")
+
+    def close(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+        self.process = None
+        self.buf.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def publish_frame(self):
+        """Copies this frame's changes into the block. Called from the main loop."""
+        app = self.app
+        floor = app.floors.get(app.current_floor)
+        view = (app.current_floor, tuple(app.current_pos), app.rotation)
+        if floor is not self.floor:
+            changed = None # Another floor (or a reloaded one): rewrite everything
+        elif floor is not None and floor.version != self.version:
+            changed = [key for key, version in floor.chunk_versions.items() if self.chunk_versions.get(key) != version]
+        else:
+            changed = []
+        if not changed and changed is not None and view == self.view:
+            return
+
+        self._set_generation(self.generation + 1) # Odd: write in progress
+        if changed is None:
+            self.slots.clear()
+            self.positions.clear()
+            self.chunk_positions.clear()
+            self.chunk_versions.clear()
+            self.truncated = False
+            changed = list(floor.chunks) if floor is not None else []
+        for key in changed:
+            self._write_chunk(floor, key)
+            self.chunk_versions[key] = floor.chunk_versions.get(key)
+        self.floor = floor
+        self.version = floor.version if floor is not None else None
+        self.view = view
+        self.generation += 1
+        self._write_header()
+
+    def _write_chunk(self, floor: Floor, key: Tuple[int, int]):
+        cells = floor.chunk_cells(key)
+        for pos in self.chunk_positions.pop(key, set()) - cells.keys():
+            self._remove(pos)
+        for pos, cell in cells.items():
+            self._put(pos, cell)
+        if cells:
+            self.chunk_positions[key] = set(cells)
+
+    def _put(self, pos: Position, cell):
+        slot = self.slots.get(pos)
+        if slot is None:
+            if len(self.positions) >= self.capacity:
+                if not self.truncated:
+                    print(f"Warning: the floor has more than {self.capacity} cells; the second view shows only some of them.")
+                self.truncated = True
+                return
+            slot = self.slots[pos] = len(self.positions)
+            self.positions.append(pos)
+        RECORD.pack_into(self.buf, HEADER.size + slot * RECORD.size, pos[0], pos[1], _cell_flags(cell), ICON_INDEX[cell.icon])
+
+    def _remove(self, pos: Position):
+        """Frees a cell's slot by moving the last record into it."""
+        slot = self.slots.pop(pos, None)
+        if slot is None:
+            return
+        last = self.positions.pop()
+        if slot < len(self.positions):
+            self.positions[slot] = last
+            self.slots[last] = slot
+            start = HEADER.size + len(self.positions) * RECORD.size
+            self.buf[HEADER.size + slot * RECORD.size:HEADER.size + (slot + 1) * RECORD.size] = self.buf[start:start + RECORD.size]
+
+    def _set_generation(self, generation: int):
+        self.generation = generation
+        _GENERATION.pack_into(self.buf, 8, generation)
+
+    def _write_header(self):
+        floor, (x, y), rotation = self.view or (self.app.current_floor, self.app.current_pos, self.app.rotation)
+        HEADER.pack_into(self.buf, 0, VIEW_MAGIC, self.generation, floor, x, y, rotation,
+                         len(self.positions), self.capacity, FLAG_TRUNCATED if self.truncated else 0)
+
+class SecondViewWindow(MapView):
+    """Viewer side: a borderless window on another display that mirrors the block."""
+    def __init__(self, name: str, display: int = 1, fit: bool = True, windowed: bool = False):
+        self.shm = shared_memory.SharedMemory(name=name)
+        # The mapper owns the block; without this, Python would unlink it when the viewer exits
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        pygame.display.init()
+        sizes = pygame.display.get_desktop_sizes()
+        display = display if display < len(sizes) else 0
+        if windowed:
+            self.window_width, self.window_height = config.WINDOW_WIDTH, config.WINDOW_HEIGHT
+            self.screen = pygame.display.set_mode((self.window_width, self.window_height), pygame.RESIZABLE, display=display)
+        else:
+            self.window_width, self.window_height = sizes[display]
+            self.screen = pygame.display.set_mode(sizes[display], pygame.NOFRAME, display=display)
+        pygame.display.set_caption("Dungeon Crawltographer - Second View")
+        self.clock = pygame.time.Clock()
+
+        # Map state mirrored from the block
+        self.floors = {}
+        self.current_floor = 0
+        self.current_pos = (config.GRID_SIZE // 2, config.GRID_SIZE // 2)
+        self.rotation = 0
+        self.generation = None
+
+        # View state: fit the whole floor on screen, or follow the player at a fixed zoom
+        self.fit = fit
+        self.camera_x = 0
+        self.camera_y = 0
+        self.zoom = 1.0
+        self.show_icon_panel = False
+        self.show_heat_map = False
+        self.show_ghost_floors = False
+        self.selected_cells = set()
+        self.multi_select_mode = False
+        self.selection_start_pos = None
+        self.is_moving_selection = False
+        self.move_start_grid_pos = None
+
+        self.renderer = Renderer(self)
+        self.running = True
+
+    def poll(self) -> bool:
+        """Reads the block if the mapper published something new. Returns True if it did."""
+        buf = self.shm.buf
+        generation, = _GENERATION.unpack_from(buf, 8)
+        if generation == self.generation or generation & 1:
+            return False
+        magic, _, floor_number, x, y, rotation, count, _, flags = HEADER.unpack_from(buf)
+        if magic != VIEW_MAGIC:
+            return False
+        records = bytes(buf[HEADER.size:HEADER.size + count * RECORD.size])
+        if _GENERATION.unpack_from(buf, 8)[0] != generation:
+            return False # Written to while copying; try again next frame
+
+        floor = Floor()
+        floor.set_states(((cx, cy), (bool(cell_flags & 1), ICONS[icon], LABEL_PLACEHOLDER if cell_flags & 4 else "", bool(cell_flags & 2)))
+                         for cx, cy, cell_flags, icon in RECORD.iter_unpack(records))
+        self.floors = {floor_number: floor}
+        self.current_floor = floor_number
+        self.current_pos = (x, y)
+        self.rotation = rotation
+        self.generation = generation
+        return True
+
+    def fit_floor(self):
+        """Zooms and centers the view so the whole floor fits on screen."""
+        floor = self.floors.get(self.current_floor)
+        bounds = floor.bounds() if floor else None
+        if bounds is None:
+            self.camera_x = self.camera_y = 0
+            return
+        min_x, min_y, max_x, max_y = bounds
+        width, height = max_x - min_x + 3, max_y - min_y + 3
+        if self.rotation in (90, 270):
+            width, height = height, width
+        # MapView centers the map below where the editor's title and menu bars are
+        map_height = self.window_height - config.TITLE_BAR_HEIGHT - config.MENU_BAR_HEIGHT
+        self.zoom = max(0.05, min(3.0, min(self.window_width / width, map_height / height) / config.CELL_SIZE))
+        # The center of the map area shows current_pos - camera
+        self.camera_x = self.current_pos[0] - (min_x + max_x) / 2
+        self.camera_y = self.current_pos[1] - (min_y + max_y) / 2
+
+    def run(self):
+        while self.running:
+            self.clock.tick(60)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        self.running = False
+                    elif event.key == pygame.K_f:
+                        self.fit = not self.fit
+                        if not self.fit:
+                            self.camera_x = self.camera_y = 0
+                elif event.type == pygame.VIDEORESIZE:
+                    self.window_width, self.window_height = event.w, event.h
+                    self.screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+                    self.renderer.screen = self.screen
+                elif event.type == pygame.MOUSEWHEEL:
+                    self.fit = False
+                    self.camera_x = self.camera_y = 0
+                    if event.y > 0: self.zoom = min(3.0, self.zoom * 1.1)
+                    elif event.y < 0: self.zoom = max(0.05, self.zoom / 1.1)
+
+            if self.poll() and self.fit:
+                self.fit_floor()
+
+            self.screen.fill(config.BG_COLOR)
+            self.renderer.draw_grid()
+            pygame.display.flip()
+        self.shm.close()
+        pygame.quit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Second-monitor view of a running Dungeon Crawltographer.")
+    parser.add_argument("--name", required=True, help="Shared memory block published by the mapper")
+    parser.add_argument("--display", type=int, default=1, help="Display to cover (default: the second one)")
+    parser.add_argument("--follow", action="store_true", help="Follow the player instead of fitting the whole floor")
+    parser.add_argument("--windowed", action="store_true", help="Open a normal window instead of covering the display")
+    args = parser.parse_args()
+
+    viewer = SecondViewWindow(args.name, args.display, fit=not args.follow, windowed=args.windowed)
+    viewer.run()
+
+if __name__ == "__main__":
+    main()
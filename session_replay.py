@@ -0,0 +1,233 @@
+"""
+Record a real mapping session and replay it headlessly as an end-to-end benchmark.
+
+Recording: start the mapper with CRAWLTOGRAPHER_SESSION_RECORD=session.jsonl. Every
+frame's input events (mouse, keyboard, wheel, resize and remote controller commands)
+are written with a timestamp and the keyboard modifier state.
+
+Replaying:
+
+    python session_replay.py session.jsonl                 # as fast as possible
+    python session_replay.py session.jsonl --realtime      # original pacing
+    python session_replay.py session.jsonl --json report.json
+
+The replay drives a windowless DungeonMapper through EventHandler.handle_events and
+draw(), frame by frame, and reports per-frame times (p50/p95/p99) and the final map
+hash (file_manager.map_state_hash). Replays of the same recording end in the same hash.
+
+File dialogs, saving and PNG export are not replayed. Instead, when a map is loaded or
+replaced during recording, the new map is written into the recording and restored at
+the same frame.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pygame
+
+from file_manager import SavedCells, decode_cells, encode_cells, map_state_hash
+
+SESSION_FORMAT = "crawltographer-session"
+SESSION_VERSION = 1
+
+RECORDED_TYPES = {
+    pygame.QUIT: "quit",
+    pygame.VIDEORESIZE: "resize",
+    pygame.MOUSEBUTTONDOWN: "mouse_down",
+    pygame.MOUSEBUTTONUP: "mouse_up",
+    pygame.MOUSEWHEEL: "wheel",
+    pygame.MOUSEMOTION: "motion",
+    pygame.KEYDOWN: "key_down",
+}
+TYPES_BY_NAME = {name: event_type for event_type, name in RECORDED_TYPES.items()}
+
+def _remote_event_type() -> int:
+    try:
+        from udp_listener import REMOTE_MOVE_EVENT
+        return REMOTE_MOVE_EVENT
+    except ImportError:
+        return -1
+
+def encode_event(event, remote_type: int):
+    """A JSON-able form of an event the mapper handles, or None for other events."""
+    if event.type == remote_type:
+        return {"type": "remote", "command": event.command}
+    name = RECORDED_TYPES.get(event.type)
+    if name is None:
+        return None
+    data = {"type": name}
+    for key, value in event.dict.items():
+        if isinstance(value, (bool, int, float, str)):
+            data[key] = value
+        elif isinstance(value, tuple) and all(isinstance(v, (int, float)) for v in value):
+            data[key] = list(value)
+    return data
+
+def decode_event(data: dict, remote_type: int):
+    attributes = {key: tuple(value) if isinstance(value, list) else value
+                  for key, value in data.items() if key != "type"}
+    if data["type"] == "remote":
+        attributes["received_at"] = time.perf_counter()
+        return pygame.event.Event(remote_type, attributes)
+    return pygame.event.Event(TYPES_BY_NAME[data["type"]], attributes)
+
+def map_snapshot(app) -> dict:
+    floors = {str(floor): encode_cells(cells) for floor, cells in app.floors.items()}
+    return {
+        "floors": floors,
+        "edges": {floor: cells.edges for floor, cells in floors.items() if cells.edges},
+        "current_floor": app.current_floor,
+        "current_pos": list(app.current_pos),
+        "rotation": app.rotation,
+    }
+
+def restore_snapshot(app, snapshot: dict):
+    app.set_map_data({
+        "floors": {int(floor): decode_cells(SavedCells(cells, snapshot.get("edges", {}).get(floor)))
+                   for floor, cells in snapshot["floors"].items()},
+        "current_floor": snapshot["current_floor"],
+        "current_pos": tuple(snapshot["current_pos"]),
+        "rotation": snapshot["rotation"],
+    })
+
+class SessionRecorder:
+    """Writes every frame's events to a JSON-lines recording (see the module docstring)."""
+    def __init__(self, app, path: str):
+        self.app = app
+        self.remote_type = _remote_event_type()
+        self.started = time.perf_counter()
+        self.file = open(path, 'w')
+        self._write({
+            "format": SESSION_FORMAT,
+            "version": SESSION_VERSION,
+            "window": [app.window_width, app.window_height],
+            "view": {"camera_x": app.camera_x, "camera_y": app.camera_y, "zoom": app.zoom,
+                     "show_icon_panel": app.show_icon_panel},
+            "map": map_snapshot(app),
+        })
+        app.change_listeners.append(self.on_cells_changed)
+
+    def _write(self, entry: dict):
+        self.file.write(json.dumps(entry, separators=(',', ':')) + "\n")
+
+    def record_frame(self, events):
+        encoded = [data for data in (encode_event(event, self.remote_type) for event in events) if data]
+        self._write({"t": round(time.perf_counter() - self.started, 4), "mods": pygame.key.get_mods(), "events": encoded})
+
+    def on_cells_changed(self, floor, positions):
+        if floor is None: # The whole map was replaced (new map or load)
+            self._write({"map": map_snapshot(self.app)})
+            self.file.flush()
+
+def read_session(path: str):
+    """Returns the recording's header and an iterator over its frame and map entries."""
+    f = open(path)
+    header = json.loads(f.readline() or "null")
+    if not isinstance(header, dict) or header.get("format") != SESSION_FORMAT:
+        f.close()
+        raise ValueError(f"{path} is not a session recording")
+
+    def entries():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return header, entries()
+
+def _percentile(ordered, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def _summary(seconds) -> dict:
+    ordered = sorted(seconds)
+    ms = lambda value: round(value * 1000, 3)
+    return {
+        "p50": ms(_percentile(ordered, 0.50)),
+        "p95": ms(_percentile(ordered, 0.95)),
+        "p99": ms(_percentile(ordered, 0.99)),
+        "max": ms(ordered[-1]) if ordered else 0.0,
+        "mean": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+    }
+
+def replay_session(path: str, draw: bool = True, realtime: bool = False) -> dict:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import dungeon_mapper
+
+    header, entries = read_session(path)
+    mapper = dungeon_mapper.DungeonMapper(network=False)
+    remote_type = _remote_event_type()
+
+    # Dialogs and file output are not part of a replay; loaded maps come from "map" entries.
+    mapper.trigger_save = mapper.trigger_load = mapper.export_png = lambda: None
+    mapper.event_handler.trigger_save_as_with_dialog = lambda: None
+    mapper.event_handler.trigger_load_with_dialog = lambda: None
+
+    width, height = header["window"]
+    mapper.window_width, mapper.window_height = width, height
+    mapper.screen = pygame.display.set_mode((width, height)) # pygame resizes the same display surface
+    for key, value in header["view"].items():
+        setattr(mapper, key, value)
+    restore_snapshot(mapper, header["map"])
+
+    frame_times, event_times = [], []
+    events_replayed = 0
+    started = time.perf_counter()
+    for entry in entries:
+        if "map" in entry:
+            restore_snapshot(mapper, entry["map"])
+            continue
+        if realtime:
+            delay = started + entry["t"] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        pygame.key.set_mods(entry["mods"])
+        events = [decode_event(data, remote_type) for data in entry["events"]]
+        events_replayed += len(events)
+
+        frame_started = time.perf_counter()
+        mapper.event_handler.handle_events(events)
+        handled = time.perf_counter()
+        if draw:
+            mapper.draw()
+        frame_times.append(time.perf_counter() - frame_started)
+        event_times.append(handled - frame_started)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "session": path,
+        "frames": len(frame_times),
+        "events": events_replayed,
+        "elapsed_s": round(elapsed, 3),
+        "frame_ms": _summary(frame_times),
+        "event_handling_ms": _summary(event_times),
+        "map_hash": map_state_hash(mapper.floors, mapper.current_floor, mapper.current_pos, mapper.rotation),
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay a recorded mapping session and report frame times.")
+    parser.add_argument("session", help="Recording made with CRAWLTOGRAPHER_SESSION_RECORD")
+    parser.add_argument("--realtime", action="store_true", help="Keep the recorded pacing between frames")
+    parser.add_argument("--no-draw", action="store_true", help="Only time event handling")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("--expect-hash", help="Exit with an error if the final map hash differs")
+    args = parser.parse_args()
+
+    report = replay_session(args.session, draw=not args.no_draw, realtime=args.realtime)
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(f"{key}: " + ", ".join(f"{k}={v}" for k, v in value.items()))
+        else:
+            print(f"{key}: {value}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.expect_hash and report["map_hash"] != args.expect_hash:
+        print("Final map hash does not match the expected one")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
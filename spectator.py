@@ -0,0 +1,318 @@
+"""
+Live map broadcast for read-only spectators.
+
+The mapper runs a MapBroadcaster, which turns every committed cell change into a
+compact delta message. Spectators connect over TCP, receive a chunked snapshot of
+the whole map and then the stream of deltas. Run `python spectator.py <mapper-ip>`
+on the viewing machine (add --headless to run without a window).
+
+The broadcast is off unless the mapper is started with CRAWLTOGRAPHER_SPECTATOR_PORT
+set (e.g. 5001), since anyone on the network who can reach the port sees the whole map.
+
+Messages are newline-delimited JSON:
+    {"t":"reset"}                                   start of a snapshot
+    {"t":"cells","f":floor,"c":[[x,y,flags,icon,label?],...],"d":[[x,y],...]}
+    {"t":"view","f":floor,"p":[x,y],"r":rotation}   player position and facing
+flags: 1 = explored, 2 = locked. "d" lists cells that were erased.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+import pygame
+
+import config
+from data_models import Cell, Floor, IconType
+from map_view import MapView
+from renderer import Renderer
+
+SPECTATOR_HOST = "0.0.0.0"
+SPECTATOR_PORT = int(os.environ.get("CRAWLTOGRAPHER_SPECTATOR_PORT") or 5001)
+SPECTATOR_ENABLED = bool(os.environ.get("CRAWLTOGRAPHER_SPECTATOR_PORT"))
+SNAPSHOT_CHUNK_CELLS = 512  # Cells per snapshot message
+MAX_QUEUED_MESSAGES = 4096  # Deltas; a subscriber this far behind gets a fresh snapshot instead
+
+def _encode(message) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+def encode_cell(x: int, y: int, cell) -> list:
+    flags = (1 if cell.explored else 0) | (2 if cell.locked else 0)
+    entry = [x, y, flags, cell.icon.value]
+    if cell.label:
+        entry.append(cell.label)
+    return entry
+
+def cells_message(floor: int, cells, erased) -> dict:
+    return {'t': 'cells', 'f': floor, 'c': cells, 'd': erased}
+
+class _Subscriber:
+    """
+    One connected spectator. Messages are written by a dedicated thread.
+
+    Only deltas count towards MAX_QUEUED_MESSAGES. A snapshot is queued whole, however
+    large the map, so a cap reached halfway through cannot cut off its start.
+    """
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.outbox = queue.Queue()  # (data, is_delta)
+        self.queued_deltas = 0
+        self.lock = threading.Lock()
+        self.needs_snapshot = True
+        self.alive = True
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def send(self, data: bytes):
+        with self.lock:
+            if self.queued_deltas >= MAX_QUEUED_MESSAGES:
+                # Too far behind to catch up with deltas; start over from a snapshot.
+                while not self.outbox.empty():
+                    _, is_delta = self.outbox.get_nowait()
+                    self.queued_deltas -= is_delta
+                self.needs_snapshot = True
+                return
+            self.queued_deltas += 1
+            self.outbox.put((data, True))
+
+    def send_snapshot(self, messages):
+        for data in messages:
+            self.outbox.put((data, False))
+
+    def _write_loop(self):
+        while self.alive:
+            data, is_delta = self.outbox.get()
+            if is_delta:
+                with self.lock:
+                    self.queued_deltas -= 1
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.alive = False
+        self.sock.close()
+
+class MapBroadcaster(threading.Thread):
+    """
+    Accepts spectator connections and publishes map changes to them.
+
+    Changes are collected from DungeonMapper.change_listeners and sent once per
+    frame by publish_frame(), so a drag that touches many cells becomes one message.
+    """
+    def __init__(self, app, host: str = SPECTATOR_HOST, port: int = SPECTATOR_PORT):
+        super().__init__(daemon=True)
+        self.app = app
+        self.host = host
+        self.port = port
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.dirty = {}  # floor -> set of changed positions
+        self.last_view = None
+        app.change_listeners.append(self.on_cells_changed)
+
+    def run(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind((self.host, self.port))
+            server.listen()
+        except OSError as e:
+            print(f"ERROR: Could not start spectator broadcast on port {self.port}. {e}")
+            return
+        print(f"Spectator broadcast listening on port {self.port}...")
+        while True:
+            try:
+                sock, addr = server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print(f"Spectator connected from {addr}")
+            with self.lock:
+                self.subscribers.append(_Subscriber(sock, addr))
+
+    def on_cells_changed(self, floor, positions):
+        if floor is None:
+            # The whole map was replaced; everyone needs a new snapshot.
+            self.dirty.clear()
+            with self.lock:
+                for subscriber in self.subscribers:
+                    subscriber.needs_snapshot = True
+            return
+        self.dirty.setdefault(floor, set()).update(positions)
+
+    def publish_frame(self):
+        """Sends this frame's pending changes. Called from the main loop."""
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s.alive]
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            self.dirty.clear()
+            return
+
+        messages = [self._delta_message(floor, positions) for floor, positions in self.dirty.items()]
+        self.dirty.clear()
+        view = (self.app.current_floor, tuple(self.app.current_pos), self.app.rotation)
+        if view != self.last_view:
+            self.last_view = view
+            messages.append(self._view_message())
+        data = b''.join(_encode(m) for m in messages)
+
+        for subscriber in subscribers:
+            if subscriber.needs_snapshot:
+                subscriber.needs_snapshot = False
+                subscriber.send_snapshot(self._snapshot())
+            elif data:
+                subscriber.send(data)
+
+    def _delta_message(self, floor, positions) -> dict:
+        cells = self.app.floors.get(floor, {})
+        changed, erased = [], []
+        for pos in positions:
+            cell = cells.get(pos)
+            if cell is not None and (cell.explored or cell.locked):
+                changed.append(encode_cell(pos[0], pos[1], cell))
+            else:
+                erased.append(pos)
+        return cells_message(floor, changed, erased)
+
+    def _view_message(self) -> dict:
+        return {'t': 'view', 'f': self.app.current_floor, 'p': list(self.app.current_pos), 'r': self.app.rotation}
+
+    def _snapshot(self):
+        """Yields the whole map as a series of encoded messages."""
+        yield _encode({'t': 'reset'})
+        for floor, cells in self.app.floors.items():
+            batch = []
+            for (x, y), cell in cells.items():
+                if cell.explored or cell.locked:
+                    batch.append(encode_cell(x, y, cell))
+                    if len(batch) >= SNAPSHOT_CHUNK_CELLS:
+                        yield _encode(cells_message(floor, batch, []))
+                        batch = []
+            if batch:
+                yield _encode(cells_message(floor, batch, []))
+        yield _encode(self._view_message())
+
+class SpectatorViewer(MapView):
+    """A read-only window that mirrors a mapper's live map."""
+    def __init__(self, host: str, port: int, headless: bool = False):
+        self.headless = headless
+        self.window_width = config.WINDOW_WIDTH
+        self.window_height = config.WINDOW_HEIGHT
+        flags = 0 if headless else pygame.RESIZABLE
+        self.screen = pygame.display.set_mode((self.window_width, self.window_height), flags)
+        pygame.display.set_caption("Dungeon Crawltographer - Spectator")
+        self.clock = pygame.time.Clock()
+
+        # Map state mirrored from the mapper
+        self.floors = {}
+        self.current_floor = 0
+        self.current_pos = (config.GRID_SIZE // 2, config.GRID_SIZE // 2)
+        self.rotation = 0
+
+        # View state (the viewer is never interactive beyond zooming)
+        self.camera_x = 0
+        self.camera_y = 0
+        self.zoom = 1.0
+        self.show_icon_panel = False
+        self.show_heat_map = False
+        self.show_ghost_floors = False
+        self.selected_cells = set()
+        self.multi_select_mode = False
+        self.selection_start_pos = None
+        self.is_moving_selection = False
+        self.move_start_grid_pos = None
+
+        self.inbox = queue.Queue()
+        self.applied_cells = 0
+        self.sock = socket.create_connection((host, port))
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        self.renderer = Renderer(self)
+        self.running = True
+
+    def _read_loop(self):
+        for line in self.sock.makefile('rb'):
+            self.inbox.put(json.loads(line))
+        self.inbox.put(None)
+
+    def apply_pending(self):
+        """Applies every message received since the last frame."""
+        while True:
+            try:
+                message = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            if message is None:
+                print("Mapper closed the connection.")
+                self.running = False
+                return
+            self.apply(message)
+
+    def apply(self, message: dict):
+        kind = message['t']
+        if kind == 'cells':
+            cells = self.floors.get(message['f'])
+            if cells is None:
+                cells = self.floors[message['f']] = Floor()
+            for entry in message['c']:
+                flags = entry[2]
+                cells[(entry[0], entry[1])] = Cell(explored=bool(flags & 1), icon=IconType(entry[3]),
+                                                   label=entry[4] if len(entry) > 4 else "", locked=bool(flags & 2))
+            for x, y in message['d']:
+                cells.pop((x, y), None)
+            self.applied_cells += len(message['c']) + len(message['d'])
+        elif kind == 'view':
+            self.current_floor = message['f']
+            self.current_pos = tuple(message['p'])
+            self.rotation = message['r']
+        elif kind == 'reset':
+            self.floors = {}
+
+    def run(self):
+        last_report = time.time()
+        while self.running:
+            self.clock.tick(60)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif event.type == pygame.VIDEORESIZE:
+                    self.window_width, self.window_height = event.w, event.h
+                    self.screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+                    self.renderer.screen = self.screen
+                elif event.type == pygame.MOUSEWHEEL:
+                    if event.y > 0: self.zoom = min(3.0, self.zoom * 1.1)
+                    elif event.y < 0: self.zoom = max(0.3, self.zoom / 1.1)
+
+            self.apply_pending()
+
+            if self.headless:
+                now = time.time()
+                if now - last_report >= 1.0:
+                    cell_count = sum(len(cells) for cells in self.floors.values())
+                    print(f"{self.applied_cells / (now - last_report):.0f} edits/s | {cell_count} cells | floor {self.current_floor} @ {self.current_pos}")
+                    self.applied_cells = 0
+                    last_report = now
+                continue
+
+            self.screen.fill(config.BG_COLOR)
+            self.renderer.draw_grid()
+            pygame.display.flip()
+        pygame.quit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only live view of a Dungeon Crawltographer map.")
+    parser.add_argument("host", help="IP address of the mapper PC")
+    parser.add_argument("--port", type=int, default=SPECTATOR_PORT)
+    parser.add_argument("--headless", action="store_true", help="Track the map without opening a window")
+    args = parser.parse_args()
+
+    if args.headless:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    viewer = SpectatorViewer(args.host, args.port, headless=args.headless)
+    viewer.run()
+
+if __name__ == "__main__":
+    main()
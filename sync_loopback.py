@@ -0,0 +1,147 @@
+"""
+Loopback check for map sync: windowless mappers in one process, connected over
+127.0.0.1, edit the same map and must end up with the same cells.
+
+    python sync_loopback.py
+
+It covers edits made while the connection is still being set up (before the other
+side's hello is handled), live edits in both directions, catching up after a
+reconnect, and a third mapper with spilled floors joining (its floors are hashed
+without being loaded back, and edits reach it through the mapper it connects to).
+Exits with status 1 if a check fails.
+"""
+import os
+import sys
+import time
+
+from data_models import Floor, IconType
+from floor_store import FloorStore
+from history import CellChanges
+import map_sync
+from map_sync import MapSync
+
+SETTLE_SECONDS = 5.0
+FRAME_SECONDS = 0.005
+SPILLED_FLOORS = 10
+
+class Replica:
+    """A windowless DungeonMapper with its own MapSync on an ephemeral loopback port."""
+    def __init__(self, peers=(), floors: FloorStore = None):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import dungeon_mapper
+        self.mapper = dungeon_mapper.DungeonMapper(network=False)
+        if floors is not None:
+            self.mapper.floors = floors
+        self.sync = MapSync(self.mapper, port=0, peers=peers, host="127.0.0.1")
+        self.sync.start()
+
+    def edit(self, floor: int, pos, label: str = "", icon: IconType = IconType.NONE):
+        """Commits one explored cell like a click would, through the undo history."""
+        cells = self.mapper.get_floor(floor)
+        action = CellChanges(floor)
+        new = (True, icon, label, False)
+        action.record(pos, cells.get_state(pos), new)
+        cells.set_state(pos, new)
+        self.mapper.push_history(action)
+
+    def erase(self, floor: int, pos):
+        cells = self.mapper.get_floor(floor)
+        action = CellChanges(floor)
+        action.record(pos, cells.get_state(pos), None)
+        cells.set_state(pos, None)
+        self.mapper.push_history(action)
+
+    def frame(self):
+        self.sync.publish_frame()
+
+    def state(self) -> dict:
+        return {(number, pos): cell.state() for number, floor in self.mapper.floors.items()
+                for pos, cell in floor.items() if cell.explored or cell.locked}
+
+def _pump(replicas, until=None, seconds: float = SETTLE_SECONDS) -> bool:
+    """Runs frames on every replica until `until()` holds or `seconds` pass."""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for replica in replicas:
+            replica.frame()
+        if until and until():
+            return True
+        time.sleep(FRAME_SECONDS)
+    return until is None
+
+def _connected(replica) -> bool:
+    return any(peer.alive for peer in replica.sync.peers)
+
+def _converged(replicas) -> bool:
+    first = replicas[0].state()
+    return all(replica.state() == first for replica in replicas[1:])
+
+def _check(name: str, ok: bool, failures: list):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    if not ok:
+        failures.append(name)
+
+def _spilled_store() -> FloorStore:
+    """SPILLED_FLOORS floors of cells, only two of them resident."""
+    floors = FloorStore(resident=2)
+    for number in range(SPILLED_FLOORS):
+        floor = Floor()
+        floor.set_states(((x, number), (True, IconType.NONE, "", False)) for x in range(0, 200, 3))
+        floors[number] = floor
+    return floors
+
+def main() -> int:
+    failures = []
+    a = Replica()
+    a.edit(0, (1, 1), "before connecting")
+    b = Replica(peers=[f"127.0.0.1:{a.sync.port}"])
+    b.edit(1, (2, 2), "b before connecting")
+
+    # Let `a` take the connection and send its hello, then edit before handling b's hello.
+    # Floor 3 is in neither hello, so only the ops themselves can carry the edit.
+    deadline = time.perf_counter() + SETTLE_SECONDS
+    while not a.sync.peers and time.perf_counter() < deadline:
+        a.frame()
+        time.sleep(FRAME_SECONDS)
+    a.edit(3, (3, 3), "during the handshake")
+    a.frame()
+    b.edit(1, (4, 4), "b during the handshake")
+    _check("handshake", _pump([a, b], lambda: _converged([a, b])), failures)
+
+    # b writes only after merging a's write, so its stamp is causally later. Edits made
+    # concurrently are settled by replica id instead, which says nothing about order.
+    a.edit(0, (5, 5), icon=IconType.STAIRS_DOWN)
+    _pump([a, b], lambda: b.state().get((0, (5, 5)), (None, None))[1] == IconType.STAIRS_DOWN)
+    b.edit(0, (5, 5), "same cell, later")
+    b.erase(0, (1, 1))
+    _check("live edits", _pump([a, b], lambda: _converged([a, b])), failures)
+    _check("later write wins", a.state().get((0, (5, 5)), (None, None, None))[2] == "same cell, later", failures)
+    _check("erase", (0, (1, 1)) not in a.state(), failures)
+
+    # Drop the connection, edit both sides, and let b redial
+    for peer in list(b.sync.peers):
+        peer.close()
+    _pump([a, b], lambda: not _connected(a) and not _connected(b))
+    a.edit(2, (6, 6), "a while apart")
+    b.edit(2, (7, 7), "b while apart")
+    b.edit(3, (3, 3), "b overwrote while apart")
+    reconnected = _pump([a, b], lambda: _connected(a) and _connected(b), map_sync.SYNC_RETRY_SECONDS * 3)
+    _check("reconnect", reconnected and _pump([a, b], lambda: _converged([a, b])), failures)
+
+    # A third mapper with mostly spilled floors joins through a
+    floors = _spilled_store()
+    c = Replica(peers=[f"127.0.0.1:{a.sync.port}"], floors=floors)
+    resident, faults = list(floors.resident), floors.faults
+    c.sync.floor_hashes()
+    c.sync.floor_hashes()
+    _check("hashing spilled floors loads none", floors.faults == faults and list(floors.resident) == resident, failures)
+    b.edit(4, (8, 8), "b after c joined")
+    _check("third mapper", _pump([a, b, c], lambda: _converged([a, b, c])), failures)
+
+    print(f"{len(a.state())} cells, {sum(r.sync.ops_sent for r in (a, b, c))} ops sent")
+    for replica in (a, b, c):
+        replica.sync.close()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
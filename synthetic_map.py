@@ -0,0 +1,80 @@
+"""
+Deterministic synthetic dungeons for benchmarks and load tests.
+
+Each floor is carved as rectangular rooms joined by L-shaped corridors until it holds
+the requested number of cells. The same parameters and seed always give the same map.
+
+    python synthetic_map.py big.json --cells 100000 --floors 5
+"""
+import argparse
+import random
+from typing import Dict
+
+from data_models import Cell, Floor, IconType
+
+# Icons that can be scattered on a floor (NONE is the plain explored cell)
+PLACEABLE_ICONS = [icon for icon in IconType if icon != IconType.NONE]
+
+def generate_floor(rng: random.Random, cells: int, icon_density: float, label_ratio: float, lock_ratio: float) -> Floor:
+    floor = Floor()
+    x, y = 0, 0
+    while len(floor) < cells:
+        width, height = rng.randint(3, 12), rng.randint(3, 10)
+        for rx in range(x, x + width):
+            for ry in range(y, y + height):
+                floor[(rx, ry)] = Cell(explored=True)
+        # Corridor from this room's center to the next room
+        cx, cy = x + width // 2, y + height // 2
+        nx, ny = cx + rng.randint(-20, 24), cy + rng.randint(-16, 20)
+        for rx in range(min(cx, nx), max(cx, nx) + 1):
+            floor[(rx, cy)] = Cell(explored=True)
+        for ry in range(min(cy, ny), max(cy, ny) + 1):
+            floor[(nx, ry)] = Cell(explored=True)
+        x, y = nx - rng.randint(0, 3), ny - rng.randint(0, 3)
+
+    # Trim to the exact size, then decorate in a stable order
+    positions = sorted(floor)
+    for pos in positions[cells:]:
+        del floor[pos]
+    for pos in positions[:cells]:
+        cell = floor[pos]
+        if rng.random() < icon_density:
+            cell.icon = rng.choice(PLACEABLE_ICONS)
+        if rng.random() < label_ratio:
+            cell.label = f"room {rng.randint(1, 999)}"
+        if rng.random() < lock_ratio:
+            cell.locked = True
+    return floor
+
+def generate_map(floors: int = 3, cells_per_floor: int = 20000, icon_density: float = 0.05,
+                 label_ratio: float = 0.02, lock_ratio: float = 0.01, seed: int = 1) -> Dict[int, Floor]:
+    """Returns floor number -> Floor for a synthetic dungeon."""
+    rng = random.Random(seed)
+    return {floor: generate_floor(rng, cells_per_floor, icon_density, label_ratio, lock_ratio)
+            for floor in range(floors)}
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """The generator options, shared by the scripts that build synthetic maps."""
+    parser.add_argument("--floors", type=int, default=3)
+    parser.add_argument("--cells", type=int, default=20000, help="Cells per floor")
+    parser.add_argument("--icon-density", type=float, default=0.05, help="Fraction of cells with an icon")
+    parser.add_argument("--label-ratio", type=float, default=0.02, help="Fraction of cells with a label")
+    parser.add_argument("--lock-ratio", type=float, default=0.01, help="Fraction of locked cells")
+    parser.add_argument("--seed", type=int, default=1)
+
+def map_from_arguments(args) -> Dict[int, Floor]:
+    return generate_map(args.floors, args.cells, args.icon_density, args.label_ratio, args.lock_ratio, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic dungeon map.")
+    parser.add_argument("output", help="Map file to write (.json or .jsonl)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    from file_manager import save_map_data
+    floors = map_from_arguments(args)
+    start = next(iter(floors[0])) if floors and len(floors[0]) else (0, 0)
+    save_map_data(args.output, floors, 0, start, 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import dungeon_mapper
+from data_models import IconType
+
+def _mapper(cells):
+    """A windowless mapper whose current floor holds `cells`: {pos: (label, locked)}."""
+    mapper = dungeon_mapper.DungeonMapper(network=False)
+    floor = mapper.get_floor()
+    for pos, (label, locked) in cells.items():
+        floor.set_state(pos, (True, IconType.NONE, label, locked))
+    return mapper, floor
+
+def _labels(floor):
+    return {pos: cell.label for pos, cell in floor.items()}
+
+def test_move_blocked_by_locked_cell_keeps_the_chain_behind_it():
+    mapper, floor = _mapper({(0, 0): ("zero", False), (1, 0): ("one", False), (2, 0): ("two", False), (3, 0): ("wall", True)})
+    region = mapper.region_editor.move({(0, 0), (1, 0), (2, 0)}, 1, 0)
+    assert _labels(floor) == {(0, 0): "zero", (1, 0): "one", (2, 0): "two", (3, 0): "wall"}
+    assert region == {(0, 0), (1, 0), (2, 0)}
+
+def test_move_into_locked_cell_of_the_selection_is_blocked():
+    mapper, floor = _mapper({(0, 0): ("zero", False), (1, 0): ("one", False), (2, 0): ("locked", True), (0, 1): ("free", False)})
+    region = mapper.region_editor.move({(0, 0), (1, 0), (2, 0), (0, 1)}, 1, 0)
+    assert _labels(floor) == {(0, 0): "zero", (1, 0): "one", (2, 0): "locked", (1, 1): "free"}
+    assert region == {(0, 0), (1, 0), (2, 0), (1, 1)}
+
+def test_blocked_move_is_undone_as_one_entry():
+    mapper, floor = _mapper({(0, 0): ("zero", False), (1, 0): ("one", False), (5, 0): ("wall", True), (0, 1): ("free", False)})
+    before = _labels(floor)
+    mapper.region_editor.move({(0, 0), (1, 0), (0, 1)}, 4, 0)
+    assert _labels(floor) == {(4, 0): "zero", (1, 0): "one", (5, 0): "wall", (4, 1): "free"}
+    mapper.undo()
+    assert _labels(floor) == before
@@ -0,0 +1,141 @@
+"""
+The player's trail: every step taken with DungeonMapper.move_player (keyboard or
+controller), and a visit-count heat map built from it (G toggles the overlay).
+
+Steps are kept in a ring buffer of parallel arrays, 15 bytes per step, holding the
+last TRAIL_STEPS steps (CRAWLTOGRAPHER_TRAIL_STEPS). Visit counts are updated as steps
+are added and dropped. They are kept per floor in 16x16 chunks like Floor's cells, so
+drawing the overlay only visits the chunks on screen. Nothing is drawn or computed
+per frame while the overlay is off.
+
+The trail is saved next to the map file as <map>.trail, and loaded with it.
+"""
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+
+from data_models import CHUNK_SHIFT, CHUNK_SIZE
+
+TRAIL_STEPS = int(os.environ.get("CRAWLTOGRAPHER_TRAIL_STEPS", 500_000))
+TIME_UNIT = 0.01  # Step times are stored as hundredths of a second since the trail's epoch
+
+TRAIL_MAGIC = b"CRTRAIL1"
+_HEADER = struct.Struct("<8sdII")  # magic, epoch, capacity, number of steps
+_COLUMNS = (("floors", 'h'), ("xs", 'i'), ("ys", 'i'), ("facings", 'B'), ("times", 'I'))
+
+def trail_path(map_path: str) -> str:
+    return os.path.splitext(map_path)[0] + ".trail"
+
+class PlayerTrail:
+    def __init__(self, capacity: int = None, epoch: float = None):
+        self.capacity = max(1, capacity or TRAIL_STEPS)
+        self.epoch = time.time() if epoch is None else epoch
+        # Parallel columns; they grow up to `capacity`, then `start` marks the oldest step
+        self.floors = array('h')
+        self.xs = array('i')
+        self.ys = array('i')
+        self.facings = array('B')  # rotation // 90
+        self.times = array('I')
+        self.start = 0
+        # floor -> chunk -> visits per cell, indexed like EdgeLayer chunks
+        self.heat: Dict[int, Dict[Tuple[int, int], array]] = {}
+        self.max_visits: Dict[int, int] = {}  # Highest count seen on each floor, for scaling the overlay
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    def record(self, floor: int, pos: Tuple[int, int], rotation: int, when: float = None):
+        """Adds a step, dropping the oldest one when the trail is full."""
+        ticks = min(0xFFFFFFFF, max(0, int(((time.time() if when is None else when) - self.epoch) / TIME_UNIT)))
+        row = (floor, pos[0], pos[1], (rotation // 90) % 4, ticks)
+        if len(self.xs) < self.capacity:
+            for (name, _), value in zip(_COLUMNS, row):
+                getattr(self, name).append(value)
+        else:
+            i = self.start
+            self._count(self.floors[i], self.xs[i], self.ys[i], -1)
+            for (name, _), value in zip(_COLUMNS, row):
+                getattr(self, name)[i] = value
+            self.start = (i + 1) % self.capacity
+        self._count(floor, pos[0], pos[1], 1)
+
+    def _count(self, floor: int, x: int, y: int, delta: int):
+        chunks = self.heat.setdefault(floor, {})
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        counts = chunks.get(key)
+        if counts is None:
+            counts = chunks[key] = array('I', bytes(4 * CHUNK_SIZE * CHUNK_SIZE))
+        index = ((y & (CHUNK_SIZE - 1)) << CHUNK_SHIFT) | (x & (CHUNK_SIZE - 1))
+        counts[index] += delta
+        if delta > 0 and counts[index] > self.max_visits.get(floor, 0):
+            self.max_visits[floor] = counts[index]
+
+    def steps(self) -> Iterator[Tuple[int, int, int, int, float]]:
+        """(floor, x, y, facing in degrees, unix time) for every step, oldest first."""
+        for n in range(len(self.xs)):
+            i = (self.start + n) % len(self.xs)
+            yield self.floors[i], self.xs[i], self.ys[i], self.facings[i] * 90, self.epoch + self.times[i] * TIME_UNIT
+
+    def visits(self, floor: int, pos: Tuple[int, int]) -> int:
+        counts = self.heat.get(floor, {}).get((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+        if counts is None:
+            return 0
+        return counts[((pos[1] & (CHUNK_SIZE - 1)) << CHUNK_SHIFT) | (pos[0] & (CHUNK_SIZE - 1))]
+
+    def heat_level(self, floor: int, visits: int, levels: int) -> int:
+        """0..levels-1 on a log scale relative to the floor's busiest cell."""
+        top = self.max_visits.get(floor, 1)
+        if top <= 1:
+            return levels - 1
+        return min(levels - 1, int(math.log(visits) / math.log(top) * (levels - 1) + 0.5))
+
+    def save(self, path: str):
+        """Writes the steps, oldest first and little-endian, to a zlib-compressed file."""
+        payload = bytearray(_HEADER.pack(TRAIL_MAGIC, self.epoch, self.capacity, len(self.xs)))
+        for name, _ in _COLUMNS:
+            column = getattr(self, name)
+            ordered = column[self.start:] + column[:self.start] # A copy, so byteswap() below is safe
+            if sys.byteorder == "big":
+                ordered.byteswap()
+            payload += ordered.tobytes()
+        with open(path, 'wb') as f:
+            f.write(zlib.compress(bytes(payload), 1))
+
+    @classmethod
+    def load(cls, path: str, capacity: int = None) -> Optional["PlayerTrail"]:
+        """Reads a file written by save(); None if it is missing or unreadable."""
+        try:
+            with open(path, 'rb') as f:
+                payload = zlib.decompress(f.read())
+            magic, epoch, _, count = _HEADER.unpack_from(payload)
+            if magic != TRAIL_MAGIC:
+                raise ValueError("not a trail file")
+            trail = cls(capacity, epoch)
+            offset = _HEADER.size
+            columns = []
+            for _, typecode in _COLUMNS:
+                column = array(typecode)
+                column.frombytes(payload[offset:offset + count * column.itemsize])
+                if len(column) != count:
+                    raise ValueError("truncated trail file")
+                if sys.byteorder == "big":
+                    column.byteswap()
+                offset += count * column.itemsize
+                columns.append(column)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error, struct.error) as e:
+            print(f"Error loading trail {path}: {e}")
+            return None
+        # Keep the newest steps if the file holds more than this trail's capacity
+        keep = slice(max(0, count - trail.capacity), count)
+        for (name, typecode), column in zip(_COLUMNS, columns):
+            setattr(trail, name, array(typecode, column[keep]))
+        for floor, x, y in zip(trail.floors, trail.xs, trail.ys):
+            trail._count(floor, x, y, 1)
+        return trail
@@ -1,41 +1,131 @@
+import json
+import random
 import threading
 import socket
+import time
 import pygame
 
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5000
+# How far ahead of the next expected sequence number a client may run.
+# Matches comfortably above the client's WINDOW_SIZE.
+REORDER_LIMIT = 64
+# Clients not heard from for this long are forgotten (checked when a new client appears).
+CLIENT_IDLE_SECONDS = 600
 # Define a custom Pygame event ID
-REMOTE_MOVE_EVENT = pygame.event.custom_type() 
+REMOTE_MOVE_EVENT = pygame.event.custom_type()
+
+class CaptureWriter:
+    """
+    Records received datagrams to a JSON-lines capture file for udp_loadtest.py.
+
+    The first line is a header; every other line is
+    {"t": seconds since capture start, "src": "ip:port", "data": payload}.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.file = open(path, 'w')
+        self.file.write(json.dumps({'format': 'udp-capture', 'version': 1, 'started': time.time()}) + '\n')
+
+    def record(self, received_at: float, addr, data: bytes):
+        line = json.dumps({'t': round(received_at - self.started, 6), 'src': f"{addr[0]}:{addr[1]}",
+                           'data': data.decode('utf-8', errors='replace')})
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
 
 class UDPInputListener(threading.Thread):
-    def __init__(self):
+    def __init__(self, stats=None, capture=None, host=None, port=None, verbose=True):
         super().__init__()
         self.daemon = True
+        self.verbose = verbose
+        self.stats = stats
+        self.capture = capture
+        self.host = UDP_IP if host is None else host
+        self.port = UDP_PORT if port is None else port
+        # Per-client delivery state: addr -> [session, next_expected_seq, {seq: (command, received_at)}, last_heard, ended sessions]
+        self.clients = {}
+        # Sent with every ack, so a client can tell that the mapper restarted and lost its state
+        self.epoch = f"{random.getrandbits(32):08x}"
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            self.sock.bind((UDP_IP, UDP_PORT))
+            self.sock.bind((self.host, self.port))
+            self.port = self.sock.getsockname()[1] # Resolves port 0 to the one actually bound
         except OSError as e:
-            print(f"ERROR: Could not bind UDP socket to port {UDP_PORT}. {e}")
+            print(f"ERROR: Could not bind UDP socket to port {self.port}. {e}")
             self.sock = None
 
     def run(self):
         if not self.sock: return
-        print(f"Starting UDP listener on port {UDP_PORT}...")
+        print(f"Starting UDP listener on port {self.port}...")
         while True:
             try:
                 data, addr = self.sock.recvfrom(1024)
+                received_at = time.perf_counter()
+                if self.capture:
+                    self.capture.record(received_at, addr, data)
                 message = data.decode('utf-8')
-                
-                parts = message.split(';', 1)
-                if len(parts) == 2:
+
+                parts = message.split(';')
+                if len(parts) == 3: # session;seq;command
+                    session, seq, command = parts
+                    self._receive(int(seq), command, addr, received_at, session)
+                elif len(parts) == 2: # seq;command, from clients and captures without sessions
                     seq, command = parts
-                    print(f"DEBUG: Received command '{command}' (Seq: {seq}) from {addr}")
+                    self._receive(int(seq), command, addr, received_at)
+            except ValueError:
+                continue # Malformed sequence number, ignore the datagram
+            except Exception:
+                break
 
-                    # Send acknowledgment back to the original sender
-                    ack_message = f"ack;{seq}".encode('utf-8')
-                    self.sock.sendto(ack_message, addr)
+    def _receive(self, seq: int, command: str, addr, received_at: float, session: str = None):
+        """
+        Delivers commands from one client strictly in sequence order.
 
-                    event_data = {'command': command}
-                    pygame.event.post(pygame.event.Event(REMOTE_MOVE_EVENT, event_data))
-            except Exception:
-                break
\ No newline at end of file
+        The client keeps several commands in flight, so datagrams may arrive out of
+        order or more than once (retransmits). Early arrivals are held back until the
+        gap is filled and duplicates are dropped. The ack is cumulative: it names the
+        highest sequence number delivered so far, followed by this listener's epoch.
+        A client that starts a new session numbers its commands from 1 again. Late
+        datagrams from a session the client has already left are ignored, so they
+        cannot reset the new session.
+        """
+        state = self.clients.get(addr)
+        if state is None:
+            self._evict_idle(received_at)
+            state = self.clients[addr] = [session, 1, {}, received_at, set()]
+        elif state[0] != session:
+            ended = state[4]
+            if session in ended:
+                return
+            ended.add(state[0])
+            state = self.clients[addr] = [session, 1, {}, received_at, ended]
+        state[3] = received_at
+        pending = state[2]
+        if self.stats:
+            self.stats.increment('datagrams')
+            self.stats.set_value('clients', len(self.clients))
+            if seq < state[1] or seq in pending:
+                self.stats.increment('duplicates')
+            elif seq > state[1]:
+                self.stats.increment('out_of_order')
+        if state[1] <= seq < state[1] + REORDER_LIMIT:
+            pending[seq] = (command, received_at)
+
+        while state[1] in pending:
+            command, command_received_at = pending.pop(state[1])
+            if self.verbose:
+                print(f"DEBUG: Received command '{command}' (Seq: {state[1]}) from {addr}")
+            event_data = {'command': command, 'received_at': command_received_at}
+            pygame.event.post(pygame.event.Event(REMOTE_MOVE_EVENT, event_data))
+            state[1] += 1
+
+        # Send acknowledgment back to the original sender
+        ack_message = f"ack;{state[1] - 1};{self.epoch}".encode('utf-8')
+        self.sock.sendto(ack_message, addr)
+
+    def _evict_idle(self, now: float):
+        for addr in [addr for addr, state in self.clients.items() if now - state[3] > CLIENT_IDLE_SECONDS]:
+            del self.clients[addr]
@@ -0,0 +1,287 @@
+"""
+Capture replay and load generation for the controller link.
+
+Runs entirely on loopback by default: an in-process, windowless mapper receives the
+traffic, so no gamepad, no `inputs` package and no second PC are needed.
+
+    python udp_loadtest.py load --clients 4 --rate 50 --duration 10
+    python udp_loadtest.py replay session.capture --max-speed
+    python udp_loadtest.py load --target 192.168.1.213:5000   # against a running mapper
+
+Captures are recorded by the mapper itself: start it with
+CRAWLTOGRAPHER_UDP_CAPTURE=session.capture.
+
+The report covers throughput, ack latency percentiles, retransmits/loss and, for the
+in-process target, the hash of the final map state (see file_manager.map_state_hash).
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+
+from net_stats import LatencyHistogram, NetStats
+from game_pc_client import ReliableSender, AckListener
+
+REPLAY_WINDOW = 32  # Max unacked datagrams per client during a max-speed replay
+DEFAULT_COMMANDS = ['forward', 'rotate_left', 'forward', 'mark_cell', 'forward', 'rotate_right', 'backward']
+
+class LossySocket:
+    """Wraps a UDP socket and drops a fraction of outgoing datagrams, to simulate a bad link."""
+    def __init__(self, sock, loss: float, rng: random.Random):
+        self.sock = sock
+        self.loss = loss
+        self.rng = rng
+
+    def sendto(self, data, address):
+        if self.rng.random() < self.loss:
+            return len(data)
+        return self.sock.sendto(data, address)
+
+class InProcessMapper:
+    """
+    A windowless DungeonMapper fed by its own UDP listener on an ephemeral loopback port.
+
+    The listener posts pygame events as usual; pump() runs the mapper's event handler
+    on the calling thread, exactly like the main loop would.
+    """
+    def __init__(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import dungeon_mapper
+        from udp_listener import UDPInputListener
+        self.mapper = dungeon_mapper.DungeonMapper(network=False)
+        self.listener = UDPInputListener(stats=self.mapper.net_stats, host="127.0.0.1", port=0, verbose=False)
+        self.listener.start()
+        self.address = ("127.0.0.1", self.listener.port)
+
+    def pump(self):
+        self.mapper.event_handler.handle_events()
+
+    def state_hash(self) -> str:
+        from file_manager import map_state_hash
+        m = self.mapper
+        return map_state_hash(m.floors, m.current_floor, m.current_pos, m.rotation)
+
+def _wait(target, until: float):
+    """Sleeps until `until`, pumping the in-process mapper if there is one."""
+    while True:
+        remaining = until - time.perf_counter()
+        if remaining <= 0:
+            return
+        if target:
+            target.pump()
+            time.sleep(min(remaining, 0.002))
+        else:
+            time.sleep(remaining)
+
+def run_load(address, target, clients: int, rate: float, duration: float, commands, loss: float, seed: int) -> dict:
+    """Drives `clients` windowed senders, each submitting `rate` commands per second."""
+    stats = NetStats()
+    rng = random.Random(seed)
+    senders = []
+    for _ in range(clients):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(0.5)
+        events = queue.Queue()
+        sender = ReliableSender(LossySocket(sock, loss, rng) if loss else sock, address, verbose=False, stats=stats)
+        AckListener(sock, events).start()
+        threading.Thread(target=sender.run, args=(events,), daemon=True).start()
+        senders.append((sender, events))
+
+    started = time.perf_counter()
+    interval = 1.0 / rate
+    submitted = 0
+    tick = 0
+    while tick * interval < duration:
+        for sender, events in senders:
+            events.put(('command', commands[submitted % len(commands)]))
+            submitted += 1
+        tick += 1
+        _wait(target, started + tick * interval)
+
+    # Give in-flight commands a chance to be acked before counting losses.
+    drain_deadline = time.perf_counter() + 5.0
+    while time.perf_counter() < drain_deadline and any(s.outstanding or s.pending for s, _ in senders):
+        _wait(target, time.perf_counter() + 0.01)
+    elapsed = time.perf_counter() - started
+    for _, events in senders:
+        events.put(('stop', None))
+
+    snapshot = stats.snapshot()
+    delivered = sum(s.acked_seq for s, _ in senders)
+    return {
+        'mode': 'load',
+        'clients': clients,
+        'submitted': submitted,
+        'delivered': delivered,
+        'undelivered': submitted - delivered,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(delivered / elapsed, 1) if elapsed else 0.0,
+        'ack_latency': snapshot.get('delivery', LatencyHistogram().summary()),
+        'rtt': snapshot.get('rtt', LatencyHistogram().summary()),
+        'retransmits': snapshot.get('retransmits', 0),
+        'lost': snapshot.get('lost', 0),
+    }
+
+def read_capture(path: str):
+    """Yields (t, src, data) for every datagram in a capture file."""
+    with open(path) as f:
+        header = json.loads(f.readline())
+        if header.get('format') != 'udp-capture':
+            raise ValueError(f"{path} is not a UDP capture file")
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry['t'], entry['src'], entry['data']
+
+def run_replay(address, target, path: str, speed: float) -> dict:
+    """
+    Re-sends captured datagrams, one socket per original client so each keeps its own
+    sequence space. speed=0 sends as fast as the mapper acks (at most REPLAY_WINDOW
+    datagrams ahead, since replayed traffic is never retransmitted); otherwise original
+    timing is scaled by 1/speed. Datagrams are parsed like UDPInputListener does
+    (session;seq;command, or seq;command), and a client's in-flight datagrams are
+    tracked per session. Acks do not name a session, so at max speed a client's new
+    session only starts once the old one's datagrams are acked.
+    """
+    latency = LatencyHistogram()
+    lock = threading.Lock()
+    clients = {}  # src -> [socket, current session]
+    flights = {}  # (src, session) -> [{seq: first_send_time}, highest_ack]
+    ended = set()  # (src, session) of sessions a client has moved on from
+
+    def listen(src, sock):
+        while True:
+            try:
+                data, _ = sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            message = data.decode('utf-8')
+            if not message.startswith('ack;'):
+                continue
+            ack = int(message.split(';')[1])
+            now = time.perf_counter()
+            with lock:
+                flight = flights.get((src, clients[src][1]))
+                if flight is None:
+                    continue
+                sent = flight[0]
+                for seq in [s for s in sent if s <= ack]:
+                    latency.add(now - sent.pop(seq))
+                flight[1] = max(flight[1], ack)
+
+    started = time.perf_counter()
+    datagrams = 0
+    for t, src, data in read_capture(path):
+        parts = data.split(';')
+        session, seq = (parts[0], parts[1]) if len(parts) == 3 else (None, parts[0])
+        if speed <= 0 and src in clients and clients[src][1] != session and (src, session) not in ended:
+            old = flights[(src, clients[src][1])][0]
+            drain_deadline = time.perf_counter() + 1.0
+            while old and time.perf_counter() < drain_deadline:
+                _wait(target, time.perf_counter() + 0.0005)
+        with lock:
+            if src not in clients:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.settimeout(0.5)
+                clients[src] = [sock, session]
+                flights[(src, session)] = [{}, 0]
+                threading.Thread(target=listen, args=(src, sock), daemon=True).start()
+            elif clients[src][1] != session and (src, session) not in ended:
+                # A new session numbers from 1 again; the mapper drops the old one's state too
+                ended.add((src, clients[src][1]))
+                flights.pop((src, clients[src][1]), None)
+                clients[src][1] = session
+                flights[(src, session)] = [{}, 0]
+            flight = flights.get((src, session))  # None for a straggler the mapper will ignore
+        if speed > 0:
+            _wait(target, started + t / speed)
+        elif flight is not None:
+            window_deadline = time.perf_counter() + 1.0
+            while len(flight[0]) >= REPLAY_WINDOW and time.perf_counter() < window_deadline:
+                _wait(target, time.perf_counter() + 0.0005)
+        with lock:
+            if flight is not None and seq.isdigit() and int(seq) > flight[1]:
+                flight[0].setdefault(int(seq), time.perf_counter())
+        clients[src][0].sendto(data.encode('utf-8'), address)
+        datagrams += 1
+
+    drain_deadline = time.perf_counter() + 2.0
+    while time.perf_counter() < drain_deadline:
+        with lock:
+            if not any(flight[0] for flight in flights.values()):
+                break
+        _wait(target, time.perf_counter() + 0.01)
+    elapsed = time.perf_counter() - started
+    with lock:
+        unacked = sum(len(flight[0]) for flight in flights.values())
+
+    return {
+        'mode': 'replay',
+        'clients': len(clients),
+        'datagrams': datagrams,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(datagrams / elapsed, 1) if elapsed else 0.0,
+        'ack_latency': latency.summary(),
+        'unacked': unacked,
+    }
+
+def print_report(report: dict):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(f"{key}: " + ", ".join(f"{k}={v}" for k, v in value.items()))
+        else:
+            print(f"{key}: {value}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay UDP captures or generate synthetic controller load.")
+    parser.add_argument("--target", help="host:port of a running mapper (default: an in-process mapper on loopback)")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    load = sub.add_parser("load", help="Synthesize traffic from several clients")
+    load.add_argument("--clients", type=int, default=1)
+    load.add_argument("--rate", type=float, default=20.0, help="Commands per second, per client")
+    load.add_argument("--duration", type=float, default=5.0, help="Seconds")
+    load.add_argument("--commands", default=",".join(DEFAULT_COMMANDS), help="Comma-separated command cycle")
+    load.add_argument("--loss", type=float, default=0.0, help="Fraction of outgoing datagrams to drop")
+    load.add_argument("--seed", type=int, default=1)
+
+    replay = sub.add_parser("replay", help="Re-send a capture recorded with CRAWLTOGRAPHER_UDP_CAPTURE")
+    replay.add_argument("capture")
+    replay.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier")
+    replay.add_argument("--max-speed", action="store_true", help="Ignore original timing")
+
+    args = parser.parse_args()
+
+    target = None
+    if args.target:
+        host, port = args.target.rsplit(':', 1)
+        address = (host, int(port))
+    else:
+        target = InProcessMapper()
+        address = target.address
+
+    if args.mode == "load":
+        report = run_load(address, target, args.clients, args.rate, args.duration,
+                          args.commands.split(','), args.loss, args.seed)
+    else:
+        report = run_replay(address, target, args.capture, 0 if args.max_speed else args.speed)
+
+    if target:
+        target.pump()
+        report['receive_to_apply'] = target.mapper.net_stats.snapshot().get('receive_to_apply', {})
+        report['map_hash'] = target.state_hash()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -3,122 +3,98 @@ import pygame
 import config
 from data_models import IconType
 from renderer import Renderer
+from edge_edit import EDGE_TOOL_NAMES
+from ui_layout import UILayout
 
 class UIManager:
     def __init__(self, app):
         self.app = app
         self.screen = app.screen
         self.renderer = Renderer(app) # For drawing icons in the UI
+        self.layout = UILayout(app) # Widget rects, shared with EventHandler for clicks
+        self.info_text = None
+        self.info_surface = None # The status text, re-rendered only when it changes
 
     def draw_ui(self):
         """Draw the menu bar and icon panel"""
+        self.layout.update()
         self._draw_title_bar()
         self._draw_menu_bar()
         if self.app.show_icon_panel:
             self._draw_icon_panel()
         self._draw_dropdown_menus()
         self._draw_hover_tooltip()
+        if self.app.show_net_stats:
+            self._draw_net_stats_panel()
 
     def _draw_title_bar(self):
         pygame.draw.rect(self.screen, config.UI_BG_COLOR, (0, 0, self.app.window_width, config.TITLE_BAR_HEIGHT))
         pygame.draw.line(self.screen, config.GRID_COLOR, (0, config.TITLE_BAR_HEIGHT), (self.app.window_width, config.TITLE_BAR_HEIGHT), 1)
-        title_surf = config.SMALL_FONT.render("Dungeon Crawltographer", True, config.TEXT_COLOR)
-        title_rect = title_surf.get_rect(center=(self.app.window_width / 2, config.TITLE_BAR_HEIGHT / 2))
-        self.screen.blit(title_surf, title_rect)
+        self.screen.blit(self.layout.title_surface, self.layout.title_rect)
 
     def _draw_menu_bar(self):
-        bar_y = config.TITLE_BAR_HEIGHT
-        pygame.draw.rect(self.screen, config.UI_BG_COLOR, (0, bar_y, self.app.window_width, config.MENU_BAR_HEIGHT))
-        pygame.draw.line(self.screen, config.GRID_COLOR, (0, bar_y + config.MENU_BAR_HEIGHT), (self.app.window_width, bar_y + config.MENU_BAR_HEIGHT), 1)
-
-        menu_x = 10
-        file_text = config.SMALL_FONT.render("File", True, config.TEXT_COLOR)
-        file_rect = pygame.Rect(menu_x, bar_y + 5, file_text.get_width() + 10, 20)
-        if self.app.active_menu == 'file':
-            pygame.draw.rect(self.screen, config.BUTTON_HOVER_COLOR, file_rect)
-        self.screen.blit(file_text, (menu_x + 5, bar_y + 8))
-        menu_x += file_text.get_width() + 20
-
-        help_text = config.SMALL_FONT.render("Help", True, config.TEXT_COLOR)
-        help_rect = pygame.Rect(menu_x, bar_y + 5, help_text.get_width() + 10, 20)
-        if self.app.active_menu == 'help':
-            pygame.draw.rect(self.screen, config.BUTTON_HOVER_COLOR, help_rect)
-        self.screen.blit(help_text, (menu_x + 5, bar_y + 8))
+        bar = self.layout.menu_bar
+        pygame.draw.rect(self.screen, config.UI_BG_COLOR, bar)
+        pygame.draw.line(self.screen, config.GRID_COLOR, (0, bar.bottom), (bar.right, bar.bottom), 1)
 
-    def _draw_icon_panel(self):
-        panel_y = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-        pygame.draw.rect(self.screen, config.UI_BG_COLOR, (0, panel_y, self.app.window_width, config.ICON_PANEL_HEIGHT))
-        pygame.draw.line(self.screen, config.GRID_COLOR, (0, panel_y + config.ICON_PANEL_HEIGHT), (self.app.window_width, panel_y + config.ICON_PANEL_HEIGHT), 1)
-
-        icon_list = [
-            (IconType.NONE, "0"), (IconType.ENTRANCE, "1"), (IconType.CHEST, "2"),
-            (IconType.LOCKED_DOOR, "3"), (IconType.STAIRS_UP, "4"), (IconType.STAIRS_DOWN, "5"),
-            (IconType.BOSS, "6"), (IconType.NPC, "7"), (IconType.SWITCH, "8"), (IconType.TRAP, "9"),
-        ]
-
-        icon_x = 10
-        icon_size = 40
-        for icon_type, key in icon_list:
-            color = config.SELECTION_BOX_COLOR if self.app.selected_icon == icon_type else config.BUTTON_COLOR
-            button_rect = pygame.Rect(icon_x, panel_y + 5, icon_size, icon_size)
-            pygame.draw.rect(self.screen, color, button_rect)
-            pygame.draw.rect(self.screen, config.GRID_COLOR, button_rect, 1)
+        for button in self.layout.menu_buttons:
+            if self.app.active_menu == button.value:
+                pygame.draw.rect(self.screen, config.BUTTON_HOVER_COLOR, button.rect)
+            self.screen.blit(button.surface, (button.rect.x + 5, button.rect.y + 3))
 
-            if icon_type != IconType.NONE:
-                self.renderer.draw_icon(icon_type, icon_x + icon_size/2, panel_y + 5 + icon_size/2, icon_size)
+    def _draw_icon_panel(self):
+        panel = self.layout.icon_panel
+        pygame.draw.rect(self.screen, config.UI_BG_COLOR, panel)
+        pygame.draw.line(self.screen, config.GRID_COLOR, (0, panel.bottom), (panel.right, panel.bottom), 1)
+
+        for button in self.layout.icon_buttons:
+            rect = button.rect
+            color = config.SELECTION_BOX_COLOR if self.app.selected_icon == button.value else config.BUTTON_COLOR
+            pygame.draw.rect(self.screen, color, rect)
+            pygame.draw.rect(self.screen, config.GRID_COLOR, rect, 1)
+
+            if button.value != IconType.NONE:
+                self.renderer.draw_icon(button.value, rect.centerx, rect.centery, rect.width)
             else:
-                pygame.draw.line(self.screen, config.TEXT_COLOR, (icon_x + 8, panel_y + 13), (icon_x + icon_size - 8, panel_y + icon_size - 3), 2)
-                pygame.draw.line(self.screen, config.TEXT_COLOR, (icon_x + icon_size - 8, panel_y + 13), (icon_x + 8, panel_y + icon_size - 3), 2)
+                pygame.draw.line(self.screen, config.TEXT_COLOR, (rect.left + 8, rect.top + 8), (rect.right - 8, rect.bottom - 8), 2)
+                pygame.draw.line(self.screen, config.TEXT_COLOR, (rect.right - 8, rect.top + 8), (rect.left + 8, rect.bottom - 8), 2)
 
-            key_surf = config.SMALL_FONT.render(key, True, config.TEXT_COLOR)
-            self.screen.blit(key_surf, (icon_x + icon_size//2 - key_surf.get_width()//2, panel_y + 45))
-            icon_x += icon_size + 5
+            self.screen.blit(button.surface, (rect.centerx - button.surface.get_width()//2, rect.bottom))
 
         # Draw status info on the right side of the icon panel
         player_mode_status = "ON" if self.app.player_mode_enabled else "OFF"
         info_text = f"Floor: {self.app.current_floor} | Pos: ({self.app.current_pos[0]}, {self.app.current_pos[1]}) | Rot: {self.app.rotation}° | Zoom: {self.app.zoom:.1f}x | Player Mode: {player_mode_status}"
-        info_surf = config.SMALL_FONT.render(info_text, True, config.TEXT_COLOR)
-        self.screen.blit(info_surf, (self.app.window_width - info_surf.get_width() - 10, panel_y + (config.ICON_PANEL_HEIGHT - info_surf.get_height()) // 2))
+        if self.app.edge_editor.tool is not None:
+            info_text += f" | Edges: {EDGE_TOOL_NAMES[self.app.edge_editor.tool]}"
+        if info_text != self.info_text:
+            self.info_text = info_text
+            self.info_surface = config.SMALL_FONT.render(info_text, True, config.TEXT_COLOR)
+        info_surf = self.info_surface
+        self.screen.blit(info_surf, (self.app.window_width - info_surf.get_width() - 10, panel.y + (panel.height - info_surf.get_height()) // 2))
 
     def _draw_dropdown_menus(self):
-        if self.app.active_menu == 'file':
-            dropdown_x = 10
-            dropdown_y = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-            dropdown_items = ["New Map", "Save (Ctrl+S)", "Save As...", "Load (Ctrl+L)", "Quit"]
-            self._draw_dropdown(dropdown_x, dropdown_y, 150, dropdown_items)
-        elif self.app.active_menu == 'help':
-            file_text_width = config.SMALL_FONT.render("File", True, config.TEXT_COLOR).get_width()
-            dropdown_x = 10 + file_text_width + 20
-            dropdown_y = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-            dropdown_items = ["Hotkeys", "About"]
-            self._draw_dropdown(dropdown_x, dropdown_y, 150, dropdown_items)
-
-    def _draw_dropdown(self, x, y, width, items):
-        height = len(items) * 25 + 10
-        pygame.draw.rect(self.screen, config.UI_BG_COLOR, (x, y, width, height))
-        pygame.draw.rect(self.screen, config.GRID_COLOR, (x, y, width, height), 1)
-
-        mouse_pos = pygame.mouse.get_pos()
-        for i, item in enumerate(items):
-            item_y = y + 5 + i * 25
-            item_rect = pygame.Rect(x + 5, item_y, width - 10, 20)
-            if item_rect.collidepoint(mouse_pos):
-                pygame.draw.rect(self.screen, config.BUTTON_HOVER_COLOR, item_rect)
-            item_surf = config.SMALL_FONT.render(item, True, config.TEXT_COLOR)
-            self.screen.blit(item_surf, (x + 10, item_y + 2))
+        if not self.app.active_menu:
+            return
+        rect, items = self.layout.dropdowns[self.app.active_menu]
+        pygame.draw.rect(self.screen, config.UI_BG_COLOR, rect)
+        pygame.draw.rect(self.screen, config.GRID_COLOR, rect, 1)
+
+        hovered = self.layout.hit(self.app.mouse_pos)
+        for item in items:
+            if item is hovered:
+                pygame.draw.rect(self.screen, config.BUTTON_HOVER_COLOR, item.rect)
+            self.screen.blit(item.surface, (item.rect.x + 5, item.rect.y + 2))
 
     def _draw_hover_tooltip(self):
         """Draws a tooltip for a cell label when the mouse hovers over it."""
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = self.app.mouse_pos
 
         # Do not draw tooltips if a menu is open or if dragging
         if self.app.active_menu or self.app.dragging or self.app.left_mouse_down or self.app.right_mouse_down:
             return
 
         # Check if mouse is over the grid area
-        panel_h = config.ICON_PANEL_HEIGHT if self.app.show_icon_panel else 0
-        top_bar_height = config.TITLE_BAR_HEIGHT + config.MENU_BAR_HEIGHT
-        if mouse_pos[1] <= top_bar_height + panel_h:
+        if mouse_pos[1] <= self.layout.map_top:
             return
 
         grid_pos = self.app.screen_to_grid(*mouse_pos)
@@ -129,12 +105,33 @@ class UIManager:
         if self.app.current_floor in self.app.floors and grid_pos in self.app.floors[self.app.current_floor]:
             cell = self.app.get_cell(*grid_pos)
             if cell.label:
-                label_surf = config.FONT.render(cell.label, True, config.TEXT_COLOR)
+                label_surf = self.app.renderer.labels.text_surface(cell.label, config.FONT_SIZES["FONT"])
                 tooltip_rect = pygame.Rect(mouse_pos[0] + 15, mouse_pos[1] + 10, label_surf.get_width() + 10, label_surf.get_height() + 6)
                 pygame.draw.rect(self.screen, config.UI_BG_COLOR, tooltip_rect)
                 pygame.draw.rect(self.screen, config.GRID_COLOR, tooltip_rect, 1)
                 self.screen.blit(label_surf, (tooltip_rect.x + 5, tooltip_rect.y + 3))
 
+    def _draw_net_stats_panel(self):
+        """Draws controller link statistics in the bottom-left corner."""
+        stats = self.app.net_stats.snapshot()
+        latency = stats.get('receive_to_apply', {})
+        lines = [
+            "Controller Link (F2)",
+            f"Commands: {stats.get('commands', 0)}  ({stats['commands_per_second']:.1f}/s)",
+            f"Receive->apply: p50 {latency.get('p50_ms', 0):.1f} | p95 {latency.get('p95_ms', 0):.1f} | p99 {latency.get('p99_ms', 0):.1f} ms",
+            f"Datagrams: {stats.get('datagrams', 0)}  Clients: {stats.get('clients', 0)}",
+            f"Duplicates: {stats.get('duplicates', 0)}  Out of order: {stats.get('out_of_order', 0)}",
+        ]
+
+        surfaces = [config.SMALL_FONT.render(line, True, config.TEXT_COLOR) for line in lines]
+        width = max(surf.get_width() for surf in surfaces) + 20
+        height = len(surfaces) * 20 + 10
+        panel_rect = pygame.Rect(10, self.app.window_height - height - 10, width, height)
+        pygame.draw.rect(self.screen, config.UI_BG_COLOR, panel_rect)
+        pygame.draw.rect(self.screen, config.GRID_COLOR, panel_rect, 1)
+        for i, surf in enumerate(surfaces):
+            self.screen.blit(surf, (panel_rect.x + 10, panel_rect.y + 7 + i * 20))
+
     def draw_dialogs(self):
         """Draw dialog windows"""
         if self.app.show_hotkeys_dialog:
@@ -153,6 +150,11 @@ class UIManager:
             ("Ctrl+L", "Load map"),
             ("Ctrl+Z / Ctrl+Y", "Undo / Redo"),
             ("F11", "Toggle Fullscreen"),
+            ("F2", "Show controller link stats"),
+            ("F3 / Shift+F3", "Performance HUD / save it as CSV"),
+            ("F4", "Start / stop a profile capture"),
+            ("F6", "Open / close the second-monitor view"),
+            ("F7", "List unsaved changes"),
             ("ESC", "Close dialog or menu"),
             ("", ""),
             ("Map Interaction", ""),
@@ -166,14 +168,23 @@ class UIManager:
             ("Mouse Wheel", "Zoom in / out"),
             ("L", "Add/Edit cell label"),
             ("K", "Toggle lock on selected cells"),
+            ("E / Delete", "Fill / clear selected cells"),
+            ("F", "Flood fill the room under the cursor"),
+            ("B", "Edge tool: walls / doors / one-way / off"),
+            ("T", "Show labels on the map"),
+            ("Ctrl+C / X / V", "Copy / cut / paste selection"),
+            ("R / Shift+R", "Rotate selection right / left"),
+            ("M / Shift+M", "Mirror selection left-right / top-bottom"),
             ("0-9", "Select icon (0-9)"),
             ("", ""),
             ("Navigation", ""),
             ("W / S", "Move player forward / backward"),
             ("A / D", "Rotate player left / right"),
             ("H", "Warp player to entrance"),
+            ("G", "Show the player trail heat map"),
             ("Arrow Keys", "Pan the map view"),
             ("Page Up / Page Down", "Change floor"),
+            ("O", "Show the floors above / below as ghosts"),
             ("P", "Toggle Player Mode")
         ]
 
@@ -0,0 +1,138 @@
+"""
+Geometry of the menu bar, dropdown menus and icon panel, shared by drawing (ui.py)
+and click handling (event_handler.py).
+
+UILayout is rebuilt only when the window size or the icon panel visibility
+changes. It measures and renders the static text once, and keeps every widget's
+rect. hit() finds the widget under a point using the precomputed bands and a
+bisect over the widgets' left edges, so neither drawing nor clicks redo layout
+each frame. The icon panel, the number keys and the menus all read their contents
+from PANEL_ICONS and MENUS below.
+"""
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+import pygame
+
+import config
+from data_models import IconType
+
+# Icon panel buttons in order, with the number key that selects each one
+PANEL_ICONS = (
+    (IconType.NONE, "0"), (IconType.ENTRANCE, "1"), (IconType.CHEST, "2"),
+    (IconType.LOCKED_DOOR, "3"), (IconType.STAIRS_UP, "4"), (IconType.STAIRS_DOWN, "5"),
+    (IconType.BOSS, "6"), (IconType.NPC, "7"), (IconType.SWITCH, "8"), (IconType.TRAP, "9"),
+)
+
+# Menu id, title and (item text, action) pairs; EventHandler.run_menu_action performs the actions
+MENUS = (
+    ('file', "File", (("New Map", 'new_map'), ("Save (Ctrl+S)", 'save'), ("Save As...", 'save_as'),
+                      ("Load (Ctrl+L)", 'load'), ("Import Grid...", 'import_grid'), ("Export Grid...", 'export_grid'),
+                      ("Export PNG", 'export_png'), ("Quit", 'quit'))),
+    ('help', "Help", (("Hotkeys", 'hotkeys'), ("About", 'about'))),
+)
+
+ICON_BUTTON_SIZE = 40
+ICON_BUTTON_SPACING = 5
+DROPDOWN_WIDTH = 150
+DROPDOWN_ITEM_HEIGHT = 25
+
+class Widget:
+    """A clickable rect. `kind` is 'menu', 'item' or 'icon'; `value` is the menu id, action or IconType."""
+    __slots__ = ("kind", "rect", "value", "surface")
+
+    def __init__(self, kind: str, rect: pygame.Rect, value, surface: pygame.Surface = None):
+        self.kind = kind
+        self.rect = rect
+        self.value = value
+        self.surface = surface  # Pre-rendered text: the menu title, item text or key number
+
+class UILayout:
+    def __init__(self, app):
+        self.app = app
+        self.key = None  # (window width, window height, icon panel shown) the layout was built for
+        self.title_surface = None
+        self.title_rect = None
+        self.menu_bar = None
+        self.menu_buttons: List[Widget] = []
+        self.dropdowns = {}  # menu id -> (rect, [item widgets])
+        self.icon_panel = None
+        self.icon_buttons: List[Widget] = []
+        self.map_top = 0  # First screen row of the map area
+        self._menu_lefts: List[int] = []
+        self._icon_lefts: List[int] = []
+
+    def update(self):
+        """Rebuilds the layout if the window or the icon panel changed since it was built."""
+        key = (self.app.window_width, self.app.window_height, self.app.show_icon_panel)
+        if key != self.key:
+            self.key = key
+            self._build()
+
+    def _build(self):
+        width = self.app.window_width
+        self.title_surface = config.SMALL_FONT.render("Dungeon Crawltographer", True, config.TEXT_COLOR)
+        self.title_rect = self.title_surface.get_rect(center=(width / 2, config.TITLE_BAR_HEIGHT / 2))
+
+        bar_y = config.TITLE_BAR_HEIGHT
+        self.menu_bar = pygame.Rect(0, bar_y, width, config.MENU_BAR_HEIGHT)
+        self.menu_buttons = []
+        self.dropdowns = {}
+        menu_x = 10
+        for menu_id, title, items in MENUS:
+            text = config.SMALL_FONT.render(title, True, config.TEXT_COLOR)
+            self.menu_buttons.append(Widget('menu', pygame.Rect(menu_x, bar_y + 5, text.get_width() + 10, 20), menu_id, text))
+            top = bar_y + config.MENU_BAR_HEIGHT
+            rect = pygame.Rect(menu_x, top, DROPDOWN_WIDTH, len(items) * DROPDOWN_ITEM_HEIGHT + 10)
+            item_widgets = [Widget('item', pygame.Rect(menu_x + 5, top + 5 + i * DROPDOWN_ITEM_HEIGHT, DROPDOWN_WIDTH - 10, 20),
+                                   action, config.SMALL_FONT.render(item, True, config.TEXT_COLOR))
+                            for i, (item, action) in enumerate(items)]
+            self.dropdowns[menu_id] = (rect, item_widgets)
+            menu_x += text.get_width() + 20
+        self._menu_lefts = [widget.rect.left for widget in self.menu_buttons]
+
+        panel_y = bar_y + config.MENU_BAR_HEIGHT
+        self.icon_buttons = []
+        if self.app.show_icon_panel:
+            self.icon_panel = pygame.Rect(0, panel_y, width, config.ICON_PANEL_HEIGHT)
+            for i, (icon_type, key) in enumerate(PANEL_ICONS):
+                rect = pygame.Rect(10 + i * (ICON_BUTTON_SIZE + ICON_BUTTON_SPACING), panel_y + 5, ICON_BUTTON_SIZE, ICON_BUTTON_SIZE)
+                self.icon_buttons.append(Widget('icon', rect, icon_type, config.SMALL_FONT.render(key, True, config.TEXT_COLOR)))
+            self.map_top = self.icon_panel.bottom
+        else:
+            self.icon_panel = None
+            self.map_top = panel_y
+        self._icon_lefts = [widget.rect.left for widget in self.icon_buttons]
+
+    def band(self, pos: Tuple[int, int]) -> Optional[str]:
+        """Which UI area a point is in: 'title', 'menu', 'dropdown', 'icons', or None for the map."""
+        y = pos[1]
+        if y < config.TITLE_BAR_HEIGHT:
+            return 'title'
+        if y < self.menu_bar.bottom:
+            return 'menu'
+        if self.app.active_menu and self.dropdowns[self.app.active_menu][0].collidepoint(pos):
+            return 'dropdown'
+        if self.icon_panel and y <= self.icon_panel.bottom:
+            return 'icons'
+        return None
+
+    def hit(self, pos: Tuple[int, int]) -> Optional[Widget]:
+        """The widget under a screen position, or None."""
+        band = self.band(pos)
+        if band == 'dropdown':
+            rect, items = self.dropdowns[self.app.active_menu]
+            index = (pos[1] - rect.top - 5) // DROPDOWN_ITEM_HEIGHT
+            widget = items[index] if 0 <= index < len(items) else None
+        elif band == 'menu':
+            widget = _leftmost(self.menu_buttons, self._menu_lefts, pos[0])
+        elif band == 'icons':
+            widget = _leftmost(self.icon_buttons, self._icon_lefts, pos[0])
+        else:
+            return None
+        return widget if widget is not None and widget.rect.collidepoint(pos) else None
+
+def _leftmost(widgets: List[Widget], lefts: List[int], x: int) -> Optional[Widget]:
+    """The widget in a row that starts closest to the left of x."""
+    i = bisect_right(lefts, x) - 1
+    return widgets[i] if i >= 0 else None